@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Compare hierarchy_output before (string concatenation, each recursion returning a new string) and after (one
+fragment buffer, joined once) on large nested payloads.
+
+The "before" helpers.py is read from git: the parent of the commit that added emit_hierarchy, or --baseline.
+
+Usage: python benchmarks/hierarchy_output_benchmark.py [--baseline <git revision>] [--repeat 5]
+"""
+import argparse
+import copy
+import os
+import subprocess
+import sys
+import time
+import types
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HELPERS_PATH = 'slackbot_cloudgenix/helpers.py'
+
+# helpers.py is loaded without the package __init__, which needs slackbot settings.
+LOAD_PACKAGE = "import sys, types; package = types.ModuleType('slackbot_cloudgenix'); " \
+               "package.__path__ = [{0!r}]; sys.modules['slackbot_cloudgenix'] = package".format(
+                   os.path.join(REPO_DIR, 'slackbot_cloudgenix'))
+
+
+def git(*args):
+    return subprocess.check_output(('git', '-C', REPO_DIR) + args).decode('utf-8')
+
+
+def load_baseline_helpers(revision=None):
+    """
+    Load helpers.py as of a git revision.
+    :param revision: Optional - git revision (default: parent of the commit that added emit_hierarchy)
+    :return: module object
+    """
+    if revision is None:
+        commits = git('log', '--reverse', '--format=%H', '-S', 'def emit_hierarchy', '--', HELPERS_PATH).split()
+        revision = commits[0] + '~1'
+    source = git('show', '{0}:{1}'.format(revision, HELPERS_PATH))
+    module = types.ModuleType('slackbot_cloudgenix.baseline_helpers')
+    module.__package__ = 'slackbot_cloudgenix'
+    exec(compile(source, 'helpers.py@{0}'.format(revision), 'exec'), module.__dict__)
+    return module
+
+
+def make_wide(keys, items):
+    """
+    Site-like document: many keys, some long lists of small dicts.
+    """
+    document = dict(("setting_{0}".format(index), "value {0}".format(index)) for index in range(keys))
+    document["interfaces"] = [{"name": "port {0}".format(index), "admin_up": True, "mtu": 1500,
+                               "ipv4_config": {"type": "static", "address": "10.0.{0}.1/24".format(index % 250)}}
+                              for index in range(items)]
+    document["tags"] = ["tag{0}".format(index) for index in range(items)]
+    return document
+
+
+def make_deep(depth, width):
+    """
+    Nested document: each level has a few values and `width` nested children, `depth` levels deep.
+    """
+    if not depth:
+        return {"leaf_value": "x" * 40, "leaf_list": ["a", "b", "c"]}
+    document = {"level": str(depth), "description": "level {0} description".format(depth)}
+    for index in range(width):
+        document["child_{0}".format(index)] = make_deep(depth - 1, width)
+    return document
+
+
+def make_chain(depth, keys):
+    """
+    Deeply nested document: one child per level, `keys` values per level.
+    """
+    document = {"leaf_value": "x" * 40}
+    for level in range(depth):
+        parent = dict(("key_{0}".format(index), "value {0} {1}".format(level, index)) for index in range(keys))
+        parent["child"] = document
+        document = parent
+    return document
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baseline', help="git revision of the 'before' helpers.py")
+    parser.add_argument('--repeat', type=int, default=5, help="Renders per payload and variant")
+    args = parser.parse_args()
+
+    exec(LOAD_PACKAGE)
+    from slackbot_cloudgenix import helpers
+    baseline = load_baseline_helpers(args.baseline)
+
+    payloads = [
+        ("wide (2000 keys, 5000 list items)", make_wide(2000, 5000)),
+        ("deep (8 levels x 3 children)", make_deep(8, 3)),
+        ("deep (14 levels x 2 children)", make_deep(14, 2)),
+        ("chain (200 levels x 1 child, 100 keys each)", make_chain(200, 100)),
+    ]
+
+    for name, payload in payloads:
+        outputs = {}
+        print("{0}:".format(name))
+        for variant, function in (("before", baseline.hierarchy_output), ("after", helpers.hierarchy_output)):
+            # hierarchy_output pops ordered keys, give each run its own copy.
+            runs = [copy.deepcopy(payload) for _ in range(args.repeat)]
+            start = time.perf_counter()
+            for data in runs:
+                outputs[variant] = function(data, ['^_'], ['name'])
+            elapsed = time.perf_counter() - start
+            print("  {0:<8} {1:8.1f} ms/render".format(variant, elapsed * 1000 / args.repeat))
+        assert outputs["before"] == outputs["after"], "output differs"
+        print("  output identical ({0} bytes).".format(len(outputs["after"].encode('utf-8'))))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
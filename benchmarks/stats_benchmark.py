@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Compare the pandas DataFrame series summaries (previous metrics.py code) with slackbot_cloudgenix.stats.
+
+Reports import time and peak memory (each in a fresh interpreter), and per-summary latency over a day of
+5 minute datapoints. Needs pandas installed (pip install slackbot-cloudgenix[benchmark]).
+
+Usage: python benchmarks/stats_benchmark.py [--points 288] [--series 6] [--repeat 200]
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import timeit
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# stats.py is loaded without the package __init__, which needs slackbot settings.
+LOAD_PACKAGE = "import sys, types; package = types.ModuleType('slackbot_cloudgenix'); " \
+               "package.__path__ = [{0!r}]; sys.modules['slackbot_cloudgenix'] = package".format(
+                   os.path.join(REPO_DIR, 'slackbot_cloudgenix'))
+
+IMPORT_SNIPPETS = [
+    ("pandas", "import pandas"),
+    ("stats", LOAD_PACKAGE + "; import slackbot_cloudgenix.stats"),
+]
+
+MEASURE_TEMPLATE = """
+import resource, time
+start = time.perf_counter()
+{0}
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def measure_import(snippet):
+    """
+    Import in a fresh interpreter.
+    :param snippet: Python import statement(s)
+    :return: Tuple of (seconds, peak RSS in KB)
+    """
+    baseline = subprocess.check_output([sys.executable, '-c', MEASURE_TEMPLATE.format('pass')]).split()
+    output = subprocess.check_output([sys.executable, '-c', MEASURE_TEMPLATE.format(snippet)]).split()
+    return float(output[0]), int(output[1]) - int(baseline[1])
+
+
+def make_series(points, series_count, none_fraction=0.05):
+    """
+    Build random series value lists, with some missing datapoints.
+    :return: dict of label -> list of values
+    """
+    return dict(("series{0}".format(i), [None if random.random() < none_fraction else random.random() * 100
+                                         for _ in range(points)])
+                for i in range(series_count))
+
+
+def dataframe_summary(data_dict):
+    import pandas as pd
+    metric_dataframe = pd.DataFrame(data_dict)
+    return [(metric_dataframe[label].mean(),
+             metric_dataframe[label].std(),
+             metric_dataframe[label].quantile(0.95),
+             metric_dataframe[label].max(),
+             metric_dataframe[label].min()) for label in data_dict]
+
+
+def stats_summary(data_dict):
+    from slackbot_cloudgenix.stats import summarize
+    return [summarize(values)[1:] for values in data_dict.values()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=288, help="Datapoints per series (default 288, 24h/5min)")
+    parser.add_argument('--series', type=int, default=6, help="Series per summary (default 6, media)")
+    parser.add_argument('--repeat', type=int, default=200, help="Summaries to time")
+    args = parser.parse_args()
+
+    print("Import (fresh interpreter):")
+    for name, snippet in IMPORT_SNIPPETS:
+        seconds, rss_kb = measure_import(snippet)
+        print("  {0:<8} {1:8.1f} ms  {2:8.1f} MB peak RSS increase".format(name, seconds * 1000, rss_kb / 1024.0))
+
+    exec(LOAD_PACKAGE)
+
+    data_dict = make_series(args.points, args.series)
+
+    # same numbers, to display precision.
+    for old, new in zip(dataframe_summary(data_dict), stats_summary(data_dict)):
+        assert ["{:.6f}".format(value) for value in old] == ["{:.6f}".format(value) for value in new], (old, new)
+
+    print("Summary latency ({0} series x {1} points, {2} runs):".format(args.series, args.points, args.repeat))
+    for name, function in (("pandas", dataframe_summary), ("stats", stats_summary)):
+        seconds = timeit.timeit(lambda: function(data_dict), number=args.repeat)
+        print("  {0:<8} {1:8.3f} ms/summary".format(name, seconds * 1000 / args.repeat))
+
+
+if __name__ == '__main__':
+    main()
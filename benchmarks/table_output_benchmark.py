@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Compare table_output exclude list handling before (re.search of every pattern, on every key, of every row) and
+after (slackbot_cloudgenix.helpers.ExcludeFilter), rendering an "apps" table of synthetic app definitions.
+
+Usage: python benchmarks/table_output_benchmark.py [--apps 3000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# helpers.py is loaded without the package __init__, which needs slackbot settings.
+LOAD_PACKAGE = "import sys, types; package = types.ModuleType('slackbot_cloudgenix'); " \
+               "package.__path__ = [{0!r}]; sys.modules['slackbot_cloudgenix'] = package".format(
+                   os.path.join(REPO_DIR, 'slackbot_cloudgenix'))
+
+# same lists as apps.get_appdefs.
+APPS_EXCLUDELIST = ['id$', '^_', '^app_tag_id$', 'conn_idle_timeout', 'path_affinity', 'udp_rules', 'tcp_rules',
+                    'ingress_traffic_pct', 'transfer_type', 'domains', 'abbreviation', 'aggregate_flows',
+                    'order_number', 'overrides_allowed', 'system_app_overridden', 'is_deprecated',
+                    'use_parentapp_network_policy', 'app_unreachability_detection', 'network_scan_application',
+                    'ip_rules', 'session_timeout']
+APPS_ORDERLIST = ['display_name', 'app_type', 'category']
+
+
+def make_appdefs(count):
+    """
+    Build app definition dicts shaped like the appdefs API items.
+    :return: list of dicts
+    """
+    return [{
+        "id": "{0:020d}".format(index),
+        "_etag": 1,
+        "_schema": 2,
+        "_created_on_utc": 15000000000,
+        "_updated_on_utc": 15000000000,
+        "display_name": "app-{0}".format(index),
+        "abbreviation": "a{0}".format(index),
+        "app_type": random.choice(["custom", "transactional", "bulk", "rt-audio", "rt-video"]),
+        "category": random.choice(["Collaboration", "Database", "Streaming", "Web"]),
+        "description": "Application {0}".format(index),
+        "conn_idle_timeout": 3600,
+        "path_affinity": "strict",
+        "ingress_traffic_pct": 50,
+        "transfer_type": "transactional",
+        "domains": ["app{0}.example.com".format(index)],
+        "tcp_rules": [],
+        "udp_rules": [],
+        "ip_rules": None,
+        "aggregate_flows": False,
+        "order_number": index,
+        "overrides_allowed": True,
+        "system_app_overridden": False,
+        "is_deprecated": False,
+        "use_parentapp_network_policy": False,
+        "app_unreachability_detection": True,
+        "network_scan_application": False,
+        "session_timeout": 0,
+        "app_tag_id": None,
+        "parent_id": None,
+        "supported_engines": "ion",
+    } for index in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apps', type=int, default=3000, help="App definitions in the table (default 3000)")
+    parser.add_argument('--repeat', type=int, default=5, help="Tables to render per variant")
+    args = parser.parse_args()
+
+    exec(LOAD_PACKAGE)
+    from slackbot_cloudgenix import helpers
+
+    class LegacyExcludeFilter(helpers.ExcludeFilter):
+        """Previous behavior: every pattern searched for every key, no early exit, no caching."""
+        searches = 0
+
+        def excludes(self, key):
+            is_in_excludelist = False
+            for regexstr in self.patterns:
+                LegacyExcludeFilter.searches += 1
+                if re.search(regexstr, key):
+                    is_in_excludelist = True
+            return is_in_excludelist
+
+    appdefs = make_appdefs(args.apps)
+    variants = [
+        ("before", lambda: LegacyExcludeFilter(APPS_EXCLUDELIST)),
+        ("after", lambda: APPS_EXCLUDELIST),
+    ]
+
+    outputs = {}
+    print("apps table ({0} apps, {1} exclude patterns, {2} runs):".format(args.apps, len(APPS_EXCLUDELIST),
+                                                                        args.repeat))
+    for name, excludelist in variants:
+        LegacyExcludeFilter.searches = 0
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            outputs[name] = helpers.table_output(appdefs, excludelist(), APPS_ORDERLIST)
+        elapsed = time.perf_counter() - start
+        searches = " ({0} regex searches/table)".format(LegacyExcludeFilter.searches // args.repeat) \
+            if LegacyExcludeFilter.searches else ""
+        print("  {0:<8} {1:8.1f} ms/table{2}".format(name, elapsed * 1000 / args.repeat, searches))
+
+    assert outputs["before"] == outputs["after"], "table output differs"
+    print("  output identical.")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
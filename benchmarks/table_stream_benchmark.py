@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Compare the "apps" upload file built before (table_output string, encoded and written at once) and after
+(slackbot_cloudgenix.apps.write_appdefs, stream_table_output lines written as they are rendered): time, and peak
+memory on top of the app definitions themselves (tracemalloc).
+
+Usage: python benchmarks/table_stream_benchmark.py [--apps 10000 30000]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from table_output_benchmark import LOAD_PACKAGE, make_appdefs
+
+
+class FakeResponse(object):
+    def __init__(self, items):
+        self.cgx_status = True
+        self.cgx_content = {'items': items}
+
+
+class FakeGet(object):
+    def __init__(self, items):
+        self.items = items
+
+    def appdefs(self):
+        return FakeResponse(self.items)
+
+
+class FakeSdk(object):
+    def __init__(self, items):
+        self.get = FakeGet(items)
+
+
+def measure(function):
+    """
+    :return: (seconds, peak bytes allocated while running function)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apps', type=int, nargs='+', default=[10000, 30000], help="App definitions per table")
+    args = parser.parse_args()
+
+    exec(LOAD_PACKAGE)
+    from slackbot_cloudgenix import helpers, apps
+
+    fd, filename = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        for count in args.apps:
+            sdk = FakeSdk(make_appdefs(count))
+            outputs = {}
+
+            def before():
+                output = str(helpers.table_output(sdk.get.appdefs().cgx_content['items'], apps.APPDEFS_EXCLUDELIST,
+                                                  apps.APPDEFS_ORDERLIST))
+                with io.open(filename, 'wb') as output_file:
+                    output_file.write(output.encode('ascii'))
+
+            def after():
+                with io.open(filename, 'w', encoding='ascii') as output_file:
+                    apps.write_appdefs(sdk, output_file)
+
+            print("apps table ({0} apps):".format(count))
+            for name, function in (("before", before), ("after", after)):
+                elapsed, peak = measure(function)
+                with io.open(filename, 'rb') as output_file:
+                    outputs[name] = output_file.read()
+                print("  {0:<8} {1:8.1f} ms  {2:9.1f} KiB peak".format(name, elapsed * 1000, peak / 1024.0))
+
+            assert outputs["before"] == outputs["after"], "file content differs"
+            print("  file identical ({0} bytes).".format(len(outputs["after"])))
+    finally:
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
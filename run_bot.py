@@ -8,6 +8,7 @@ import logging
 import logging.config
 from slackbot import settings
 from slackbot.bot import Bot
+import slackbot_cloudgenix
 
 
 def main():
@@ -20,6 +21,9 @@ def main():
     logging.basicConfig(**kw)
     logging.getLogger('requests.packages.urllib3.connectionpool').setLevel(logging.WARNING)
     bot = Bot()
+    # login and cache load run in the background, so the bot connects to Slack right away.
+    # the Slack client is used to post topology alerts.
+    slackbot_cloudgenix.start(slack_client=bot._client)
     bot.run()
 
 
@@ -19,8 +19,11 @@ setup(name='slackbot-cloudgenix',
             'tabulate',
             'idna',
             'fuzzywuzzy',
-            'pandas'
+            'numpy'
       ],
+      extras_require={
+            'benchmark': ['pandas']
+      },
       packages=['slackbot_cloudgenix'],
       classifiers=[
             "Development Status :: 4 - Beta",
@@ -5,24 +5,36 @@ import json
 import re
 import inspect
 import random
+import threading
+import time
 
-from fuzzywuzzy import fuzz, process
 import cloudgenix
 import cloudgenix_idname
 
 from slackbot.bot import respond_to, listen_to, default_reply
 from slackbot.utils import download_file, create_tmp_file
 from .sites import showsites
-from .topology import render_topology, render_site_app_paths, render_site_media_paths
-from .apps import get_appdefs
-from .helpers import update_id2n_dicts_delta, update_id2n_dicts_slow
+from .topology import render_topology, render_site_app_paths, render_site_media_paths, render_site_bandwidth, \
+    BANDWIDTH_ERROR_MSG, APP_PATHS_ERROR_MSG, MEDIA_PATHS_ERROR_MSG, TOPOLOGY_CACHE_TTL, topology_cache, \
+    render_fleet_status, get_fleet_site_ids, FLEET_WORKERS, FLEET_DEADLINE
+from .metrics import METRICS_WORKERS, METRICS_DEADLINE, DEFAULT_METRICS_WINDOW, metrics_cache, media_call_totals, \
+    MetricsCallCounter, split_metrics_window, named_metrics_window
+from .apps import get_appdefs, write_appdefs, APPDEFS_ERROR_MSG
+from .helpers import update_id2n_dicts_delta, update_id2n_dicts_slow, fetch_id2n_maps, merge_id2n_maps, \
+    generate_n2id_maps, ID2N_DEFAULT_WORKERS, ID2N_SLOW_MAP_TYPES
+from .graph import TopologyGraphRefresher, TOPOLOGY_GRAPH_REFRESH_INTERVAL, TOPOLOGY_GRAPH_WORKERS, render_site_route
+from .watcher import TopologyWatcher, WatchScheduler, WATCH_POLL_INTERVAL
+from .cache import load_id2n_snapshot, save_id2n_snapshot, ID2NRefresher, NameIndex
 
 logger = logging.getLogger(__name__)
 
 # Globals
 CGX_API_ERROR_MSG = "Sorry, having problems communicating with CloudGenix. Please contact my support."
+CGX_WARMING_UP_MSG = "I'm still warming up (connecting to CloudGenix), please try again in a moment."
+WATCH_NO_CLIENT_MSG = "Sorry, I have no Slack connection to post link changes with. Please contact my support."
 GOOD_RESPONSE = 'white_check_mark'
 BAD_RESPONSE = 'x'
+WARMING_RESPONSE = 'hourglass_flowing_sand'
 
 # Check config file for AUTH_TOKEN, Controller, ssl_verify, add in cwd.
 sys.path.append(os.getcwd())
@@ -52,6 +64,89 @@ try:
 except ImportError:
     DEFAULT_REPLY = "Hello, my configuration is missing DEFAULT_REPLY! Please send Help! Beep, Boop!"
 
+try:
+    from slackbot_settings import CLOUDGENIX_ID2N_WORKERS
+except ImportError:
+    CLOUDGENIX_ID2N_WORKERS = ID2N_DEFAULT_WORKERS
+
+try:
+    from slackbot_settings import CLOUDGENIX_ID2N_SNAPSHOT_FILE
+except ImportError:
+    CLOUDGENIX_ID2N_SNAPSHOT_FILE = 'cloudgenix_id2n_snapshot.json'
+
+try:
+    from slackbot_settings import CLOUDGENIX_ID2N_SNAPSHOT_MAX_AGE
+except ImportError:
+    # seconds, 1 day.
+    CLOUDGENIX_ID2N_SNAPSHOT_MAX_AGE = 86400
+
+try:
+    from slackbot_settings import CLOUDGENIX_ID2N_REFRESH
+except ImportError:
+    CLOUDGENIX_ID2N_REFRESH = True
+
+try:
+    from slackbot_settings import CLOUDGENIX_ID2N_REFRESH_INTERVALS
+except ImportError:
+    CLOUDGENIX_ID2N_REFRESH_INTERVALS = None
+
+try:
+    from slackbot_settings import CLOUDGENIX_METRICS_WORKERS
+except ImportError:
+    CLOUDGENIX_METRICS_WORKERS = METRICS_WORKERS
+
+try:
+    from slackbot_settings import CLOUDGENIX_METRICS_DEADLINE
+except ImportError:
+    CLOUDGENIX_METRICS_DEADLINE = METRICS_DEADLINE
+
+try:
+    from slackbot_settings import CLOUDGENIX_MEDIA_COMBINED_QUERY
+except ImportError:
+    CLOUDGENIX_MEDIA_COMBINED_QUERY = True
+
+try:
+    from slackbot_settings import CLOUDGENIX_TOPOLOGY_CACHE_TTL
+except ImportError:
+    CLOUDGENIX_TOPOLOGY_CACHE_TTL = TOPOLOGY_CACHE_TTL
+
+topology_cache.ttl = CLOUDGENIX_TOPOLOGY_CACHE_TTL
+
+try:
+    from slackbot_settings import CLOUDGENIX_TOPOLOGY_GRAPH_REFRESH
+except ImportError:
+    CLOUDGENIX_TOPOLOGY_GRAPH_REFRESH = TOPOLOGY_GRAPH_REFRESH_INTERVAL
+
+try:
+    from slackbot_settings import CLOUDGENIX_TOPOLOGY_GRAPH_WORKERS
+except ImportError:
+    CLOUDGENIX_TOPOLOGY_GRAPH_WORKERS = TOPOLOGY_GRAPH_WORKERS
+
+try:
+    from slackbot_settings import CLOUDGENIX_FLEET_WORKERS
+except ImportError:
+    CLOUDGENIX_FLEET_WORKERS = FLEET_WORKERS
+
+try:
+    from slackbot_settings import CLOUDGENIX_FLEET_DEADLINE
+except ImportError:
+    CLOUDGENIX_FLEET_DEADLINE = FLEET_DEADLINE
+
+try:
+    from slackbot_settings import CLOUDGENIX_ALERTS_CHANNEL
+except ImportError:
+    CLOUDGENIX_ALERTS_CHANNEL = None
+
+try:
+    from slackbot_settings import CLOUDGENIX_WATCH_FILE
+except ImportError:
+    CLOUDGENIX_WATCH_FILE = 'cloudgenix_watch.json'
+
+try:
+    from slackbot_settings import CLOUDGENIX_WATCH_INTERVAL
+except ImportError:
+    CLOUDGENIX_WATCH_INTERVAL = WATCH_POLL_INTERVAL
+
 try:
     from slackbot_settings import DEBUG_LEVEL
 except ImportError:
@@ -70,31 +165,277 @@ else:
     clilogger = logging.getLogger()
     clilogger.setLevel(logging.WARNING)
 
-# ok. try to login.
-if CLOUDGENIX_SSL_VERIFY is None and CLOUDGENIX_CONTROLLER is None:
-    # Normal login
-    sdk = cloudgenix.API()
-elif CLOUDGENIX_SSL_VERIFY is None:
-    # custom controller
-    sdk = cloudgenix.API(controller=CLOUDGENIX_CONTROLLER)
-elif CLOUDGENIX_CONTROLLER is None:
-    # custom SSL Verification setting.
-    sdk = cloudgenix.API(ssl_verify=CLOUDGENIX_SSL_VERIFY)
-else:
-    # custom everything.
-    sdk = cloudgenix.API(controller=CLOUDGENIX_CONTROLLER, ssl_verify=CLOUDGENIX_SSL_VERIFY)
+# Runtime state, set up by start(). Nothing here talks to the network at import time.
+sdk = None
+idname = None
+global_id2n = {}
+global_n2id_maps = {}
+global_name_index = NameIndex()
+# temporary Name->ID index used until the cache has loaded, see get_name_index().
+fallback_name_index = None
+# when the last full ID->Name refresh started, the snapshot "created" time. Delta refreshes don't change it.
+id2n_full_refresh_time = None
+login_complete = threading.Event()
+id2n_ready = threading.Event()
+startup_lock = threading.Lock()
+startup_thread = None
+alerts_client = None
+
+
+def login():
+    """
+    Create the CloudGenix SDK object and login using the AUTH_TOKEN.
+    :return: cloudgenix.API object. If login fails, sdk.tenant_id will be None.
+    """
+    if CLOUDGENIX_SSL_VERIFY is None and CLOUDGENIX_CONTROLLER is None:
+        # Normal login
+        new_sdk = cloudgenix.API()
+    elif CLOUDGENIX_SSL_VERIFY is None:
+        # custom controller
+        new_sdk = cloudgenix.API(controller=CLOUDGENIX_CONTROLLER)
+    elif CLOUDGENIX_CONTROLLER is None:
+        # custom SSL Verification setting.
+        new_sdk = cloudgenix.API(ssl_verify=CLOUDGENIX_SSL_VERIFY)
+    else:
+        # custom everything.
+        new_sdk = cloudgenix.API(controller=CLOUDGENIX_CONTROLLER, ssl_verify=CLOUDGENIX_SSL_VERIFY)
 
-# actual api token use
-token_login = sdk.interactive.use_token(CLOUDGENIX_AUTH_TOKEN)
-# if login fails, sdk.tenant_id will be None.
+    # actual api token use
+    new_sdk.interactive.use_token(CLOUDGENIX_AUTH_TOKEN)
+    return new_sdk
 
 
-# start cloudgenix_idname instance to cache responses.
-idname = cloudgenix_idname.CloudGenixIDName(sdk)
+def publish_id2n(id2n_maps, n2id_maps=None, save=True):
+    """
+    Publish new per-type ID->Name maps and the Name->ID index, and save them as the warm-start snapshot. The
+    snapshot is dated from the last full refresh, as delta refreshes only update some types, and isn't saved
+    until one has completed.
+    :param id2n_maps: OrderedDict of map type -> ID->Name dict
+    :param n2id_maps: Optional - Dict of map type -> Name->ID dict. Built from the idname object caches if
+                      not passed, the published ones are kept if those aren't loaded.
+    :param save: Boolean - save the snapshot (False for maps loaded from it)
+    :return: No return
+    """
+    global global_id2n, global_n2id_maps, global_name_index
+
+    if n2id_maps is None:
+        n2id_maps = generate_n2id_maps(idname)
+
+    # build off to the side, then a single reference swap. Handlers never see a partial dict.
+    global_id2n = merge_id2n_maps(id2n_maps)
+    if n2id_maps is not None:
+        global_n2id_maps = n2id_maps
+        global_name_index = NameIndex(n2id_maps)
+
+    if save and id2n_full_refresh_time is not None and CLOUDGENIX_ID2N_SNAPSHOT_FILE and sdk.tenant_id:
+        save_id2n_snapshot(CLOUDGENIX_ID2N_SNAPSHOT_FILE, sdk.tenant_id, id2n_maps, global_n2id_maps,
+                           created=id2n_full_refresh_time)
+
+
+def refresh_id2n_full():
+    """
+    Rebuild and publish the full ID->Name cache.
+    :return: OrderedDict of map type -> ID->Name dict
+    """
+    global id2n_full_refresh_time
 
-logger.warning("Loading CloudGenix ID->Name cache at startup, this may take several minutes..")
-global_id2n = update_id2n_dicts_slow(idname)
-logger.warning("ID->Name cache successfully updated.")
+    start = time.time()
+    id2n_maps = fetch_id2n_maps(idname, ID2N_SLOW_MAP_TYPES, workers=CLOUDGENIX_ID2N_WORKERS)
+    id2n_full_refresh_time = start
+    publish_id2n(id2n_maps)
+    return id2n_maps
+
+
+def start_id2n_refresher(id2n_maps):
+    """
+    Start the scheduled delta refresh of the ID->Name cache, if enabled.
+    :param id2n_maps: OrderedDict of map type -> ID->Name dict, currently published.
+    :return: ID2NRefresher object or None
+    """
+    if not CLOUDGENIX_ID2N_REFRESH:
+        return None
+    refresher = ID2NRefresher(idname, id2n_maps, publish_id2n, intervals=CLOUDGENIX_ID2N_REFRESH_INTERVALS,
+                              workers=CLOUDGENIX_ID2N_WORKERS)
+    refresher.start()
+    return refresher
+
+
+def post_alert(channel, text, attachments):
+    """
+    Post a message to a Slack channel, for the topology watcher.
+    :param channel: Channel name (with or without #) or ID
+    :param text: Message text
+    :param attachments: list of slack attachments
+    :return: No return
+    """
+    if alerts_client is None:
+        logger.warning("Can't post alerts to {0}, no Slack client. Pass slack_client to start().".format(channel))
+        return
+    channel_id = alerts_client.find_channel_by_name(channel.lstrip('#')) or channel
+    alerts_client.send_message(channel_id, text, attachments=attachments)
+
+
+topology_watcher = TopologyWatcher(post_alert, id2n=lambda: global_id2n)
+if CLOUDGENIX_ALERTS_CHANNEL:
+    topology_watcher.subscribe(CLOUDGENIX_ALERTS_CHANNEL)
+
+# per-site "watch <site>" subscriptions, polled by their own thread (started with the CloudGenix side).
+watch_scheduler = WatchScheduler(lambda: sdk, post_alert, id2n=lambda: global_id2n, filename=CLOUDGENIX_WATCH_FILE,
+                                 interval=CLOUDGENIX_WATCH_INTERVAL)
+
+
+def publish_topology_graph(graph):
+    """
+    Publish a new tenant topology graph. Used for fleet status until two refresh intervals old (single sites only
+    within the topology cache TTL), and diffed against the previous graph for alerts.
+    :param graph: TopologyGraph object
+    :return: No return
+    """
+    topology_cache.publish_graph(graph, max_age=2 * CLOUDGENIX_TOPOLOGY_GRAPH_REFRESH)
+    topology_watcher.update(graph)
+
+
+def start_topology_graph_refresher():
+    """
+    Start the periodic full refresh of the tenant topology graph, if enabled.
+    :return: TopologyGraphRefresher object or None
+    """
+    if not CLOUDGENIX_TOPOLOGY_GRAPH_REFRESH:
+        if CLOUDGENIX_ALERTS_CHANNEL:
+            logger.warning("CLOUDGENIX_ALERTS_CHANNEL needs CLOUDGENIX_TOPOLOGY_GRAPH_REFRESH, no alerts will be sent.")
+        return None
+    refresher = TopologyGraphRefresher(sdk, publish_topology_graph, interval=CLOUDGENIX_TOPOLOGY_GRAPH_REFRESH,
+                                       workers=CLOUDGENIX_TOPOLOGY_GRAPH_WORKERS)
+    refresher.start()
+    return refresher
+
+
+def load_id2n():
+    """
+    Load the ID->Name cache. Uses the snapshot if usable (then refreshes fully), otherwise loads from the API.
+    id2n_ready is set as soon as a complete cache is published.
+    :return: No return
+    """
+    snapshot_id2n_maps, snapshot_n2id_maps = None, None
+    if CLOUDGENIX_ID2N_SNAPSHOT_FILE:
+        snapshot_id2n_maps, snapshot_n2id_maps = load_id2n_snapshot(CLOUDGENIX_ID2N_SNAPSHOT_FILE, sdk.tenant_id,
+                                                                    max_age=CLOUDGENIX_ID2N_SNAPSHOT_MAX_AGE)
+
+    if snapshot_id2n_maps is not None:
+        # warm start, usable now. Then refresh, the snapshot is rewritten once that succeeds.
+        publish_id2n(snapshot_id2n_maps, snapshot_n2id_maps, save=False)
+        id2n_ready.set()
+        logger.warning("ID->Name cache loaded from snapshot, refreshing..")
+        try:
+            id2n_maps = refresh_id2n_full()
+            logger.warning("ID->Name cache refresh complete.")
+        except Exception as e:
+            logger.warning("ID->Name cache refresh failed, keeping snapshot: {0}".format(e))
+            id2n_maps = snapshot_id2n_maps
+    else:
+        logger.warning("Loading CloudGenix ID->Name cache at startup, this may take several minutes..")
+        id2n_maps = refresh_id2n_full()
+        id2n_ready.set()
+        logger.warning("ID->Name cache successfully updated.")
+
+    start_id2n_refresher(id2n_maps)
+
+
+def startup():
+    """
+    Thread target for start(). Login, start the topology graph refresh and watch polls, then load the ID->Name
+    cache.
+    :return: No return
+    """
+    global sdk, idname
+
+    try:
+        new_sdk = login()
+        # start cloudgenix_idname instance to cache responses.
+        idname = cloudgenix_idname.CloudGenixIDName(new_sdk)
+        sdk = new_sdk
+    except Exception as e:
+        logger.error("CloudGenix login failed: {0}".format(e))
+    finally:
+        login_complete.set()
+
+    # if login fails, sdk.tenant_id will be None.
+    if sdk is None or not sdk.tenant_id:
+        logger.error("CloudGenix login failed, check CLOUDGENIX_AUTH_TOKEN.")
+        return
+
+    start_topology_graph_refresher()
+    watch_scheduler.start()
+    load_id2n()
+
+
+def start(blocking=False, slack_client=None):
+    """
+    Start the CloudGenix side of the bot (login, ID->Name cache) in a background thread. Safe to call more than
+    once, only the first call starts anything.
+    :param blocking: Bool, if True wait for login and the initial cache load.
+    :param slack_client: Optional - slackbot SlackClient (Bot()._client), used to post topology alerts.
+    :return: startup Thread object
+    """
+    global startup_thread, alerts_client
+
+    if slack_client is not None:
+        alerts_client = slack_client
+
+    with startup_lock:
+        if startup_thread is None:
+            startup_thread = threading.Thread(target=startup, name='cloudgenix_startup', daemon=True)
+            startup_thread.start()
+
+    if blocking:
+        startup_thread.join()
+    return startup_thread
+
+
+def get_name_index():
+    """
+    Get the current Name->ID index. Until the cache has loaded, builds a temporary one from the API, rebuilt only
+    when the API maps change.
+    :return: NameIndex object
+    """
+    global fallback_name_index
+
+    name_index = global_name_index
+    if not name_index:
+        sites_n2id = idname.generate_sites_map(key_val='name', value_val='id')
+        appdefs_n2id = idname.generate_appdefs_map(key_val='display_name', value_val='id')
+        name_index = fallback_name_index
+        if name_index is None or name_index.sites_n2id != sites_n2id or name_index.appdefs_n2id != appdefs_n2id:
+            name_index = fallback_name_index = NameIndex({'sites': sites_n2id, 'appdefs': appdefs_n2id})
+    return name_index
+
+
+def cgx_ready(message):
+    """
+    Check CloudGenix is usable for a command, reacting/replying with the reason if not. Starts the CloudGenix
+    side if nothing has yet, with the message's Slack client for alerts if start() wasn't given one. If the
+    ID->Name cache isn't warm, the command continues with a partial cache.
+    :param message: SlackMessage object
+    :return: Bool, True if the command can continue.
+    """
+    global alerts_client
+
+    if alerts_client is None:
+        # not passed to start(), post alerts through the client of the first command instead.
+        alerts_client = getattr(message, '_client', None)
+    start()
+    if not login_complete.is_set():
+        message.react(WARMING_RESPONSE)
+        message.reply(CGX_WARMING_UP_MSG)
+        return False
+    if sdk is None or not sdk.tenant_id:
+        message.react(BAD_RESPONSE)
+        message.reply(CGX_API_ERROR_MSG)
+        return False
+    if not id2n_ready.is_set():
+        # names may show as raw IDs until the cache is warm.
+        message.react(WARMING_RESPONSE)
+    return True
 
 
 def log_message_env(message):
@@ -154,10 +495,16 @@ def help(message):
                    '"Show sites"\n' \
                    '"Show site <site name>"\n' \
                    '"Show paths of <site name>"\n' \
+                   '"Status of all" / "Status of tag:<site tag>"\n' \
+                   '"Bandwidth of <site name> [for 1h|24h|7d|30d]"\n' \
                    '"Show applications"\n' \
                    '"Show application <app name>"\n' \
-                   '"Show application <app name> at <site name>"\n' \
-                   '"Show media <app name> at <site name>"\n'
+                   '"Show application <app name> at <site name> [for 1h|24h|7d|30d]"\n' \
+                   '"Show media <app name> at <site name> [for 1h|24h|7d|30d]"\n' \
+                   '"Refresh <site name>"\n' \
+                   '"Tunnels down"\n' \
+                   '"Path from <site name> to <site name>"\n' \
+                   '"Watch <site name>" / "Unwatch <site name>" / "Watch list"\n'
     message.reply(message_text, in_thread=True)
 
 
@@ -169,13 +516,13 @@ def help(message):
 @respond_to('show site (.*)', re.IGNORECASE)
 def show_site(message, site_string):
     log_message_env(message)
-    if sdk.tenant_id:
+    if cgx_ready(message):
         # get list of sites.
-        sites_n2id = idname.generate_sites_map(key_val='name', value_val='id')
-        name_list = sites_n2id.keys()
+        name_index = get_name_index()
+        sites_n2id = name_index.sites_n2id
 
         # fuzzy match
-        choice, percent = process.extractOne(site_string, name_list)
+        choice, percent = name_index.site_matcher.extract_one(site_string)
         # perfect match, just get..
         if percent == 100:
             message.react(GOOD_RESPONSE)
@@ -190,9 +537,6 @@ def show_site(message, site_string):
             message.react(BAD_RESPONSE)
             message.reply("I couldn't find a site that matched what you asked for ({0}). Try asking me about "
                           "\"What sites are there?\".".format(site_string))
-    else:
-        message.react(BAD_RESPONSE)
-        message.reply(CGX_API_ERROR_MSG)
 
 
 @respond_to('state (for|of) (.*)', re.IGNORECASE)
@@ -201,13 +545,19 @@ def show_site(message, site_string):
 @respond_to('links (for|of) (.*)', re.IGNORECASE)
 def stats_site(message, discard_middle, site_string):
     log_message_env(message)
-    if sdk.tenant_id:
+    if cgx_ready(message):
+        # many sites, "all" or "tag:<tag>".
+        scope = site_string.strip()
+        if scope.lower() == 'all' or scope.lower().startswith('tag:'):
+            stats_fleet(message, scope)
+            return
+
         # get list of sites.
-        sites_n2id = idname.generate_sites_map(key_val='name', value_val='id')
-        name_list = sites_n2id.keys()
+        name_index = get_name_index()
+        sites_n2id = name_index.sites_n2id
         site_id = None
         # fuzzy match
-        choice, percent = process.extractOne(site_string, name_list)
+        choice, percent = name_index.site_matcher.extract_one(site_string)
         # perfect match, just get..
         if percent == 100:
             message.react(GOOD_RESPONSE)
@@ -225,7 +575,6 @@ def stats_site(message, discard_middle, site_string):
                           "\"What sites are there?\".".format(site_string))
             return
 
-        # message.send("```" + str(get_bw_metrics(site_id, None, cli_vars=cli_vars)) + "```")
         # attachments = [
         #     {
         #         'pretext': "VPN",
@@ -251,17 +600,226 @@ def stats_site(message, discard_middle, site_string):
         #     },
         # ]
         message.send_webapi('', json.dumps(render_topology(site_id, sdk, global_id2n)))
-        # message.send_webapi('', get_bw_metrics(site_id, None, cli_vars=cli_vars))
 
-    else:
+
+def stats_fleet(message, scope):
+    """
+    Reply with link health for all sites, or all sites with a tag.
+    :param message: SlackMessage object
+    :param scope: "all" or "tag:<tag>"
+    :return: No return
+    """
+    tag = scope[len('tag:'):].strip() if scope.lower().startswith('tag:') else None
+    site_ids = get_fleet_site_ids(sdk, tag=tag)
+    if site_ids is None:
         message.react(BAD_RESPONSE)
         message.reply(CGX_API_ERROR_MSG)
+        return
+    if not site_ids:
+        message.react(BAD_RESPONSE)
+        message.reply("I couldn't find any sites{0}.".format(" tagged *{0}*".format(tag) if tag else ""))
+        return
+
+    message.react(GOOD_RESPONSE)
+    message.reply("*Link health for {0}:*".format("sites tagged {0}".format(tag) if tag else "all sites"))
+    message.send_webapi('', json.dumps(render_fleet_status(site_ids, sdk, global_id2n,
+                                                           workers=CLOUDGENIX_FLEET_WORKERS,
+                                                           deadline=CLOUDGENIX_FLEET_DEADLINE)))
+
+
+@respond_to('bandwidth (for|of|at) (.*)', re.IGNORECASE)
+def bandwidth_site(message, discard_middle, site_string):
+    log_message_env(message)
+    if cgx_ready(message):
+        # optional trailing window, eg "for 7d".
+        site_string, window_name = split_metrics_window(site_string)
+        window_name = window_name or DEFAULT_METRICS_WINDOW
+
+        # get list of sites.
+        name_index = get_name_index()
+        sites_n2id = name_index.sites_n2id
+
+        # fuzzy match
+        choice, percent = name_index.site_matcher.extract_one(site_string)
+        # perfect match, just get..
+        if percent == 100:
+            message.react(GOOD_RESPONSE)
+        # good guess match..
+        elif percent > 50:
+            message.react(GOOD_RESPONSE)
+            message.reply("I think you meant *{0}*, looking that up..".format(choice))
+        # not even close..
+        else:
+            message.react(BAD_RESPONSE)
+            message.reply("I couldn't find a site that matched what you asked for ({0}). Try asking me about "
+                          "\"What sites are there?\".".format(site_string))
+            return
+
+        attachments = render_site_bandwidth(sites_n2id[choice], sdk, global_id2n, workers=CLOUDGENIX_METRICS_WORKERS,
+                                            deadline=CLOUDGENIX_METRICS_DEADLINE,
+                                            window=named_metrics_window(window_name))
+
+        # check if successful, add title
+        if attachments[0].get('pretext') != BANDWIDTH_ERROR_MSG:
+            message.reply("*Bandwidth for {0} (last {1}), most congested first:*".format(choice, window_name))
+
+        # now, send it
+        message.send_webapi('', json.dumps(attachments))
+
+
+@respond_to('refresh (.*)', re.IGNORECASE)
+def refresh_site(message, site_string):
+    log_message_env(message)
+    if cgx_ready(message):
+        # get list of sites.
+        name_index = get_name_index()
+        sites_n2id = name_index.sites_n2id
+
+        # fuzzy match
+        choice, percent = name_index.site_matcher.extract_one(site_string)
+        if percent <= 50:
+            message.react(BAD_RESPONSE)
+            message.reply("I couldn't find a site that matched what you asked for ({0}). Try asking me about "
+                          "\"What sites are there?\".".format(site_string))
+            return
+
+        message.react(GOOD_RESPONSE)
+        topology_cache.invalidate(sites_n2id[choice])
+        message.reply("Ok, I'll get a fresh topology for *{0}* next time.".format(choice), in_thread=True)
+
+
+@respond_to('path from (.*) to (.*)', re.IGNORECASE)
+def path_site_to_site(message, source_string, target_string):
+    log_message_env(message)
+    if cgx_ready(message):
+        graph = topology_cache.graph
+        if graph is None:
+            message.react(WARMING_RESPONSE)
+            message.reply("I haven't loaded the tenant topology yet, please try again in a moment.")
+            return
+
+        # get list of sites.
+        name_index = get_name_index()
+        sites_n2id = name_index.sites_n2id
+
+        choices = []
+        for site_string in (source_string, target_string):
+            # fuzzy match
+            choice, percent = name_index.site_matcher.extract_one(site_string)
+            if percent <= 50:
+                message.react(BAD_RESPONSE)
+                message.reply("I couldn't find a site that matched what you asked for ({0}). Try asking me about "
+                              "\"What sites are there?\".".format(site_string))
+                return
+            elif percent < 100:
+                message.reply("I think you meant *{0}*, looking that up..".format(choice))
+            choices.append(choice)
+
+        message.react(GOOD_RESPONSE)
+        message.reply("*Paths from {0} to {1} (as of {2:.0f}s ago):*".format(choices[0], choices[1], graph.age()))
+        message.send_webapi('', json.dumps(render_site_route(graph, sites_n2id[choices[0]], sites_n2id[choices[1]],
+                                                             global_id2n)))
+
+
+@respond_to('^watch (.*)', re.IGNORECASE)
+def watch_site(message, site_string):
+    log_message_env(message)
+    if cgx_ready(message):
+        channel = message.body.get('channel')
+
+        if site_string.strip().lower() == 'list':
+            message.react(GOOD_RESPONSE)
+            site_names = sorted(global_id2n.get(site_id, site_id) for site_id in watch_scheduler.channel_sites(channel))
+            if site_names:
+                message.reply("Watching: {0}.".format(", ".join(site_names)), in_thread=True)
+            else:
+                message.reply("Not watching any sites here.", in_thread=True)
+            return
+
+        # get list of sites.
+        name_index = get_name_index()
+        sites_n2id = name_index.sites_n2id
+
+        # fuzzy match
+        choice, percent = name_index.site_matcher.extract_one(site_string)
+        if percent <= 50:
+            message.react(BAD_RESPONSE)
+            message.reply("I couldn't find a site that matched what you asked for ({0}). Try asking me about "
+                          "\"What sites are there?\".".format(site_string))
+            return
+
+        if alerts_client is None:
+            message.react(BAD_RESPONSE)
+            message.reply(WATCH_NO_CLIENT_MSG)
+            return
+
+        message.react(GOOD_RESPONSE)
+        if watch_scheduler.watch(channel, sites_n2id[choice]):
+            message.reply("Ok, I'll post link changes at *{0}* here.".format(choice), in_thread=True)
+        else:
+            message.reply("Already watching *{0}* here.".format(choice), in_thread=True)
+
+
+@respond_to('^unwatch (.*)', re.IGNORECASE)
+def unwatch_site(message, site_string):
+    log_message_env(message)
+    if cgx_ready(message):
+        channel = message.body.get('channel')
+
+        # get list of sites.
+        name_index = get_name_index()
+        sites_n2id = name_index.sites_n2id
+
+        # fuzzy match
+        choice, percent = name_index.site_matcher.extract_one(site_string)
+        if percent <= 50:
+            message.react(BAD_RESPONSE)
+            message.reply("I couldn't find a site that matched what you asked for ({0}). Try asking me about "
+                          "\"What sites are there?\".".format(site_string))
+            return
+
+        message.react(GOOD_RESPONSE)
+        if watch_scheduler.unwatch(channel, sites_n2id[choice]):
+            message.reply("Ok, stopped watching *{0}* here.".format(choice), in_thread=True)
+        else:
+            message.reply("I wasn't watching *{0}* here.".format(choice), in_thread=True)
+
+
+@respond_to('tunnels? down', re.IGNORECASE)
+def tunnels_down(message):
+    log_message_env(message)
+    if cgx_ready(message):
+        graph = topology_cache.graph
+        if graph is None:
+            message.react(WARMING_RESPONSE)
+            message.reply("I haven't loaded the tenant topology yet, please try again in a moment.")
+            return
+
+        message.react(GOOD_RESPONSE)
+        down_sites = graph.sites_with_links_down()
+        if not down_sites:
+            message.reply("No tunnels are down at any of {0} sites (as of {1:.0f}s ago)."
+                          "".format(len(graph.site_ids), graph.age()), in_thread=True)
+            return
+
+        lines = []
+        for site_id, links in sorted(down_sites, key=lambda item: global_id2n.get(item[0], item[0])):
+            peers = []
+            for link in links:
+                peer_id = link.get('target_node_id') if link.get('source_node_id') == site_id \
+                    else link.get('source_node_id')
+                peers.append(global_id2n.get(peer_id, peer_id))
+            lines.append("*{0}*: {1} down ({2})".format(global_id2n.get(site_id, site_id), len(links),
+                                                        ", ".join(peers)))
+        message.reply("Sites with tunnels down ({0} of {1}, as of {2:.0f}s ago):\n{3}"
+                      "".format(len(down_sites), len(graph.site_ids), graph.age(), "\n".join(lines)),
+                      in_thread=True)
 
 
 @respond_to('sites', re.IGNORECASE)
 def sites(message):
     log_message_env(message)
-    if sdk.tenant_id:
+    if cgx_ready(message):
         output_message = showsites(None, sdk, global_id2n)
         message.react(GOOD_RESPONSE)
         message.reply("```" + str(output_message) + "```")
@@ -275,26 +833,24 @@ def sites(message):
         # ]
         # message.send_webapi('', json.dumps(attachments))
         # # message.send("```" + str(showsites(cli_vars=cli_vars)) + "```")
-    else:
-        message.react(BAD_RESPONSE)
-        message.reply(CGX_API_ERROR_MSG)
 
 
 @respond_to('show media (.*) at (.*)', re.IGNORECASE)
 def showmedia_site(message, app_string, site_string):
     log_message_env(message)
-    if sdk.tenant_id:
-        # get list of apps.
-        appdef_n2id = idname.generate_appdefs_map(key_val='display_name', value_val='id')
-        app_list = appdef_n2id.keys()
+    if cgx_ready(message):
+        # optional trailing window, eg "for 7d".
+        site_string, window_name = split_metrics_window(site_string)
+        window_name = window_name or DEFAULT_METRICS_WINDOW
 
-        # get list of sites.
-        sites_n2id = idname.generate_sites_map(key_val='name', value_val='id')
-        site_list = sites_n2id.keys()
+        # get list of apps and sites.
+        name_index = get_name_index()
+        appdef_n2id = name_index.appdefs_n2id
+        sites_n2id = name_index.sites_n2id
 
         # fuzzy match
-        app_choice, app_percent = process.extractOne(app_string, app_list)
-        site_choice, site_percent = process.extractOne(site_string, site_list)
+        app_choice, app_percent = name_index.app_matcher.extract_one(app_string)
+        site_choice, site_percent = name_index.site_matcher.extract_one(site_string)
         # perfect match, just get..
         if app_percent == 100 and site_percent == 100:
             message.react(GOOD_RESPONSE)
@@ -320,37 +876,40 @@ def showmedia_site(message, app_string, site_string):
             return
 
         # Figure out the links/do all the work now.
-        attachments = render_site_media_paths(app_id, site_id, sdk, global_id2n)
+        call_counter = MetricsCallCounter()
+        attachments = render_site_media_paths(app_id, site_id, sdk, global_id2n, workers=CLOUDGENIX_METRICS_WORKERS,
+                                              deadline=CLOUDGENIX_METRICS_DEADLINE,
+                                              combined=CLOUDGENIX_MEDIA_COMBINED_QUERY, counter=call_counter,
+                                              window=named_metrics_window(window_name))
+        media_call_totals.add(calls=call_counter.calls, baseline=call_counter.baseline)
+        logger.info("show media {0} at {1}: {2} metrics API calls, {3} saved.".format(
+            app_choice, site_choice, call_counter.calls, call_counter.saved))
 
         # check if successful, add title
-        if attachments[0].get('pretext') != "Sorry, couldn't query the media application info for this site at the " \
-                                            "moment. Please try later.":
-            message.reply("*Path status for {0} at {1}:*".format(app_choice, site_choice))
+        if attachments[0].get('pretext') != MEDIA_PATHS_ERROR_MSG:
+            message.reply("*Path status for {0} at {1} (last {2}):*".format(app_choice, site_choice, window_name))
 
         # now, send it
         message.send_webapi('', json.dumps(attachments))
 
-    else:
-        message.react(BAD_RESPONSE)
-        message.send(CGX_API_ERROR_MSG)
-
 
 @respond_to('show app (.*) at (.*)', re.IGNORECASE)
 @respond_to('show application (.*) at (.*)', re.IGNORECASE)
 def showapp_site(message, app_string, site_string):
     log_message_env(message)
-    if sdk.tenant_id:
-        # get list of apps.
-        appdef_n2id = idname.generate_appdefs_map(key_val='display_name', value_val='id')
-        app_list = appdef_n2id.keys()
+    if cgx_ready(message):
+        # optional trailing window, eg "for 7d".
+        site_string, window_name = split_metrics_window(site_string)
+        window_name = window_name or DEFAULT_METRICS_WINDOW
 
-        # get list of sites.
-        sites_n2id = idname.generate_sites_map(key_val='name', value_val='id')
-        site_list = sites_n2id.keys()
+        # get list of apps and sites.
+        name_index = get_name_index()
+        appdef_n2id = name_index.appdefs_n2id
+        sites_n2id = name_index.sites_n2id
 
         # fuzzy match
-        app_choice, app_percent = process.extractOne(app_string, app_list)
-        site_choice, site_percent = process.extractOne(site_string, site_list)
+        app_choice, app_percent = name_index.app_matcher.extract_one(app_string)
+        site_choice, site_percent = name_index.site_matcher.extract_one(site_string)
         # perfect match, just get..
         if app_percent == 100 and site_percent == 100:
             message.react(GOOD_RESPONSE)
@@ -376,20 +935,17 @@ def showapp_site(message, app_string, site_string):
             return
 
         # Figure out the links/do all the work now.
-        attachments = render_site_app_paths(app_id, site_id, sdk, global_id2n)
+        attachments = render_site_app_paths(app_id, site_id, sdk, global_id2n, workers=CLOUDGENIX_METRICS_WORKERS,
+                                            deadline=CLOUDGENIX_METRICS_DEADLINE,
+                                            window=named_metrics_window(window_name))
 
         # check if successful, add title
-        if attachments[0].get('pretext') != "Sorry, couldn't query the application info for this site at the moment. " \
-                                            "Please try later.":
-            message.reply("*Path status for {0} at {1}:*".format(app_choice, site_choice))
+        if attachments[0].get('pretext') != APP_PATHS_ERROR_MSG:
+            message.reply("*Path status for {0} at {1} (last {2}):*".format(app_choice, site_choice, window_name))
 
         # now, send it
         message.send_webapi('', json.dumps(attachments))
 
-    else:
-        message.react(BAD_RESPONSE)
-        message.send(CGX_API_ERROR_MSG)
-
 
 @respond_to('show app (.*)', re.IGNORECASE)
 @respond_to('show application (.*)', re.IGNORECASE)
@@ -400,12 +956,12 @@ def showapp(message, app_string):
     if app_string.lower().find(checkstr) > -1:
         # return silently if " at " in app string.
         return
-    if sdk.tenant_id:
+    if cgx_ready(message):
         # get list of apps.
-        appdef_n2id = idname.generate_appdefs_map(key_val='display_name', value_val='id')
-        app_list = appdef_n2id.keys()
+        name_index = get_name_index()
+        appdef_n2id = name_index.appdefs_n2id
         # fuzzy match
-        choice, percent = process.extractOne(app_string, app_list)
+        choice, percent = name_index.app_matcher.extract_one(app_string)
         # perfect match, just get..
         if percent == 100:
             message.react(GOOD_RESPONSE)
@@ -420,22 +976,23 @@ def showapp(message, app_string):
             message.react(BAD_RESPONSE)
             message.reply("I couldn't find an application that matched what you asked for ({0}). "
                           "Try asking me about \"What apps are there?\".".format(app_string))
-    else:
-        message.react(BAD_RESPONSE)
-        message.send(CGX_API_ERROR_MSG)
 
 
 @respond_to('apps', re.IGNORECASE)
 @respond_to('applications', re.IGNORECASE)
 def apps(message):
     log_message_env(message)
-    if sdk.tenant_id:
+    if cgx_ready(message):
         message.react(GOOD_RESPONSE)
-        output = str(get_appdefs(sdk=sdk, idname=idname))
 
-        # Too large for slack, attach as text message
-        with create_tmp_file(content=output.encode('ascii')) as tmpf:
-            message.channel.upload_file('Application Definitions.txt', tmpf, '')
+        # Too large for slack, attach as text message. Written a line at a time, the table is never built in memory.
+        with create_tmp_file() as tmpf:
+            with open(tmpf, 'w', encoding='ascii') as output_file:
+                written = write_appdefs(sdk, output_file)
+            if written:
+                message.channel.upload_file('Application Definitions.txt', tmpf, '')
+            else:
+                message.reply(APPDEFS_ERROR_MSG)
 
             # output_list = output.split('\n')
         # attachments = []
@@ -448,21 +1005,34 @@ def apps(message):
         #             })
         # message.send_webapi('', json.dumps(attachments))
         # message.send("```" + str(showsites(sdk_vars=sdk_vars)) + "```")
-    else:
-        message.react(BAD_RESPONSE)
-        message.send(CGX_API_ERROR_MSG)
 
 
 @respond_to('what tenant', re.IGNORECASE)
 @respond_to('what customer', re.IGNORECASE)
 def customer(message):
     log_message_env(message)
-    if sdk.tenant_id:
+    if cgx_ready(message):
         message.react(GOOD_RESPONSE)
         message.send("I'm currently examining the \"" + str(sdk.tenant_name) + "\" Network.")
-    else:
-        message.react(BAD_RESPONSE)
-        message.send(CGX_API_ERROR_MSG)
+
+
+@respond_to('cache stats', re.IGNORECASE)
+def cache_stats(message):
+    log_message_env(message)
+    message.react(GOOD_RESPONSE)
+    stats = metrics_cache.stats()
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = (100.0 * stats['hits'] / lookups) if lookups else 0.0
+    topology_stats = topology_cache.cache.stats()
+    topology_lookups = topology_stats['hits'] + topology_stats['misses']
+    topology_hit_rate = (100.0 * topology_stats['hits'] / topology_lookups) if topology_lookups else 0.0
+    message.reply("Metrics cache: {0}/{1} entries, {2} hits, {3} misses ({4:.0f}% hit rate), {5} evictions.\n"
+                  "Show media: {6} metrics API calls, {7} saved.\n"
+                  "Topology cache: {8}/{9} sites, {10} hits, {11} misses ({12:.0f}% hit rate), {13}s TTL."
+                  "".format(stats['size'], stats['maxsize'], stats['hits'], stats['misses'], hit_rate,
+                            stats['evictions'], media_call_totals.calls, media_call_totals.saved,
+                            topology_stats['size'], topology_stats['maxsize'], topology_stats['hits'],
+                            topology_stats['misses'], topology_hit_rate, topology_cache.ttl), in_thread=True)
 
 
 @respond_to('you there', re.IGNORECASE)
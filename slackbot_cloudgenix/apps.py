@@ -3,10 +3,20 @@
 import logging
 
 # helpers
-from .helpers import table_output, domain_to_idna, idna_to_domain, hierarchy_output
+from .helpers import table_output, stream_table_output, domain_to_idna, idna_to_domain, hierarchy_output
 
 logger = logging.getLogger(__name__)
 
+APPDEFS_ERROR_MSG = "Sorry, couldn't retrieve the Applications List."
+
+# keys hidden from, and shown first in, the application definitions table.
+APPDEFS_EXCLUDELIST = ['id$', '^_', '^app_tag_id$', 'conn_idle_timeout', 'path_affinity', 'udp_rules', 'tcp_rules',
+                       'ingress_traffic_pct', 'transfer_type', 'domains', 'abbreviation', 'aggregate_flows',
+                       'order_number', 'overrides_allowed', 'system_app_overridden', 'is_deprecated',
+                       'use_parentapp_network_policy', 'app_unreachability_detection', 'network_scan_application',
+                       'ip_rules', 'session_timeout']
+APPDEFS_ORDERLIST = ['display_name', 'app_type', 'category']
+
 
 # def filter_lookup_table_id(idname):
 #
@@ -16,6 +26,27 @@ logger = logging.getLogger(__name__)
 #     return return_dict
 
 
+def write_appdefs(sdk, output_file):
+    """
+    Write the application definitions table to a file a line at a time (stream_table_output), so large app
+    lists are never held as one string.
+    :param sdk: Authenticated CloudGenix SDK Constructor
+    :param output_file: Text file object to write to
+    :return: Bool, False if the Applications List couldn't be retrieved (nothing written).
+    """
+    logger.info('appdefinitionsv2 table start:')
+    appdef_resp = sdk.get.appdefs()
+    status = appdef_resp.cgx_status
+    app_defs = appdef_resp.cgx_content
+
+    if not (status and app_defs and app_defs.get('items', None)):
+        return False
+
+    for line in stream_table_output(app_defs['items'], APPDEFS_EXCLUDELIST, APPDEFS_ORDERLIST):
+        output_file.write(line + u'\n')
+    return True
+
+
 def get_appdefs(sdk, idname, passed_detail=None):
     logger.info('appdefinitionsv2 start:')
 
@@ -28,16 +59,9 @@ def get_appdefs(sdk, idname, passed_detail=None):
         # output the app_def info
         if status and app_defs and app_defs.get('items', None):
 
-            return table_output(app_defs['items'], ['id$', '^_', '^app_tag_id$', 'conn_idle_timeout', 'path_affinity',
-                                                    'udp_rules', 'tcp_rules', 'ingress_traffic_pct',
-                                                    'transfer_type', 'domains', 'abbreviation', 'aggregate_flows',
-                                                    'order_number', 'overrides_allowed', 'system_app_overridden',
-                                                    'is_deprecated', 'use_parentapp_network_policy',
-                                                    'app_unreachability_detection', 'network_scan_application',
-                                                    'ip_rules', 'session_timeout'],
-                                ['display_name', 'app_type', 'category'])
+            return table_output(app_defs['items'], APPDEFS_EXCLUDELIST, APPDEFS_ORDERLIST)
         else:
-            return "Sorry, couldn't retrieve the Applications List."
+            return APPDEFS_ERROR_MSG
 
     else:
         logger.info('ID/name passed: {0}'.format(passed_detail))
@@ -57,7 +81,7 @@ def get_appdefs(sdk, idname, passed_detail=None):
                     app_get = dict(app_def)
 
         else:
-            return "Sorry, couldn't retrieve the Applications List."
+            return APPDEFS_ERROR_MSG
 
         if app_get:
             tcp_rules_dict = app_get.pop('tcp_rules')
@@ -0,0 +1,342 @@
+# -*- coding: UTF-8 -*-
+# standard modules
+import logging
+import json
+import os
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+
+from .helpers import fetch_id2n_maps, ID2N_DELTA_MAP_TYPES, ID2N_DEFAULT_WORKERS
+from .matcher import NameMatcher
+
+logger = logging.getLogger(__name__)
+
+# Bump when the snapshot layout changes, older snapshots are then ignored.
+ID2N_SNAPSHOT_VERSION = 2
+
+# Seconds between background refreshes, per ID->Name map type. High churn types refresh more often.
+ID2N_REFRESH_INTERVALS = {
+    'sites': 300,
+    'elements': 300,
+    'interfaces': 300,
+    'machines': 900,
+    'wannetworks': 900,
+    'waninterfacelabels': 900,
+    'appdefs': 3600,
+    'tenant_operators': 3600,
+    'natglobalprefixes': 3600,
+    'natlocalprefixes': 3600,
+    'natpolicypools': 3600,
+}
+
+# Interval for types not listed above.
+ID2N_DEFAULT_REFRESH_INTERVAL = 900
+
+# How often the refresher wakes up to look for due types.
+ID2N_REFRESH_TICK = 30
+
+
+class NameIndex(object):
+    """
+    Name->ID lookups and fuzzy matchers for sites and appdefs. Rebuilt on each cache publish and never mutated
+    after, so a handler can hold one instance for a whole command.
+    """
+
+    def __init__(self, n2id_maps=None):
+        """
+        :param n2id_maps: Optional - Dict of map type -> Name->ID dict (see N2ID_MAP_TYPES)
+        """
+        n2id_maps = n2id_maps or {}
+        self.sites_n2id = n2id_maps.get('sites', {})
+        self.appdefs_n2id = n2id_maps.get('appdefs', {})
+        self.site_matcher = NameMatcher(self.sites_n2id.keys())
+        self.app_matcher = NameMatcher(self.appdefs_n2id.keys())
+
+    def __bool__(self):
+        return bool(self.sites_n2id or self.appdefs_n2id)
+
+
+def write_json_atomic(filename, data, prefix='.tmp_'):
+    """
+    Write data to a JSON file. Written to a temp file in the same directory and renamed, so a crash never leaves
+    a partial file behind. The temp file is removed if the write fails.
+    :param filename: File path
+    :param data: JSON serializable data
+    :param prefix: Temp file name prefix
+    :return: None. Raises OSError/IOError on write failure, TypeError/ValueError if data isn't serializable.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_filename = tempfile.mkstemp(prefix=prefix, dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as tmp_file:
+            json.dump(data, tmp_file)
+        os.replace(tmp_filename, filename)
+    except Exception:
+        if os.path.exists(tmp_filename):
+            os.unlink(tmp_filename)
+        raise
+
+
+def save_id2n_snapshot(filename, tenant_id, id2n_maps, n2id_maps=None, created=None):
+    """
+    Save per-type ID->Name maps to a local snapshot file (see write_json_atomic).
+    :param filename: Snapshot file path
+    :param tenant_id: Tenant ID the maps belong to
+    :param id2n_maps: OrderedDict of map type -> ID->Name dict
+    :param n2id_maps: Optional - Dict of map type -> Name->ID dict
+    :param created: Optional - epoch seconds the oldest map was fetched, checked against max_age on load
+                    (default now)
+    :return: Bool, True if saved.
+    """
+    snapshot = {
+        "version": ID2N_SNAPSHOT_VERSION,
+        "tenant_id": tenant_id,
+        "created": time.time() if created is None else created,
+        # list of pairs to keep merge order explicit.
+        "maps": [[map_type, id2n_map] for map_type, id2n_map in id2n_maps.items()],
+        "n2id_maps": n2id_maps or {}
+    }
+    try:
+        write_json_atomic(filename, snapshot, prefix='.id2n_snapshot_')
+    except (OSError, IOError, TypeError, ValueError) as e:
+        logger.warning("Unable to save ID->Name snapshot to {0}: {1}".format(filename, e))
+        return False
+
+    logger.info("Saved ID->Name snapshot to {0}.".format(filename))
+    return True
+
+
+def load_id2n_snapshot(filename, tenant_id, max_age=None):
+    """
+    Load per-type ID->Name maps from a local snapshot file.
+    :param filename: Snapshot file path
+    :param tenant_id: Tenant ID the maps must belong to
+    :param max_age: Optional - Max snapshot age in seconds. Older snapshots are not loaded.
+    :return: Tuple of (OrderedDict of map type -> ID->Name dict, dict of map type -> Name->ID dict),
+             or (None, None) if missing, stale, or not usable.
+    """
+    try:
+        with open(filename, 'r') as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except (OSError, IOError) as e:
+        logger.info("No ID->Name snapshot loaded from {0}: {1}".format(filename, e))
+        return None, None
+    except ValueError as e:
+        logger.warning("ID->Name snapshot {0} is corrupt, ignoring: {1}".format(filename, e))
+        return None, None
+
+    if not isinstance(snapshot, dict) or snapshot.get('version') != ID2N_SNAPSHOT_VERSION:
+        logger.info("ID->Name snapshot {0} version mismatch, ignoring.".format(filename))
+        return None, None
+
+    if snapshot.get('tenant_id') != tenant_id:
+        logger.info("ID->Name snapshot {0} is for a different tenant, ignoring.".format(filename))
+        return None, None
+
+    age = time.time() - snapshot.get('created', 0)
+    if max_age is not None and age > max_age:
+        logger.info("ID->Name snapshot {0} is {1:.0f}s old (max {2}s), ignoring.".format(filename, age, max_age))
+        return None, None
+
+    logger.info("Loaded ID->Name snapshot from {0} ({1:.0f}s old).".format(filename, age))
+    id2n_maps = OrderedDict((map_type, id2n_map) for map_type, id2n_map in snapshot.get('maps', []))
+    return id2n_maps, snapshot.get('n2id_maps', {})
+
+
+class ID2NRefresher(threading.Thread):
+    """
+    Background thread that keeps the ID->Name maps current using the query API delta updates
+    (same map types as update_id2n_dicts_delta). Each type refreshes on its own interval. Updated maps are
+    built off to the side and handed to `publish` as a new object, never mutated after publish.
+    """
+
+    def __init__(self, idname_obj, id2n_maps, publish, map_types=None, intervals=None,
+                 default_interval=ID2N_DEFAULT_REFRESH_INTERVAL, workers=ID2N_DEFAULT_WORKERS,
+                 tick=ID2N_REFRESH_TICK):
+        """
+        :param idname_obj: CloudGenixIDName object
+        :param id2n_maps: OrderedDict of map type -> ID->Name dict, the current published maps.
+        :param publish: Callable, passed the new OrderedDict of per-type maps after each refresh.
+        :param map_types: List of map types to refresh (default ID2N_DELTA_MAP_TYPES)
+        :param intervals: Optional - Dict of map type -> seconds, overrides ID2N_REFRESH_INTERVALS.
+        :param default_interval: Seconds for types without an interval.
+        :param workers: Max concurrent fetches per refresh.
+        :param tick: Seconds between due checks.
+        """
+        super(ID2NRefresher, self).__init__(name='id2n_refresher')
+        self.daemon = True
+        self.idname_obj = idname_obj
+        self.id2n_maps = OrderedDict(id2n_maps)
+        self.publish = publish
+        self.map_types = map_types if map_types is not None else ID2N_DELTA_MAP_TYPES
+        self.intervals = dict(ID2N_REFRESH_INTERVALS)
+        if intervals:
+            self.intervals.update(intervals)
+        self.default_interval = default_interval
+        self.workers = workers
+        self.tick = tick
+        self._stop_event = threading.Event()
+
+        now = time.time()
+        self.next_refresh = dict((map_type, now + self.interval(map_type)) for map_type in self.map_types)
+
+    def interval(self, map_type):
+        return self.intervals.get(map_type, self.default_interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        logger.info("ID->Name refresher started for {0} types.".format(len(self.map_types)))
+        while not self._stop_event.wait(self.tick):
+            self.refresh_due()
+
+    def refresh_due(self):
+        """
+        Refresh all types whose interval has elapsed, and publish the result.
+        :return: List of map types refreshed.
+        """
+        now = time.time()
+        due = [map_type for map_type in self.map_types if self.next_refresh[map_type] <= now]
+        if not due:
+            return []
+
+        # reschedule first, so a failing type waits a full interval before retry.
+        for map_type in due:
+            self.next_refresh[map_type] = now + self.interval(map_type)
+
+        try:
+            fresh_maps = fetch_id2n_maps(self.idname_obj, due, workers=self.workers)
+        except Exception as e:
+            logger.warning("ID->Name refresh of {0} failed: {1}".format(", ".join(due), e))
+            return []
+
+        # copy, update, then publish the new object.
+        new_maps = OrderedDict(self.id2n_maps)
+        new_maps.update(fresh_maps)
+        self.id2n_maps = new_maps
+        self.publish(new_maps)
+        logger.debug("ID->Name refresh published: {0}".format(", ".join(due)))
+        return due
+
+
+class TTLCache(object):
+    """
+    Thread safe LRU cache where each entry carries its own absolute expiry time. Holds at most maxsize
+    entries, the least recently used entry is evicted first.
+    """
+
+    def __init__(self, maxsize=1024):
+        """
+        :param maxsize: Max number of entries
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, now=None):
+        """
+        Get a cached value.
+        :param key: Hashable key
+        :param now: Optional - epoch seconds to check expiry against (default time.time())
+        :return: Tuple of (found bool, value)
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def set(self, key, value, expires):
+        """
+        Store a value.
+        :param key: Hashable key
+        :param value: Value to cache
+        :param expires: Epoch seconds the entry stops being valid
+        :return: None
+        """
+        with self._lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """
+        Drop an entry, if cached.
+        :param key: Hashable key
+        :return: Bool, True if an entry was dropped.
+        """
+        with self._lock:
+            return self.entries.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Get cache counters.
+        :return: dict of size, maxsize, hits, misses, evictions
+        """
+        with self._lock:
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+class SingleFlight(object):
+    """
+    Collapse concurrent calls for the same key into one. The first caller runs the function, callers arriving
+    while it runs wait for it and get the same result (or exception).
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Call function(*args, **kwargs), unless a call for key is already running, then wait for that one.
+        :param key: Hashable key
+        :param function: Callable
+        :return: function return value
+        """
+        with self._lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {"done": threading.Event(), "result": None, "error": None}
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = function(*args, **kwargs)
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self.calls[key]
+            call["done"].set()
@@ -0,0 +1,329 @@
+# -*- coding: UTF-8 -*-
+# standard modules
+import logging
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import chunk_list
+from .topology import LINK_CLASSES, link_is_down
+
+logger = logging.getLogger(__name__)
+
+# Sites per basenet topology query, and concurrent queries, for a full refresh.
+TOPOLOGY_GRAPH_BATCH_SIZE = 50
+TOPOLOGY_GRAPH_WORKERS = 4
+
+# Seconds between full refreshes of the tenant topology graph.
+TOPOLOGY_GRAPH_REFRESH_INTERVAL = 300
+
+
+def link_key(link):
+    """
+    Identify a link, so a link returned for both of its sites is only kept once.
+    :param link: topology link dict
+    :return: Hashable key
+    """
+    link_id = link.get('path_id') or link.get('id')
+    if link_id:
+        return link_id
+    return (link.get('type'), link.get('source_node_id'), link.get('target_node_id'), link.get('network'))
+
+
+class TopologyGraph(object):
+    """
+    Read only snapshot of the whole tenant topology. Sites are numbered, each link is stored once, and each site
+    keeps an adjacency tuple of link numbers. WAN networks and site tags map to tuples of site numbers.
+    Up anynet links are also indexed per site as peer site number -> tuple of link numbers, for route lookups.
+    """
+
+    def __init__(self, sites, links, created=None):
+        """
+        :param sites: list of site dicts (id, name, tags)
+        :param links: list of topology link dicts, duplicates allowed
+        :param created: Optional - epoch seconds the data was queried (default now)
+        """
+        self.created = time.time() if created is None else created
+        self.site_ids = tuple(site['id'] for site in sites)
+        self.site_index = dict((site_id, index) for index, site_id in enumerate(self.site_ids))
+
+        self.hub_sites = frozenset(site_num for site_num, site in enumerate(sites)
+                                   if (site.get('element_cluster_role') or '').upper() == 'HUB')
+
+        site_links = [[] for _ in self.site_ids]
+        anynet_peers = [{} for _ in self.site_ids]
+        network_sites = {}
+        tag_sites = {}
+        unique_links = []
+        seen = set()
+        for link in links:
+            key = link_key(link)
+            if key in seen:
+                continue
+            seen.add(key)
+            link_num = len(unique_links)
+            unique_links.append(link)
+
+            # anynet/vpn links have both sites, stub links one site and a WAN network.
+            for node_id in (link.get('source_node_id'), link.get('target_node_id')):
+                site_num = self.site_index.get(node_id)
+                if site_num is not None and link_num not in site_links[site_num][-1:]:
+                    site_links[site_num].append(link_num)
+                    if link.get('network'):
+                        network_sites.setdefault(link['network'], set()).add(site_num)
+
+            link_class = LINK_CLASSES.get((link.get('type') or '').lower())
+            if link_class is not None and link_class.render == 'anynet' and \
+                    (link.get('status') or '').lower() == 'up':
+                source_num = self.site_index.get(link.get('source_node_id'))
+                target_num = self.site_index.get(link.get('target_node_id'))
+                if source_num is not None and target_num is not None and source_num != target_num:
+                    anynet_peers[source_num].setdefault(target_num, []).append(link_num)
+                    anynet_peers[target_num].setdefault(source_num, []).append(link_num)
+
+        for site_num, site in enumerate(sites):
+            for tag in site.get('tags') or []:
+                tag_sites.setdefault(tag.lower(), []).append(site_num)
+
+        self.links = tuple(unique_links)
+        self.site_links = tuple(tuple(link_nums) for link_nums in site_links)
+        self.anynet_peers = tuple(dict((peer_num, tuple(link_nums)) for peer_num, link_nums in peers.items())
+                                  for peers in anynet_peers)
+        self.network_sites = dict((network, tuple(sorted(site_nums))) for network, site_nums in network_sites.items())
+        self.tag_sites = dict((tag, tuple(site_nums)) for tag, site_nums in tag_sites.items())
+
+    def age(self, now=None):
+        """
+        :param now: Optional - epoch seconds (default time.time())
+        :return: Seconds since the data was queried.
+        """
+        return (time.time() if now is None else now) - self.created
+
+    def has_site(self, site_id):
+        return site_id in self.site_index
+
+    def links_for_site(self, site_id):
+        """
+        :param site_id: Site ID
+        :return: list of topology link dicts for the site (empty if unknown). Shared, treat as read only.
+        """
+        site_num = self.site_index.get(site_id)
+        if site_num is None:
+            return []
+        return [self.links[link_num] for link_num in self.site_links[site_num]]
+
+    def sites_for_tag(self, tag):
+        """
+        :param tag: Site tag (case insensitive)
+        :return: list of Site IDs with the tag
+        """
+        return [self.site_ids[site_num] for site_num in self.tag_sites.get(tag.lower(), ())]
+
+    def sites_for_network(self, network):
+        """
+        :param network: WAN network name, as shown on stub links
+        :return: list of Site IDs with a circuit on the network
+        """
+        return [self.site_ids[site_num] for site_num in self.network_sites.get(network, ())]
+
+    def site_routes(self, source_id, target_id):
+        """
+        Find site to site routes over up anynet links: direct, and one hop via a hub (DC) site.
+        :param source_id: Site ID
+        :param target_id: Site ID
+        :return: Tuple of (list of direct link dicts, list of (hub Site ID, list of source-hub link dicts,
+                 list of hub-target link dicts)). Empty lists if either site is unknown.
+        """
+        source_num = self.site_index.get(source_id)
+        target_num = self.site_index.get(target_id)
+        if source_num is None or target_num is None:
+            return [], []
+
+        source_peers = self.anynet_peers[source_num]
+        target_peers = self.anynet_peers[target_num]
+
+        direct = [self.links[link_num] for link_num in source_peers.get(target_num, ())]
+
+        via = []
+        # walk the smaller peer set.
+        if len(source_peers) <= len(target_peers):
+            hub_nums = [peer_num for peer_num in source_peers if peer_num in target_peers]
+        else:
+            hub_nums = [peer_num for peer_num in target_peers if peer_num in source_peers]
+        for hub_num in sorted(hub_nums):
+            if hub_num not in self.hub_sites:
+                continue
+            via.append((self.site_ids[hub_num],
+                        [self.links[link_num] for link_num in source_peers[hub_num]],
+                        [self.links[link_num] for link_num in target_peers[hub_num]]))
+
+        return direct, via
+
+    def sites_with_links_down(self, renders=('anynet',)):
+        """
+        Scan for sites with any shown link of the given kinds down.
+        :param renders: LINK_CLASSES render kinds to check, default ('anynet',) - tunnels.
+        :return: list of (Site ID, list of down link dicts), in site order.
+        """
+        down_links = set(link_num for link_num, link in enumerate(self.links)
+                         if link_is_down(link) and
+                         getattr(LINK_CLASSES.get((link.get('type') or '').lower()), 'render', None) in renders)
+        if not down_links:
+            return []
+
+        results = []
+        for site_num, link_nums in enumerate(self.site_links):
+            site_down = [self.links[link_num] for link_num in link_nums if link_num in down_links]
+            if site_down:
+                results.append((self.site_ids[site_num], site_down))
+        return results
+
+
+def route_link_text(link, from_id):
+    """
+    :param link: anynet link dict
+    :param from_id: Site ID to show first
+    :return: "<WAN network> ⇔ <WAN network> (<status>)" text, from_id's network first.
+    """
+    if link.get('target_node_id') == from_id:
+        networks = (link.get('target_wan_network'), link.get('source_wan_network'))
+    else:
+        networks = (link.get('source_wan_network'), link.get('target_wan_network'))
+    return "{0} ⇔ {1} ({2})".format(networks[0], networks[1], link.get('status', 'unknown'))
+
+
+def render_site_route(graph, source_id, target_id, id2n):
+    """
+    Render site to site routes from the tenant topology graph.
+    :param graph: TopologyGraph object
+    :param source_id: Site ID
+    :param target_id: Site ID
+    :param id2n: ID to Name lookup dict
+    :return: list of slack attachments
+    """
+    source_name = id2n.get(source_id, source_id)
+    target_name = id2n.get(target_id, target_id)
+    direct, via = graph.site_routes(source_id, target_id)
+
+    if not direct and not via:
+        return [{
+            'text': "No up AppFabric path between {0} and {1}, direct or via a hub.".format(source_name,
+                                                                                          target_name),
+            'color': 'danger'
+        }]
+
+    combined_message = []
+    if direct:
+        combined_message.append({
+            'pretext': "*Direct*",
+            'text': "{0} ⇔ {1}\n".format(source_name, target_name) +
+                    "\n".join(route_link_text(link, source_id) for link in direct),
+            'color': 'good',
+            'mrkdwn_in': ["pretext", "text"]
+        })
+
+    for index, (hub_id, source_links, target_links) in enumerate(via):
+        hub_name = id2n.get(hub_id, hub_id)
+        attachment = {
+            'text': "{0} ⇔ {1} ⇔ {2}\n".format(source_name, hub_name, target_name) +
+                    "\n".join(route_link_text(link, source_id) for link in source_links) + "\n" +
+                    "\n".join(route_link_text(link, hub_id) for link in target_links),
+            'color': 'good'
+        }
+        if not index:
+            attachment['pretext'] = "*Via hub*"
+            attachment['mrkdwn_in'] = ["pretext", "text"]
+        combined_message.append(attachment)
+
+    return combined_message
+
+
+def fetch_topology_links(site_ids, sdk, batch_size=TOPOLOGY_GRAPH_BATCH_SIZE, workers=TOPOLOGY_GRAPH_WORKERS):
+    """
+    Query the basenet topology links of many sites, batch_size sites per query.
+    :param site_ids: list of Site IDs
+    :param sdk: Authenticated CloudGenix SDK Constructor
+    :param batch_size: Sites per query
+    :param workers: Max concurrent queries
+    :return: list of link dicts (may hold duplicates). Raises ValueError if any query fails.
+    """
+    def query_batch(batch):
+        topology_resp = sdk.post.topology({"type": "basenet", "nodes": batch})
+        if not topology_resp.cgx_status:
+            raise ValueError("topology query for {0} sites failed".format(len(batch)))
+        return topology_resp.cgx_content.get('links', [])
+
+    links = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch_links in executor.map(query_batch, chunk_list(list(site_ids), batch_size)):
+            links.extend(batch_links)
+    return links
+
+
+def build_topology_graph(sdk, batch_size=TOPOLOGY_GRAPH_BATCH_SIZE, workers=TOPOLOGY_GRAPH_WORKERS):
+    """
+    Query all sites and their topology, and build a graph.
+    :param sdk: Authenticated CloudGenix SDK Constructor
+    :param batch_size: Sites per topology query
+    :param workers: Max concurrent topology queries
+    :return: TopologyGraph. Raises ValueError if a query fails.
+    """
+    start = time.time()
+    sites_resp = sdk.get.sites()
+    if not sites_resp.cgx_status:
+        raise ValueError("sites query failed")
+    sites = [site for site in sdk.extract_items(sites_resp, 'sites') if site.get('id')]
+
+    graph = TopologyGraph(sites, fetch_topology_links([site['id'] for site in sites], sdk, batch_size=batch_size,
+                                                      workers=workers), created=start)
+    logger.info("Topology graph: {0} sites, {1} links in {2:.2f}s".format(len(graph.site_ids), len(graph.links),
+                                                                        time.time() - start))
+    return graph
+
+
+class TopologyGraphRefresher(threading.Thread):
+    """
+    Background thread that rebuilds the tenant topology graph every interval seconds, and hands each new graph
+    to `publish`. A failed refresh keeps the previous graph.
+    """
+
+    def __init__(self, sdk, publish, interval=TOPOLOGY_GRAPH_REFRESH_INTERVAL, batch_size=TOPOLOGY_GRAPH_BATCH_SIZE,
+                 workers=TOPOLOGY_GRAPH_WORKERS):
+        """
+        :param sdk: Authenticated CloudGenix SDK Constructor
+        :param publish: Callable, passed the new TopologyGraph after each refresh.
+        :param interval: Seconds between refreshes.
+        :param batch_size: Sites per topology query
+        :param workers: Max concurrent topology queries
+        """
+        super(TopologyGraphRefresher, self).__init__(name='topology_graph_refresher')
+        self.daemon = True
+        self.sdk = sdk
+        self.publish = publish
+        self.interval = interval
+        self.batch_size = batch_size
+        self.workers = workers
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        logger.info("Topology graph refresher started, every {0}s.".format(self.interval))
+        self.refresh()
+        while not self._stop_event.wait(self.interval):
+            self.refresh()
+
+    def refresh(self):
+        """
+        Build and publish a new graph.
+        :return: TopologyGraph, or None if the refresh failed.
+        """
+        try:
+            graph = build_topology_graph(self.sdk, batch_size=self.batch_size, workers=self.workers)
+        except Exception as e:
+            logger.warning("Topology graph refresh failed: {0}".format(e))
+            return None
+
+        self.publish(graph)
+        return graph
@@ -7,8 +7,12 @@
 #
 
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import logging
+import math
 import re
+import time
 import datetime
 import tabulate
 import idna
@@ -17,6 +21,20 @@ import cloudgenix
 # Logging
 logger = logging.getLogger(__name__)
 
+# stream_table_output column types, least generic first (a column takes the most generic type of its cells).
+TABLE_CELL_EMPTY, TABLE_CELL_BOOL, TABLE_CELL_INT, TABLE_CELL_FLOAT, TABLE_CELL_TEXT = range(5)
+
+# Numbers with thousands separators, eg "1,000" or "-1,234.5", as tabulate matches them.
+TABLE_THOUSANDS_NUMBER_REGEX = re.compile(r'^(([+-]?[0-9]{1,3})(?:,([0-9]{3}))*)?(?(1)\.[0-9]*|\.[0-9]+)?$')
+
+# Printable ASCII, see table_text_is_plain.
+TABLE_PLAIN_TEXT_REGEX = re.compile(r'[\x20-\x7e]*\Z')
+
+# ExcludeFilter: flags of a pattern without inline flags, and group number references (backreferences and
+# conditionals) in a pattern. Patterns with either are not combined into one regex.
+EXCLUDE_DEFAULT_FLAGS = re.compile(u"").flags
+EXCLUDE_GROUP_NUMBER_REGEX = re.compile(r'\\[1-9]|\(\?\([0-9]')
+
 # Dictionary of keys to pretty name
 PRETTYNAMES = {
     '': ' ',  # Needed in cases where a priorty key is blank. Otherwise will not be added to right spot.
@@ -219,152 +237,187 @@ PRETTYNAMES = {
 }
 
 
-def update_id2n_dicts_slow(idname_obj):
-    # pull slow updates. This can take 1-2 minutes or more. Run at start of bot.
-    global_id2n = {}
-    sites_id2n = idname_obj.generate_sites_map()
-    global_id2n.update(sites_id2n)
-    elements_id2n = idname_obj.generate_elements_map()
-    global_id2n.update(elements_id2n)
-    machines_id2n = idname_obj.generate_machines_map()
-    global_id2n.update(machines_id2n)
-    policysets_id2n = idname_obj.generate_policysets_map()
-    global_id2n.update(policysets_id2n)
-    securitypolicysets_id2n = idname_obj.generate_securitypolicysets_map()
-    global_id2n.update(securitypolicysets_id2n)
-    securityzones_id2n = idname_obj.generate_securityzones_map()
-    global_id2n.update(securityzones_id2n)
-    networkpolicysetstacks_id2n = idname_obj.generate_networkpolicysetstacks_map()
-    global_id2n.update(networkpolicysetstacks_id2n)
-    networkpolicysets_id2n = idname_obj.generate_networkpolicysets_map()
-    global_id2n.update(networkpolicysets_id2n)
-    prioritypolicysetstacks_id2n = idname_obj.generate_prioritypolicysetstacks_map()
-    global_id2n.update(prioritypolicysetstacks_id2n)
-    prioritypolicysets_id2n = idname_obj.generate_prioritypolicysets_map()
-    global_id2n.update(prioritypolicysets_id2n)
-    waninterfacelabels_id2n = idname_obj.generate_waninterfacelabels_map()
-    global_id2n.update(waninterfacelabels_id2n)
-    wannetworks_id2n = idname_obj.generate_wannetworks_map()
-    global_id2n.update(wannetworks_id2n)
-    wanoverlays_id2n = idname_obj.generate_wanoverlays_map()
-    global_id2n.update(wanoverlays_id2n)
-    servicebindingmaps_id2n = idname_obj.generate_servicebindingmaps_map()
-    global_id2n.update(servicebindingmaps_id2n)
-    serviceendpoints_id2n = idname_obj.generate_serviceendpoints_map()
-    global_id2n.update(serviceendpoints_id2n)
-    ipsecprofiles_id2n = idname_obj.generate_ipsecprofiles_map()
-    global_id2n.update(ipsecprofiles_id2n)
-    networkcontexts_id2n = idname_obj.generate_networkcontexts_map()
-    global_id2n.update(networkcontexts_id2n)
-    appdefs_id2n = idname_obj.generate_appdefs_map()
-    global_id2n.update(appdefs_id2n)
-    natglobalprefixes_id2n = idname_obj.generate_natglobalprefixes_map()
-    global_id2n.update(natglobalprefixes_id2n)
-    natlocalprefixes_id2n = idname_obj.generate_natlocalprefixes_map()
-    global_id2n.update(natlocalprefixes_id2n)
-    natpolicypools_id2n = idname_obj.generate_natpolicypools_map()
-    global_id2n.update(natpolicypools_id2n)
-    natpolicysetstacks_id2n = idname_obj.generate_natpolicysetstacks_map()
-    global_id2n.update(natpolicysetstacks_id2n)
-    natpolicysets_id2n = idname_obj.generate_natpolicysets_map()
-    global_id2n.update(natpolicysets_id2n)
-    natzones_id2n = idname_obj.generate_natzones_map()
-    global_id2n.update(natzones_id2n)
+# ID->Name map types, in merge order. Each entry maps to idname_obj.generate_<type>_map().
+ID2N_SLOW_MAP_TYPES = [
+    'sites',
+    'elements',
+    'machines',
+    'policysets',
+    'securitypolicysets',
+    'securityzones',
+    'networkpolicysetstacks',
+    'networkpolicysets',
+    'prioritypolicysetstacks',
+    'prioritypolicysets',
+    'waninterfacelabels',
+    'wannetworks',
+    'wanoverlays',
+    'servicebindingmaps',
+    'serviceendpoints',
+    'ipsecprofiles',
+    'networkcontexts',
+    'appdefs',
+    'natglobalprefixes',
+    'natlocalprefixes',
+    'natpolicypools',
+    'natpolicysetstacks',
+    'natpolicysets',
+    'natzones',
+    'tenant_operators',
+    'topology',
+    'anynets',
+    'interfaces',
+    'waninterfaces',
+    'lannetworks',
+    'spokeclusters',
+    'localprefixfilters',
+    'globalprefixfilters',
+]
+
+# query api capable types only, these refresh quickly.
+ID2N_DELTA_MAP_TYPES = [
+    'sites',
+    'elements',
+    'machines',
+    'policysets',
+    'securitypolicysets',
+    'securityzones',
+    'networkpolicysetstacks',
+    'networkpolicysets',
+    'prioritypolicysetstacks',
+    'prioritypolicysets',
+    'waninterfacelabels',
+    'wannetworks',
+    'wanoverlays',
+    'servicebindingmaps',
+    'serviceendpoints',
+    'ipsecprofiles',
+    'networkcontexts',
+    'appdefs',
+    'natglobalprefixes',
+    'natlocalprefixes',
+    'natpolicypools',
+    'natpolicysetstacks',
+    'natpolicysets',
+    'natzones',
+    'tenant_operators',
+    'interfaces',
+]
+
+# Types that may fail due to operator permissions. Failure here is logged, not raised.
+ID2N_OPTIONAL_MAP_TYPES = [
+    'tenant_operators',
+]
+
+# Other types iterate sites/elements internally, so these are loaded first to avoid duplicate full dumps.
+ID2N_PREREQUISITE_MAP_TYPES = [
+    'sites',
+    'elements',
+]
+
+# Default worker count for the concurrent loader.
+ID2N_DEFAULT_WORKERS = 8
+
+# Name->ID index types, and the object key used as the name.
+N2ID_MAP_TYPES = OrderedDict([
+    ('sites', 'name'),
+    ('appdefs', 'display_name'),
+])
+
+
+def fetch_id2n_map(idname_obj, map_type):
+    """
+    Fetch a single ID->Name map from cloudgenix_idname, logging how long it took.
+    :param idname_obj: CloudGenixIDName object
+    :param map_type: Map type string (entry in ID2N_SLOW_MAP_TYPES)
+    :return: ID->Name dict (empty if an optional type failed)
+    """
+    generate_map = getattr(idname_obj, 'generate_{0}_map'.format(map_type))
+    start = time.time()
     try:
-        tenant_operators_id2n = idname_obj.generate_tenant_operators_map()
-        global_id2n.update(tenant_operators_id2n)
-    except cloudgenix.CloudGenixAPIError as e:
-        logger.debug("Tenant Operators id2n map failed (likely no permission.)")
-    topology_id2n = idname_obj.generate_topology_map()
-    global_id2n.update(topology_id2n)
-    anynets_id2n = idname_obj.generate_anynets_map()
-    global_id2n.update(anynets_id2n)
-    interfaces_id2n = idname_obj.generate_interfaces_map()
-    global_id2n.update(interfaces_id2n)
-    waninterfaces_id2n = idname_obj.generate_waninterfaces_map()
-    global_id2n.update(waninterfaces_id2n)
-    lannetworks_id2n = idname_obj.generate_lannetworks_map()
-    global_id2n.update(lannetworks_id2n)
-    spokeclusters_id2n = idname_obj.generate_spokeclusters_map()
-    global_id2n.update(spokeclusters_id2n)
-    localprefixfilters_id2n = idname_obj.generate_localprefixfilters_map()
-    global_id2n.update(localprefixfilters_id2n)
-    globalprefixfilters_id2n = idname_obj.generate_globalprefixfilters_map()
-    global_id2n.update(globalprefixfilters_id2n)
+        id2n_map = generate_map()
+    except cloudgenix.CloudGenixAPIError:
+        if map_type not in ID2N_OPTIONAL_MAP_TYPES:
+            raise
+        logger.debug("{0} id2n map failed (likely no permission.)".format(map_type))
+        id2n_map = {}
+    logger.info("ID->Name map '{0}': {1} entries in {2:.2f}s".format(map_type, len(id2n_map), time.time() - start))
+    return id2n_map
 
+
+def fetch_id2n_maps(idname_obj, map_types=None, workers=ID2N_DEFAULT_WORKERS):
+    """
+    Fetch multiple ID->Name maps concurrently through a bounded thread pool.
+    :param idname_obj: CloudGenixIDName object
+    :param map_types: List of map types to fetch (default ID2N_SLOW_MAP_TYPES)
+    :param workers: Max concurrent fetches. 1 or less fetches serially.
+    :return: OrderedDict of map type -> ID->Name dict, in map_types order.
+    """
+    if map_types is None:
+        map_types = ID2N_SLOW_MAP_TYPES
+
+    start = time.time()
+    results = {}
+    if workers is None or workers <= 1:
+        for map_type in map_types:
+            results[map_type] = fetch_id2n_map(idname_obj, map_type)
+    else:
+        first_stage = [map_type for map_type in map_types if map_type in ID2N_PREREQUISITE_MAP_TYPES]
+        second_stage = [map_type for map_type in map_types if map_type not in ID2N_PREREQUISITE_MAP_TYPES]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for stage in (first_stage, second_stage):
+                futures = dict((map_type, executor.submit(fetch_id2n_map, idname_obj, map_type))
+                               for map_type in stage)
+                for map_type, future in futures.items():
+                    results[map_type] = future.result()
+
+    logger.info("ID->Name maps: {0} types in {1:.2f}s ({2} workers)".format(len(map_types), time.time() - start,
+                                                                           workers))
+    # keep the order deterministic, regardless of completion order.
+    return OrderedDict((map_type, results[map_type]) for map_type in map_types)
+
+
+def merge_id2n_maps(id2n_maps):
+    """
+    Merge per-type ID->Name maps into a single dict. Later types win on duplicate IDs.
+    :param id2n_maps: OrderedDict of map type -> ID->Name dict
+    :return: merged ID->Name dict
+    """
+    global_id2n = {}
+    for id2n_map in id2n_maps.values():
+        global_id2n.update(id2n_map)
     return global_id2n
 
 
+def generate_n2id_maps(idname_obj):
+    """
+    Build Name->ID maps from the objects cloudgenix_idname already has cached. No API calls, so this must run
+    after the matching ID->Name types were fetched.
+    :param idname_obj: CloudGenixIDName object
+    :return: OrderedDict of map type -> Name->ID dict, or None if the object caches are not loaded yet.
+    """
+    n2id_maps = OrderedDict()
+    for map_type, name_key in N2ID_MAP_TYPES.items():
+        if getattr(idname_obj, '{0}_cache'.format(map_type), None) is None:
+            return None
+        generate_map = getattr(idname_obj, 'generate_{0}_map'.format(map_type))
+        n2id_maps[map_type] = generate_map(key_val=name_key, value_val='id', update_cache=False)
+    return n2id_maps
+
+
+def update_id2n_dicts_slow(idname_obj):
+    # pull slow updates. This can take 1-2 minutes or more. Run at start of bot.
+    return merge_id2n_maps(fetch_id2n_maps(idname_obj, ID2N_SLOW_MAP_TYPES, workers=1))
+
+
 def update_id2n_dicts_delta(idname_obj):
     # pull query api updates only. This should be fast.
-    global_id2n = {}
-    sites_id2n = idname_obj.generate_sites_map()
-    global_id2n.update(sites_id2n)
-    elements_id2n = idname_obj.generate_elements_map()
-    global_id2n.update(elements_id2n)
-    machines_id2n = idname_obj.generate_machines_map()
-    global_id2n.update(machines_id2n)
-    policysets_id2n = idname_obj.generate_policysets_map()
-    global_id2n.update(policysets_id2n)
-    securitypolicysets_id2n = idname_obj.generate_securitypolicysets_map()
-    global_id2n.update(securitypolicysets_id2n)
-    securityzones_id2n = idname_obj.generate_securityzones_map()
-    global_id2n.update(securityzones_id2n)
-    networkpolicysetstacks_id2n = idname_obj.generate_networkpolicysetstacks_map()
-    global_id2n.update(networkpolicysetstacks_id2n)
-    networkpolicysets_id2n = idname_obj.generate_networkpolicysets_map()
-    global_id2n.update(networkpolicysets_id2n)
-    prioritypolicysetstacks_id2n = idname_obj.generate_prioritypolicysetstacks_map()
-    global_id2n.update(prioritypolicysetstacks_id2n)
-    prioritypolicysets_id2n = idname_obj.generate_prioritypolicysets_map()
-    global_id2n.update(prioritypolicysets_id2n)
-    waninterfacelabels_id2n = idname_obj.generate_waninterfacelabels_map()
-    global_id2n.update(waninterfacelabels_id2n)
-    wannetworks_id2n = idname_obj.generate_wannetworks_map()
-    global_id2n.update(wannetworks_id2n)
-    wanoverlays_id2n = idname_obj.generate_wanoverlays_map()
-    global_id2n.update(wanoverlays_id2n)
-    servicebindingmaps_id2n = idname_obj.generate_servicebindingmaps_map()
-    global_id2n.update(servicebindingmaps_id2n)
-    serviceendpoints_id2n = idname_obj.generate_serviceendpoints_map()
-    global_id2n.update(serviceendpoints_id2n)
-    ipsecprofiles_id2n = idname_obj.generate_ipsecprofiles_map()
-    global_id2n.update(ipsecprofiles_id2n)
-    networkcontexts_id2n = idname_obj.generate_networkcontexts_map()
-    global_id2n.update(networkcontexts_id2n)
-    appdefs_id2n = idname_obj.generate_appdefs_map()
-    global_id2n.update(appdefs_id2n)
-    natglobalprefixes_id2n = idname_obj.generate_natglobalprefixes_map()
-    global_id2n.update(natglobalprefixes_id2n)
-    natlocalprefixes_id2n = idname_obj.generate_natlocalprefixes_map()
-    global_id2n.update(natlocalprefixes_id2n)
-    natpolicypools_id2n = idname_obj.generate_natpolicypools_map()
-    global_id2n.update(natpolicypools_id2n)
-    natpolicysetstacks_id2n = idname_obj.generate_natpolicysetstacks_map()
-    global_id2n.update(natpolicysetstacks_id2n)
-    natpolicysets_id2n = idname_obj.generate_natpolicysets_map()
-    global_id2n.update(natpolicysets_id2n)
-    natzones_id2n = idname_obj.generate_natzones_map()
-    global_id2n.update(natzones_id2n)
-    try:
-        tenant_operators_id2n = idname_obj.generate_tenant_operators_map()
-        global_id2n.update(tenant_operators_id2n)
-    except cloudgenix.CloudGenixAPIError as e:
-        logger.debug("Tenant Operators id2n map failed (likely no permission.)")
-    # topology_id2n = idname_obj.generate_topology_map()
-    # global_id2n.update(topology_id2n)
-    # anynets_id2n = idname_obj.generate_anynets_map()
-    # global_id2n.update(anynets_id2n)
-    interfaces_id2n = idname_obj.generate_interfaces_map()
-    global_id2n.update(interfaces_id2n)
-    # waninterfaces_id2n = idname_obj.generate_waninterfaces_map()
-    # global_id2n.update(waninterfaces_id2n)
-    # lannetworks_id2n = idname_obj.generate_lannetworks_map()
-    # global_id2n.update(lannetworks_id2n)
-    # spokeclusters_id2n = idname_obj.generate_spokeclusters_map()
-    # global_id2n.update(spokeclusters_id2n)
+    return merge_id2n_maps(fetch_id2n_maps(idname_obj, ID2N_DELTA_MAP_TYPES, workers=1))
 
-    return global_id2n
+
+def update_id2n_dicts_concurrent(idname_obj, workers=ID2N_DEFAULT_WORKERS):
+    # pull slow updates using a thread pool. Same result as update_id2n_dicts_slow, in a fraction of the time.
+    return merge_id2n_maps(fetch_id2n_maps(idname_obj, ID2N_SLOW_MAP_TYPES, workers=workers))
 
 
 def string_can_be_int(value):
@@ -677,13 +730,137 @@ def check_sub_list(parsed_dict, key, value):
     return status
 
 
+class ExcludeFilter(object):
+    """
+    Compiled exclude list for table_output / hierarchy_output: the patterns combined into one regex (stops at the
+    first pattern that matches), and a cache of the decision for each key seen.
+    """
+
+    def __init__(self, excludelist):
+        """
+        :param excludelist: List of REGEX expressions to match keys to supress
+        """
+        self.patterns = tuple(excludelist)
+        self.decisions = {}
+        self.regex = None
+        self.regex_list = [re.compile(pattern) for pattern in self.patterns]
+        # combined, inline flags would apply to every pattern, and group numbers would count across patterns.
+        if self.patterns and not any(regex.flags != EXCLUDE_DEFAULT_FLAGS or EXCLUDE_GROUP_NUMBER_REGEX.search(pattern)
+                                     for regex, pattern in zip(self.regex_list, self.patterns)):
+            try:
+                self.regex = re.compile(u"|".join(u"(?:{0})".format(pattern) for pattern in self.patterns))
+                self.regex_list = None
+            except re.error:
+                # patterns that can't be combined (eg, duplicate group names), check one by one.
+                pass
+
+    def excludes(self, key):
+        """
+        :param key: Dict key
+        :return: Bool, True if any pattern matches the key.
+        """
+        decision = self.decisions.get(key)
+        if decision is None:
+            if self.regex is not None:
+                decision = self.regex.search(key) is not None
+            elif self.regex_list:
+                decision = any(regex.search(key) for regex in self.regex_list)
+            else:
+                decision = False
+            self.decisions[key] = decision
+        return decision
+
+
+@lru_cache(maxsize=64)
+def get_exclude_filter(patterns):
+    """
+    Get a shared ExcludeFilter, so decisions are kept between calls with the same exclude list.
+    :param patterns: Tuple of REGEX expressions
+    :return: ExcludeFilter
+    """
+    return ExcludeFilter(patterns)
+
+
+def compile_excludelist(excludelist):
+    """
+    :param excludelist: List of REGEX expressions, ExcludeFilter, or None
+    :return: ExcludeFilter, or None if excludelist is None.
+    """
+    if excludelist is None or isinstance(excludelist, ExcludeFilter):
+        return excludelist
+    return get_exclude_filter(tuple(excludelist))
+
+
+def add_table_cell(parsed_dict, key, value, excludelist=None, remove_sub_dict=True, remove_sub_list=True):
+    """
+    Add one key of a table_output row to the parsed row, unless excluded.
+    :param parsed_dict: Parsed output that this function will add items too
+    :param key: Dictionary Key
+    :param value: Dictionary Value
+    :param excludelist: ExcludeFilter or None
+    :param remove_sub_dict: Boolean - remove sub dictionaries from table
+    :param remove_sub_list: Boolean - remove sub Lists from table
+    :return: None
+    """
+    if excludelist is not None and excludelist.excludes(key):
+        return
+
+    # is this a list
+    if (type(value) is list) and (remove_sub_list is True):
+        check_sub_list(parsed_dict, key, value)
+
+    # is this a dict
+    elif (type(value) is dict) and (remove_sub_dict is True):
+        check_sub_dict(parsed_dict, key, value)
+
+    else:
+        # other key, just add, 'prettyfiying' data as needed.
+        parsed_dict[get_pretty_name(key)] = get_pretty_name(get_pretty_data(key, value))
+
+
+def table_row(listline, excludelist=None, orderlist=None, remove_sub_dict=True, remove_sub_list=True):
+    """
+    Parse one dictionary of table_output data into a table row. listline is not modified.
+    :param listline: Dictionary for the row
+    :param excludelist: ExcludeFilter or None
+    :param orderlist: List of items that should be ordered first.
+    :param remove_sub_dict: Boolean - remove sub dictionaries from table
+    :param remove_sub_list: Boolean - remove sub Lists from table
+    :return: OrderedDict of pretty name -> pretty value
+    """
+    parsed_dict = OrderedDict({})
+    ordered_keys = set()
+
+    if orderlist is not None:
+        # ordering list exists
+        for priority_key in orderlist:
+            # for each priority key, insert if exists.
+            if priority_key in listline and priority_key not in ordered_keys:
+                logger.debug('got priority key: {0}'.format(priority_key))
+                add_table_cell(parsed_dict, priority_key, listline[priority_key], excludelist, remove_sub_dict,
+                               remove_sub_list)
+                # Remaining keys will be sorted after priority ones.
+                ordered_keys.add(priority_key)
+            else:
+                # There is no value for this key. Add a blank to preserve spot in the desplay list
+                # (cover case of blank spot in first value):
+                parsed_dict[get_pretty_name(priority_key)] = ' '
+
+    # Sort remaining keys not in priority orderlist (or all if orderlist is none). Inserted as found.
+    for k, v in listline.items():
+        if k not in ordered_keys:
+            add_table_cell(parsed_dict, k, v, excludelist, remove_sub_dict, remove_sub_list)
+
+    return parsed_dict
+
+
 def table_output(data, excludelist=None, orderlist=None, remove_sub_dict=True, remove_sub_list=True,
                  space_indent=4, trailing_newline=True, filters_enabled=True):
     """
     Format raw API JSON into tables
     #print table_output(testdict['items'], ['^_', 'id$'])
     :param data: List of Dictionaries that need sent to tabilizer
-    :param excludelist: List of REGEX expressions to match items to supress
+    :param excludelist: List of REGEX expressions to match items to supress, or an ExcludeFilter
     :param orderlist: List of items that should be ordered first.
     :param remove_sub_dict: Boolean - remove sub dictionaries from table (almost always should be true)
     :param remove_sub_list: Boolean - remove sub Lists from table (almost always should be true)
@@ -700,167 +877,287 @@ def table_output(data, excludelist=None, orderlist=None, remove_sub_dict=True, r
         else:
             return return_str
 
-    output_list = []
-
     # Check for debug override of excluding variables in output.
     if not filters_enabled:
         excludelist = None
+    excludelist = compile_excludelist(excludelist)
 
     # Assume outer list wrapper
-    for listline in data:
-        parsed_dict = OrderedDict({})
+    output_list = [table_row(listline, excludelist, orderlist, remove_sub_dict, remove_sub_list)
+                   for listline in data]
 
-        if orderlist is not None:
-            # ordering list exists
-            for priority_key in orderlist:
-                # for each priority key, insert if exists.
-                priority_key_value = listline.get(priority_key, None)
-                if priority_key in listline:
-                    logger.debug('got priority key: {0}'.format(priority_key))
-
-                    if excludelist is not None:
-                        # there is a regex exclude list, check if key matches
-                        is_in_excludelist = False
-
-                        for regexstr in excludelist:
-                            if re.search(regexstr, priority_key):
-                                # matched exclude list
-                                is_in_excludelist = True
-
-                        if not is_in_excludelist:
-                            # Not in exclude list, add to output, 'prettyfiying' data as needed.
+    # Make initial output string
+    data_str = str(tabulate.tabulate(output_list, headers='keys'))
 
-                            # is this a list
-                            if (type(priority_key_value) is list) and (remove_sub_list is True):
-                                check_sub_list(parsed_dict, priority_key, priority_key_value)
+    # Indent string for output
+    return_str = u"\n".join((space_indent * u" ") + i for i in data_str.splitlines())
 
-                            # is this a dict
-                            elif (type(priority_key_value) is dict) and (remove_sub_dict is True):
-                                check_sub_dict(parsed_dict, priority_key, priority_key_value)
+    if trailing_newline:
+        return return_str + u'\n'
+    else:
+        return return_str
 
-                            else:
-                                # other key, just add
-                                parsed_dict[get_pretty_name(priority_key)] = get_pretty_name(
-                                    get_pretty_data(priority_key, priority_key_value))
 
-                    else:
-                        # no exclude list and not dict or list
-                        # is this a list
-                        if (type(priority_key_value) is list) and (remove_sub_list is True):
-                            check_sub_list(parsed_dict, priority_key, priority_key_value)
-
-                        # is this a dict
-                        elif (type(priority_key_value) is dict) and (remove_sub_dict is True):
-                            check_sub_dict(parsed_dict, priority_key, priority_key_value)
-
-                        else:
-                            # other key, just add
-                            parsed_dict[get_pretty_name(priority_key)] = get_pretty_name(
-                                get_pretty_data(priority_key, priority_key_value))
-
-                    # Pop the key out of the dictionary. Remaining keys will be sorted after priority ones.
-                    listline.pop(priority_key)
-                else:
-                    # There is no value for this key. Add a blank to preserve spot in the desplay list
-                    # (cover case of blank spot in first value):
-                    parsed_dict[get_pretty_name(priority_key)] = ' '
-
-        # Sort remaining keys not in priority orderlist (or all if orderlist is none). Inserted as found.
-        for k, v in listline.items():
+def table_cell_type(value):
+    """
+    Column type rank of a table cell, as tabulate deduces it: the least generic of empty, bool, int, float, text.
+    :param value: Cell value
+    :return: One of TABLE_CELL_EMPTY, TABLE_CELL_BOOL, TABLE_CELL_INT, TABLE_CELL_FLOAT, TABLE_CELL_TEXT
+    """
+    if value is None or (isinstance(value, str) and not value):
+        return TABLE_CELL_EMPTY
+    elif hasattr(value, 'isoformat'):
+        return TABLE_CELL_TEXT
+    elif type(value) is bool or (isinstance(value, str) and value in ('True', 'False')):
+        return TABLE_CELL_BOOL
+    elif type(value) is int or (isinstance(value, str) and string_can_be_int(value)):
+        return TABLE_CELL_INT
+    elif isinstance(value, str) and TABLE_THOUSANDS_NUMBER_REGEX.match(value):
+        return TABLE_CELL_INT if '.' not in value else TABLE_CELL_FLOAT
+    try:
+        float_value = float(value)
+    except (TypeError, ValueError):
+        return TABLE_CELL_TEXT
+    if isinstance(value, str) and (math.isinf(float_value) or math.isnan(float_value)) and \
+            value.lower() not in ('inf', '-inf', 'nan'):
+        # overflows, eg "1e999", aren't numbers.
+        return TABLE_CELL_TEXT
+    return TABLE_CELL_FLOAT
 
-            if excludelist is not None:
-                # there is a regex exclude list, check if key matches
-                is_in_excludelist = False
 
-                for regexstr in excludelist:
-                    if re.search(regexstr, k):
-                        # matched exclude list
-                        is_in_excludelist = True
+def table_cell_text(value, float_format=False):
+    """
+    :param value: Cell value
+    :param float_format: Boolean - format as a float column value ('g')
+    :return: Cell text
+    """
+    if value is None or (isinstance(value, str) and not value):
+        return u''
+    if float_format:
+        if isinstance(value, str):
+            # thousands separators, as tabulate.
+            value = value.replace(',', '')
+        try:
+            return format(float(value), 'g')
+        except (TypeError, ValueError):
+            pass
+    return u"{0}".format(value)
 
-                if not is_in_excludelist:
-                    # Not in exclude list, add to output, 'prettyfiying' data as needed.
-                    # logger.debug('name = {0}, pretty_name = {1}'.format(k, get_pretty_name(k)))
 
-                    # is this a list
-                    if (type(v) is list) and (remove_sub_list is True):
-                        check_sub_list(parsed_dict, k, v)
+def table_cell_decimals(text):
+    """
+    :param text: Numeric cell text
+    :return: Characters after the decimal point (or exponent), -1 if none.
+    """
+    if table_cell_type(text) != TABLE_CELL_FLOAT:
+        return -1
+    position = text.rfind('.')
+    if position < 0:
+        position = text.lower().rfind('e')
+    return len(text) - position - 1 if position >= 0 else -1
 
-                    # is this a dict
-                    elif (type(v) is dict) and (remove_sub_dict is True):
-                        check_sub_dict(parsed_dict, k, v)
 
-                    else:
-                        # other key, just add.
-                        parsed_dict[get_pretty_name(k)] = get_pretty_name(get_pretty_data(k, v))
-            else:
-                # no exclude list and not dict or list
-                # logger.debug('name = {0}, pretty_name = {1}'.format(k, get_pretty_name(k)))
+def table_text_is_plain(text):
+    """
+    :param text: Cell text
+    :return: Boolean, True if printable ASCII, which stream_table_output lays out itself. Anything else
+             (multi-line, wide or escape coded text) goes through table_output.
+    """
+    return TABLE_PLAIN_TEXT_REGEX.match(text) is not None
 
-                # is this a list
-                if (type(v) is list) and (remove_sub_list is True):
-                    check_sub_list(parsed_dict, k, v)
 
-                # is this a dict
-                elif (type(v) is dict) and (remove_sub_dict is True):
-                    check_sub_dict(parsed_dict, k, v)
+class TableColumn(object):
+    """
+    Running type and widths of a stream_table_output column. Widths are kept for both the text and the numeric
+    alignment, as the column type is only known once every row is seen.
+    """
 
-                # other key, just add
-                else:
-                    parsed_dict[get_pretty_name(k)] = get_pretty_name(get_pretty_data(k, v))
-        # add parsed dictionary to output
-        output_list.append(parsed_dict)
+    def __init__(self, header):
+        """
+        :param header: Column header text
+        """
+        self.header = header
+        self.type = TABLE_CELL_BOOL
+        # left aligned (stripped) text width
+        self.text_width = 0
+        # right aligned text width (int columns)
+        self.int_width = 0
+        # float columns are aligned on the decimal point: widest text before it, and most decimals. Rows missing
+        # the column are blank cells, which never widen it.
+        self.float_width = 0
+        self.float_decimals = -1
+        self.width = len(header) + 2
+        # False once a cell (or the header) isn't plain text, see table_text_is_plain.
+        self.plain = table_text_is_plain(header)
+
+    def add(self, value):
+        """
+        Account for one cell of the column.
+        :param value: Cell value
+        :return: None
+        """
+        self.type = max(self.type, table_cell_type(value))
+        text = table_cell_text(value)
+        if self.plain and not table_text_is_plain(text):
+            self.plain = False
+        self.text_width = max(self.text_width, len(text.strip()))
+        self.int_width = max(self.int_width, len(text))
+        if self.type <= TABLE_CELL_FLOAT:
+            text = table_cell_text(value, float_format=True)
+            decimals = table_cell_decimals(text)
+            self.float_width = max(self.float_width, len(text) - decimals)
+            self.float_decimals = max(self.float_decimals, decimals)
+
+    def finish(self):
+        """
+        Set the column width once every row is seen.
+        :return: None
+        """
+        if self.type == TABLE_CELL_INT:
+            self.width = max(self.width, self.int_width)
+        elif self.type == TABLE_CELL_FLOAT:
+            self.width = max(self.width, self.float_width + self.float_decimals)
+        else:
+            self.width = max(self.width, self.text_width)
+
+    def render_header(self):
+        """
+        :return: Header text padded to the column width
+        """
+        if self.type in (TABLE_CELL_INT, TABLE_CELL_FLOAT):
+            return self.header.rjust(self.width)
+        return self.header.ljust(self.width)
+
+    def render(self, value):
+        """
+        :param value: Cell value
+        :return: Cell text padded to the column width
+        """
+        if self.type == TABLE_CELL_INT:
+            return table_cell_text(value).rjust(self.width)
+        elif self.type == TABLE_CELL_FLOAT:
+            text = table_cell_text(value, float_format=True)
+            return (text + u" " * (self.float_decimals - table_cell_decimals(text))).rjust(self.width)
+        return table_cell_text(value).strip().ljust(self.width)
+
+
+def stream_table_output(data, excludelist=None, orderlist=None, remove_sub_dict=True, remove_sub_list=True,
+                        space_indent=4, filters_enabled=True):
+    """
+    Format raw API JSON into a table one line at a time, for tables too large to build in memory. Same arguments
+    and layout as table_output (tabulate's "simple" format), but rows are parsed twice instead of held: a first
+    pass finds the columns, their types and widths, the second yields the lines. Tables with cells that aren't
+    plain text (see table_text_is_plain) are built in memory by table_output instead.
+    :param data: List of Dictionaries (iterated twice)
+    :param excludelist: List of REGEX expressions to match items to supress, or an ExcludeFilter
+    :param orderlist: List of items that should be ordered first.
+    :param remove_sub_dict: Boolean - remove sub dictionaries from table (almost always should be true)
+    :param remove_sub_list: Boolean - remove sub Lists from table (almost always should be true)
+    :param space_indent: spaces to indent output lines (default 4 if not specified)
+    :return: generator of lines, without line endings
+    """
 
-    # Make initial output string
-    data_str = str(tabulate.tabulate(output_list, headers='keys'))
+    # handle empty list
+    if not data:
+        logger.debug('stream_table_output - got empty list')
+        yield u"\tNo results found."
+        return
 
-    # Indent string for output
-    return_str = u"\n".join((space_indent * u" ") + i for i in data_str.splitlines())
+    # Check for debug override of excluding variables in output.
+    if not filters_enabled:
+        excludelist = None
+    excludelist = compile_excludelist(excludelist)
 
-    if trailing_newline:
-        return return_str + u'\n'
-    else:
-        return return_str
+    # first pass, columns in order of first appearance.
+    columns = OrderedDict()
+    for listline in data:
+        for key, value in table_row(listline, excludelist, orderlist, remove_sub_dict, remove_sub_list).items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = TableColumn(u"{0}".format(key))
+            column.add(value)
+    if not columns:
+        # every key excluded, an empty table.
+        yield u""
+        return
+
+    if not all(column.plain for column in columns.values()):
+        logger.debug('stream_table_output - text needs tabulate, using table_output')
+        for line in table_output(data, excludelist, orderlist, remove_sub_dict, remove_sub_list, space_indent,
+                                 trailing_newline=False).split(u'\n'):
+            yield line
+        return
+
+    indent = space_indent * u" "
+    column_list = list(columns.items())
+    for _, column in column_list:
+        column.finish()
+
+    yield indent + u"  ".join(column.render_header() for _, column in column_list).rstrip()
+    yield indent + u"  ".join(u"-" * column.width for _, column in column_list)
+
+    # second pass, one line per row. A blank last row is dropped, as table_output's splitlines() does.
+    line = None
+    for listline in data:
+        if line is not None:
+            yield indent + line
+        row = table_row(listline, excludelist, orderlist, remove_sub_dict, remove_sub_list)
+        line = u"  ".join(column.render(row.get(key)) for key, column in column_list).rstrip()
+    if line:
+        yield indent + line
 
 
 def hierarchy_output(data, excludelist=None, orderlist=None, remove_sub_dict=False, remove_sub_list=False,
                      space_indent=0, trailing_newline=True, no_indent_first=False, filters_enabled=True):
     """
-    Function to print DICT data as a text hierarchy instead of JSON-style.
+    Function to print DICT data as a text hierarchy instead of JSON-style. data is not modified.
     :param data:
     :return:
     """
 
     logger.debug("hierarchy_output start: ")
-    data_str = u''
-    left_indent = space_indent + 4
 
     # Check for debug override of excluding variables in output.
     if not filters_enabled:
         excludelist = None
+    excludelist = compile_excludelist(excludelist)
+
+    # fragments are appended to one buffer through the whole recursion, and joined once.
+    output = []
+    emit_hierarchy(output, data, excludelist=excludelist, orderlist=orderlist, remove_sub_dict=remove_sub_dict,
+                   remove_sub_list=remove_sub_list, space_indent=space_indent, trailing_newline=trailing_newline,
+                   no_indent_first=no_indent_first)
+    return u''.join(output)
+
+
+def emit_hierarchy(output, data, excludelist=None, orderlist=None, remove_sub_dict=False, remove_sub_list=False,
+                   space_indent=0, trailing_newline=True, no_indent_first=False):
+    """
+    Append the hierarchy_output text fragments for data to output. data is not modified.
+    :param output: list the text fragments are appended to
+    :param data: dict, list or string to output
+    :param excludelist: ExcludeFilter or None
+    :return: None
+    """
+    left_indent = space_indent + 4
 
     if type(data) is dict:
         # Figure out the largest key value:
         colon_indent = 0
         parsed_dict = OrderedDict({})
+        ordered_keys = set()
 
         if orderlist is not None:
             # ordering list exists
             for priority_key in orderlist:
                 # for each priority key, insert if exists.
                 priority_key_value = data.get(priority_key, None)
-                if priority_key in data:
+                if priority_key in data and priority_key not in ordered_keys:
                     logger.debug('got priority key: {0}'.format(priority_key))
 
                     if excludelist is not None:
                         # there is a regex exclude list, check if key matches
-                        is_in_excludelist = False
-
-                        for regexstr in excludelist:
-                            if re.search(regexstr, priority_key):
-                                # matched exclude list
-                                is_in_excludelist = True
-
-                        if not is_in_excludelist:
+                        if not excludelist.excludes(priority_key):
                             # Not in exclude list, add to output
                             parsed_dict[priority_key] = priority_key_value
                             if len(get_pretty_name(priority_key)) > colon_indent:
@@ -872,8 +1169,8 @@ def hierarchy_output(data, excludelist=None, orderlist=None, remove_sub_dict=Fal
                         if len(get_pretty_name(priority_key)) > colon_indent:
                             colon_indent = len(get_pretty_name(priority_key))
 
-                    # Pop the key out of the dictionary. Remaining keys will be sorted after priority ones.
-                    data.pop(priority_key)
+                    # Remaining keys will be sorted after priority ones.
+                    ordered_keys.add(priority_key)
 
                 # else:
                 #     # There is no value for this key. Add a blank to preserve spot in the dIsplay list
@@ -882,20 +1179,11 @@ def hierarchy_output(data, excludelist=None, orderlist=None, remove_sub_dict=Fal
 
         # pre-parse data (if dict) to get key lengths and exclude excludelist items.
         for key, value in data.items():
+            if key in ordered_keys:
+                continue
             if excludelist is not None:
                 # there is a regex exclude list, check if key matches
-                is_in_excludelist = False
-                for regexstr in excludelist:
-                    # check all regex patterns against key.
-                    if re.search(regexstr, key):
-                        # matched exclude list, delete key
-                        # print "\nmatch!\n" + key + "\n"
-                        # del data[key]
-                        is_in_excludelist = True
-                        # don't keep doing loop if we delete key.
-                        # break
-
-                if not is_in_excludelist:
+                if not excludelist.excludes(key):
                     parsed_dict[key] = value
                     if len(get_pretty_name(key)) > colon_indent:
                         colon_indent = len(get_pretty_name(key))
@@ -916,18 +1204,18 @@ def hierarchy_output(data, excludelist=None, orderlist=None, remove_sub_dict=Fal
                 if no_indent_first:
                     # Remove left indent if set, and clear no_indent_first.
                     # print (key_indent * " ") + get_pretty_name(key) + ":",
-                    data_str += str(key_indent * " ") + get_pretty_name(key) + ": "
+                    output.append(str(key_indent * " ") + get_pretty_name(key) + ": ")
                     no_indent_first = False
                 else:
                     # print (left_indent * " ") + (key_indent * " ") + get_pretty_name(key) + ":",
-                    data_str += str(left_indent * " ") + str(key_indent * " ") + get_pretty_name(key) + ": "
+                    output.append(str(left_indent * " ") + str(key_indent * " ") + get_pretty_name(key) + ": ")
 
                 # recurse back into function, move indent to one space right of colon.
-                data_str += hierarchy_output(value, excludelist=excludelist, orderlist=orderlist,
-                                             remove_sub_dict=remove_sub_dict,
-                                             remove_sub_list=remove_sub_list,
-                                             space_indent=(left_indent + colon_indent + 2 - 4),
-                                             trailing_newline=True, no_indent_first=True)
+                emit_hierarchy(output, value, excludelist=excludelist, orderlist=orderlist,
+                               remove_sub_dict=remove_sub_dict,
+                               remove_sub_list=remove_sub_list,
+                               space_indent=(left_indent + colon_indent + 2 - 4),
+                               trailing_newline=True, no_indent_first=True)
             elif type(value) is list:
                 # pass
                 key_indent = colon_indent - len(get_pretty_name(key))
@@ -935,30 +1223,30 @@ def hierarchy_output(data, excludelist=None, orderlist=None, remove_sub_dict=Fal
                 if no_indent_first:
                     # Remove left indent if set, and clear no_indent_first.
                     # print (key_indent * " ") + get_pretty_name(key) + ":",
-                    data_str += str(key_indent * " ") + get_pretty_name(key) + ": "
+                    output.append(str(key_indent * " ") + get_pretty_name(key) + ": ")
                     no_indent_first = False
                 else:
                     # print (left_indent * " ") + (key_indent * " ") + get_pretty_name(key) + ":",
-                    data_str += str(left_indent * " ") + str(key_indent * " ") + get_pretty_name(key) + ": "
+                    output.append(str(left_indent * " ") + str(key_indent * " ") + get_pretty_name(key) + ": ")
 
                 # recurse back into function, move indent to one space right of colon.
-                data_str += hierarchy_output(value, excludelist=excludelist, orderlist=orderlist,
-                                             remove_sub_dict=remove_sub_dict,
-                                             remove_sub_list=remove_sub_list,
-                                             space_indent=(left_indent + colon_indent + 2 - 4),
-                                             trailing_newline=False, no_indent_first=True)
+                emit_hierarchy(output, value, excludelist=excludelist, orderlist=orderlist,
+                               remove_sub_dict=remove_sub_dict,
+                               remove_sub_list=remove_sub_list,
+                               space_indent=(left_indent + colon_indent + 2 - 4),
+                               trailing_newline=False, no_indent_first=True)
             else:
                 key_indent = colon_indent - len(get_pretty_name(key))
                 if no_indent_first:
                     # Remove left indent if set, and clear no_indent_first.
                     # print (key_indent * " ") + get_pretty_name(key) + ": " + str(value)
-                    data_str += str(key_indent * " ") + get_pretty_name(key) + ": " + str(value) + u'\n'
+                    output.append(str(key_indent * " ") + get_pretty_name(key) + ": " + str(value) + u'\n')
                     no_indent_first = False
                 else:
                     # print (left_indent * " ") + (key_indent * " ") + get_pretty_name(key) + ": " + \
                     #      get_pretty_data(key, str(value))
-                    data_str += str(left_indent * " ") + str(key_indent * " ") + get_pretty_name(key) + ": " + \
-                                get_pretty_data(key, str(value)) + u'\n'
+                    output.append(str(left_indent * " ") + str(key_indent * " ") + get_pretty_name(key) + ": " +
+                                  get_pretty_data(key, str(value)) + u'\n')
 
     elif type(data) is list and len(data) > 1:
         # print a \n, seperated list.
@@ -968,46 +1256,46 @@ def hierarchy_output(data, excludelist=None, orderlist=None, remove_sub_dict=Fal
             if type(item) is dict:
                 # recurse back into function
                 if no_indent_first:
-                    data_str += hierarchy_output(item, excludelist=excludelist, orderlist=orderlist,
-                                                 remove_sub_dict=remove_sub_dict,
-                                                 remove_sub_list=remove_sub_list, space_indent=(left_indent - 4),
-                                                 trailing_newline=True, no_indent_first=no_indent_first)
+                    emit_hierarchy(output, item, excludelist=excludelist, orderlist=orderlist,
+                                   remove_sub_dict=remove_sub_dict,
+                                   remove_sub_list=remove_sub_list, space_indent=(left_indent - 4),
+                                   trailing_newline=True, no_indent_first=no_indent_first)
                     no_indent_first = False
                 else:
-                    data_str += hierarchy_output(item, excludelist=excludelist, orderlist=orderlist,
-                                                 remove_sub_dict=remove_sub_dict,
-                                                 remove_sub_list=remove_sub_list, space_indent=(left_indent - 4),
-                                                 trailing_newline=True)
+                    emit_hierarchy(output, item, excludelist=excludelist, orderlist=orderlist,
+                                   remove_sub_dict=remove_sub_dict,
+                                   remove_sub_list=remove_sub_list, space_indent=(left_indent - 4),
+                                   trailing_newline=True)
             elif type(item) is list:
-                data_str += hierarchy_output(item, excludelist=excludelist, orderlist=orderlist,
-                                             remove_sub_dict=remove_sub_dict,
-                                             remove_sub_list=remove_sub_list, space_indent=(left_indent - 4),
-                                             trailing_newline=True, no_indent_first=no_indent_first)
+                emit_hierarchy(output, item, excludelist=excludelist, orderlist=orderlist,
+                               remove_sub_dict=remove_sub_dict,
+                               remove_sub_list=remove_sub_list, space_indent=(left_indent - 4),
+                               trailing_newline=True, no_indent_first=no_indent_first)
             elif type(item) is list:
                 # recurse back into function
                 if no_indent_first:
-                    data_str += hierarchy_output(item, excludelist=excludelist, orderlist=orderlist,
-                                                 remove_sub_dict=remove_sub_dict,
-                                                 remove_sub_list=remove_sub_list, space_indent=(left_indent - 4),
-                                                 trailing_newline=False, no_indent_first=no_indent_first)
+                    emit_hierarchy(output, item, excludelist=excludelist, orderlist=orderlist,
+                                   remove_sub_dict=remove_sub_dict,
+                                   remove_sub_list=remove_sub_list, space_indent=(left_indent - 4),
+                                   trailing_newline=False, no_indent_first=no_indent_first)
                     no_indent_first = False
                 else:
-                    data_str += hierarchy_output(item, excludelist=excludelist, orderlist=orderlist,
-                                                 remove_sub_dict=remove_sub_dict,
-                                                 remove_sub_list=remove_sub_list, space_indent=(left_indent - 4),
-                                                 trailing_newline=False)
+                    emit_hierarchy(output, item, excludelist=excludelist, orderlist=orderlist,
+                                   remove_sub_dict=remove_sub_dict,
+                                   remove_sub_list=remove_sub_list, space_indent=(left_indent - 4),
+                                   trailing_newline=False)
             else:
                 if no_indent_first:
                     # Remove left indent if set, and clear no_indent_first.
                     # print str(item) + ","
-                    data_str += str(item) + u",\n"
+                    output.append(str(item) + u",\n")
                     no_indent_first = False
                 elif index == end_data:
                     # print (left_indent * " ") + str(item) + ","
-                    data_str += str(left_indent * " ") + str(item) + u"\n"
+                    output.append(str(left_indent * " ") + str(item) + u"\n")
                 else:
                     # print (left_indent * " ") + str(item) + ","
-                    data_str += str(left_indent * " ") + str(item) + u",\n"
+                    output.append(str(left_indent * " ") + str(item) + u",\n")
 
     elif type(data) is list and len(data) == 1:
         # print a flat list.
@@ -1015,42 +1303,40 @@ def hierarchy_output(data, excludelist=None, orderlist=None, remove_sub_dict=Fal
             # act on values of each data
             if type(item) is dict:
                 # recurse back into function
-                data_str += hierarchy_output(item, excludelist=excludelist, orderlist=orderlist,
-                                             remove_sub_dict=remove_sub_dict,
-                                             remove_sub_list=remove_sub_list, space_indent=(left_indent - 4),
-                                             trailing_newline=True, no_indent_first=no_indent_first)
+                emit_hierarchy(output, item, excludelist=excludelist, orderlist=orderlist,
+                               remove_sub_dict=remove_sub_dict,
+                               remove_sub_list=remove_sub_list, space_indent=(left_indent - 4),
+                               trailing_newline=True, no_indent_first=no_indent_first)
             elif type(item) is list:
                 # recurse back into function
-                data_str += hierarchy_output(item, excludelist=excludelist, orderlist=orderlist,
-                                             remove_sub_dict=remove_sub_dict,
-                                             remove_sub_list=remove_sub_list, space_indent=(left_indent - 4),
-                                             trailing_newline=False, no_indent_first=no_indent_first)
+                emit_hierarchy(output, item, excludelist=excludelist, orderlist=orderlist,
+                               remove_sub_dict=remove_sub_dict,
+                               remove_sub_list=remove_sub_list, space_indent=(left_indent - 4),
+                               trailing_newline=False, no_indent_first=no_indent_first)
             else:
                 if no_indent_first:
                     # Remove left indent if set, and clear no_indent_first.
                     # print str(item)
-                    data_str += str(item) + u'\n'
+                    output.append(str(item) + u'\n')
                     no_indent_first = False
                 else:
                     # print (left_indent * " ") + str(item)
-                    data_str += str(left_indent * " ") + str(item) + u'\n'
+                    output.append(str(left_indent * " ") + str(item) + u'\n')
 
     elif type(data) is list and len(data) < 1:
         if no_indent_first:
             # Remove left indent if set, and clear no_indent_first.
             # print "None"
-            data_str += u"None" + u'\n'
+            output.append(u"None" + u'\n')
             no_indent_first = False
         else:
             # print (left_indent * " ") + "None"
-            data_str += str(left_indent * " ") + u"None" + u'\n'
+            output.append(str(left_indent * " ") + u"None" + u'\n')
 
     else:
         # print data
-        data_str += data + u'\n'
+        output.append(data + u'\n')
 
     if trailing_newline:
         # print ""
-        data_str += u'\n'
-
-    return data_str
+        output.append(u'\n')
@@ -0,0 +1,204 @@
+# -*- coding: UTF-8 -*-
+# standard modules
+import logging
+from collections import defaultdict, namedtuple, Counter
+
+from fuzzywuzzy import fuzz, process, utils
+
+logger = logging.getLogger(__name__)
+
+# n-gram size for the candidate index.
+NGRAM_SIZE = 3
+
+# Number of candidates scored first per query, their best score is the bar every other name must be able to reach.
+SHORTLIST_SIZE = 32
+
+# An exact (normalized) match is returned right away for queries shorter than this. From this length on, a different
+# name can round to a WRatio of 100 as well, and extractOne returns the first one.
+EXACT_MATCH_MAX_LENGTH = 100
+
+# Character counts of the strings WRatio compares, for wratio_bound.
+NameProfile = namedtuple('NameProfile', ['length', 'chars', 'sorted_length', 'sorted_chars', 'tokens', 'set_length',
+                                         'set_chars'])
+
+
+def normalize(name):
+    """
+    Normalize a name the same way fuzzywuzzy extractOne does before WRatio scoring.
+    :param name: String
+    :return: Normalized string
+    """
+    return utils.full_process(utils.full_process(name), force_ascii=True)
+
+
+def ngrams(processed_string, size=NGRAM_SIZE):
+    """
+    Get the set of character n-grams for an already processed (see normalize) string.
+    :param processed_string: Normalized string
+    :param size: n-gram size
+    :return: set of n-gram strings
+    """
+    padded = u" " + processed_string + u" "
+    return set(padded[i:i + size] for i in range(max(len(padded) - size + 1, 0)))
+
+
+def name_profile(processed_string):
+    """
+    Get the character counts of the strings WRatio builds from a processed (see normalize) string: the string
+    itself, its tokens sorted (token_sort_ratio) and its unique tokens sorted (token_set_ratio).
+    :param processed_string: Normalized string
+    :return: NameProfile
+    """
+    tokens = processed_string.split()
+    sorted_string = u" ".join(sorted(tokens))
+    set_string = u" ".join(sorted(set(tokens)))
+    return NameProfile(len(processed_string), Counter(processed_string), len(sorted_string), Counter(sorted_string),
+                       set(tokens), len(set_string), Counter(set_string))
+
+
+def overlap(chars1, chars2):
+    """
+    :param chars1: Counter of characters
+    :param chars2: Counter of characters
+    :return: Number of characters in common, the most SequenceMatcher can match.
+    """
+    if len(chars1) > len(chars2):
+        chars1, chars2 = chars2, chars1
+    return sum(min(count, chars2[char]) for char, count in chars1.items() if char in chars2)
+
+
+def ratio_bound(common, length1, length2):
+    """
+    :return: Upper bound of fuzz.ratio for two strings with `common` characters in common.
+    """
+    return utils.intr(100 * (2.0 * common / (length1 + length2)))
+
+
+def partial_ratio_bound(common, length1, length2):
+    """
+    :return: Upper bound of fuzz.partial_ratio for two strings with `common` characters in common. The shorter
+             string is compared to windows of the longer one, at best a window holding all the common characters.
+    """
+    if not common:
+        return 0
+    return utils.intr(100 * (2.0 * common / (min(length1, length2) + common)))
+
+
+def wratio_bound(profile1, profile2):
+    """
+    Upper bound of fuzz.WRatio for two processed strings, from character counts only. Follows WRatio step by
+    step, with each ratio replaced by its bound.
+    :param profile1: NameProfile
+    :param profile2: NameProfile
+    :return: Int 0-100
+    """
+    if not profile1.length or not profile2.length:
+        return 0
+
+    base = ratio_bound(overlap(profile1.chars, profile2.chars), profile1.length, profile2.length)
+    len_ratio = float(max(profile1.length, profile2.length)) / min(profile1.length, profile2.length)
+    # token_set_ratio compares the unique tokens when none are shared, otherwise it can reach 100.
+    shared_tokens = not profile1.tokens.isdisjoint(profile2.tokens)
+
+    if len_ratio < 1.5:
+        bound = ratio_bound
+        scale = 1.0
+    else:
+        bound = partial_ratio_bound
+        scale = .6 if len_ratio > 8 else .9
+        base = max(base, bound(overlap(profile1.chars, profile2.chars), profile1.length, profile2.length) * scale)
+
+    token_sort = bound(overlap(profile1.sorted_chars, profile2.sorted_chars), profile1.sorted_length,
+                       profile2.sorted_length)
+    token_set = 100 if shared_tokens else bound(overlap(profile1.set_chars, profile2.set_chars),
+                                                profile1.set_length, profile2.set_length)
+    return utils.intr(max(base, token_sort * .95 * scale, token_set * .95 * scale))
+
+
+class NameMatcher(object):
+    """
+    Fuzzy name lookup over a fixed list of names. Same results and scores as
+    fuzzywuzzy `process.extractOne(query, names)` (WRatio, first best name wins), but names are normalized once,
+    and only names whose WRatio upper bound (wratio_bound) can reach the best score so far are scored. The names
+    sharing the most n-grams with the query are scored first to set that bar. Build a new instance when the name
+    list changes.
+    """
+
+    def __init__(self, names, shortlist_size=SHORTLIST_SIZE):
+        """
+        :param names: Iterable of names
+        :param shortlist_size: Number of candidates scored first per query.
+        """
+        self.names = list(names)
+        self.normalized = [normalize(name) for name in self.names]
+        self.profiles = [name_profile(processed) for processed in self.normalized]
+        self.shortlist_size = shortlist_size
+        # normalized name -> first index, for exact (100) matches.
+        self.exact = {}
+        # n-gram -> list of name indexes
+        self.index = defaultdict(list)
+
+        for name_index, processed in enumerate(self.normalized):
+            if processed not in self.exact:
+                self.exact[processed] = name_index
+            for gram in ngrams(processed):
+                self.index[gram].append(name_index)
+
+    def shortlist(self, processed_query):
+        """
+        Get the indexes of the names sharing the most n-grams with the query, in original name order.
+        :param processed_query: Normalized query string
+        :return: list of name indexes
+        """
+        counts = defaultdict(int)
+        for gram in ngrams(processed_query):
+            for name_index in self.index.get(gram, []):
+                counts[name_index] += 1
+
+        best = sorted(counts, key=lambda name_index: (-counts[name_index], name_index))[:self.shortlist_size]
+        return sorted(best)
+
+    def extract_one(self, query):
+        """
+        Find the best matching name for a query.
+        :param query: Query string
+        :return: Tuple of (best name, score 0-100). (None, 0) if there are no names.
+        """
+        if not self.names:
+            return None, 0
+
+        processed_query = normalize(query)
+        if not processed_query:
+            # every name scores 0, leave it to extractOne.
+            return process.extractOne(query, self.names)
+
+        # exact normalized match always scores 100, and extractOne returns the first one.
+        exact_index = self.exact.get(processed_query)
+        if exact_index is not None and len(processed_query) < EXACT_MATCH_MAX_LENGTH:
+            return self.names[exact_index], 100
+
+        best_index, best_score = (exact_index, 100) if exact_index is not None else (None, -1)
+
+        def score(name_index):
+            return fuzz.WRatio(processed_query, self.normalized[name_index], full_process=False)
+
+        candidates = self.shortlist(processed_query)
+        for name_index in candidates:
+            name_score = score(name_index)
+            if name_score > best_score or (name_score == best_score and name_index < best_index):
+                best_index, best_score = name_index, name_score
+
+        # every other name, unless it can't beat the best (or tie it from an earlier position).
+        query_profile = name_profile(processed_query)
+        shortlisted = set(candidates)
+        for name_index, profile in enumerate(self.profiles):
+            if name_index in shortlisted:
+                continue
+            bound = wratio_bound(query_profile, profile)
+            if bound < best_score or (bound == best_score and name_index > best_index):
+                continue
+            name_score = score(name_index)
+            if name_score > best_score or (name_score == best_score and name_index < best_index):
+                best_index, best_score = name_index, name_score
+
+        return self.names[best_index], best_score
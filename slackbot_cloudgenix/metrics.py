@@ -2,183 +2,540 @@
 # standard modules
 import logging
 import json
-import pandas as pd
+import re
+import time
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from collections import namedtuple, OrderedDict
+from functools import partial
+
+from .cache import TTLCache
+from .stats import summarize, bandwidth_stats
+from .timeseries import SeriesStore, parse_metrics_time
 
 logger = logging.getLogger(__name__)
 
 
-#
-# def get_bw_metrics(passed_site_id, passed_link_id=None, sdk, id2n):
-#
-#     logger.info('get_bw_metrics start: ')
-#
-#     metrics_query = {
-#         "start_time": "2016-11-16T17:06:27.141Z",
-#         "end_time": "2016-11-17T17:06:27.141Z",
-#         "interval": "5min",
-#         "metrics": [
-#             {
-#                 "statistics": [
-#                     "average"
-#                 ],
-#                 "name": "BandwidthUsage",
-#                 "unit": "Mbps"
-#             },
-#             {
-#                 "statistics": [
-#                     "average"
-#                 ],
-#                 "name": "PathCapacity",
-#                 "unit": "Mbps"
-#             },
-#         ],
-#         "filter": {
-#             "path": [
-#                 "14643839952690003"
-#             ],
-#             "site": [
-#                 "14643839950050237"
-#             ],
-#         },
-#         "view": {
-#             "individual": "direction",
-#             "summary": False
-#         }
-#     }
-#
-#     status, metrics = sdk.get_metrics(metrics_query, sdk_vars=sdk_vars)
-#
-#     return json.dumps(metrics)
-
-
-def apprt_site_app_path_summary(app_id, site_id, path_id, sdk, id2n):
+# Max paths per batched metrics query.
+METRICS_PATH_BATCH_SIZE = 50
+
+# Max concurrent metrics queries per command.
+METRICS_WORKERS = 4
+
+# Seconds a command waits for all of its metrics queries.
+METRICS_DEADLINE = 20
+
+# Added to a path's text when its stats did not come back in time.
+STATS_UNAVAILABLE_MSG = "\n _Stats unavailable (timed out)._\n"
+MOS_UNAVAILABLE_MSG = " _MOS unavailable (timed out)._\n"
+
+# API interval -> (bucket seconds, longest window in hours it is used for). Longer windows use coarser
+# intervals, so every window is a few hundred points at most. Query windows snap to the bucket grid so cache
+# keys repeat.
+METRICS_INTERVALS = OrderedDict([
+    ('5min', (300, 24)),
+    ('1hour', (3600, 168)),
+    ('1day', (86400, 720)),
+])
+
+# Named summary windows (as typed in commands) -> hours.
+METRICS_WINDOWS = OrderedDict([
+    ('1h', 1),
+    ('24h', 24),
+    ('7d', 168),
+    ('30d', 720),
+])
+
+DEFAULT_METRICS_WINDOW = '24h'
+
+# Other ways of typing the named windows.
+METRICS_WINDOW_ALIASES = {
+    'hour': '1h',
+    '1hour': '1h',
+    '60m': '1h',
+    'day': '24h',
+    '1day': '24h',
+    '1d': '24h',
+    'week': '7d',
+    '1week': '7d',
+    '1w': '7d',
+    '168h': '7d',
+    'month': '30d',
+    '1month': '30d',
+}
+
+# Trailing window in a command, eg "<site> for 7d", "<site> over the last week", "<site> last 1h".
+METRICS_WINDOW_REGEX = re.compile(r'^(.*?)\s+(?:(?:for|over|in)\s+)?(?:the\s+)?(?:(?:last|past)\s+)?(\d*\s*[a-z]+)\s*$',
+                                  re.IGNORECASE)
+
+# Max cached metrics entries (one per path per metric set).
+METRICS_CACHE_SIZE = 2048
+
+METRICS_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+# Shared metrics response cache, entries expire when the next bucket closes.
+metrics_cache = TTLCache(maxsize=METRICS_CACHE_SIZE)
+
+# Local time-series stores, one per API interval. Summaries read from them, and only buckets newer than what they
+# hold are fetched.
+series_stores = dict((interval, SeriesStore(capacity=max_hours * 3600 // step))
+                     for interval, (step, max_hours) in METRICS_INTERVALS.items())
+
+# A metrics query time window, see metrics_window(). step is the interval in seconds.
+MetricsWindow = namedtuple('MetricsWindow', ['start_time', 'end_time', 'start_epoch', 'end_epoch', 'interval',
+                                             'step'])
+
+# How one metric is queried and shown.
+#   name: metrics API name, unit: metrics API unit, label: display label, suffix: display unit,
+#   scale: multiply values by this (None for as-is), precision: decimal places,
+#   suppress_below: hide the line if all stats are at or below this (None to always show),
+#   by_direction: add the series direction to the label.
+MetricSpec = namedtuple('MetricSpec', ['name', 'unit', 'label', 'suffix', 'scale', 'precision', 'suppress_below',
+                                       'by_direction'])
+
+METRIC_SPECS = dict((spec.name, spec) for spec in [
+    MetricSpec("AppNormalizedNetworkTransferTime", "milliseconds", "NTTn", "ms", None, 0, None, False),
+    MetricSpec("AppRoundTripTime", "milliseconds", "RTT  ", "ms", None, 0, None, False),
+    MetricSpec("AppServerResponseTime", "milliseconds", "SRT  ", "ms", None, 0, None, False),
+    MetricSpec("AppUDPTransactionResponseTime", "milliseconds", "uTRT", "ms", None, 0, None, False),
+    # Mb to Kb
+    MetricSpec("AppPerfUDPAudioBandwidth", "Mbps", "Audio BW", "kb", 1024, 2, 0.01, False),
+    MetricSpec("AppPerfUDPVideoBandwidth", "Mbps", "Video BW", "kb", 1024, 2, 0.01, False),
+    MetricSpec("AppPerfUDPAudioPacketLoss", "percentage", "Audio Packetloss", "%", None, 0, None, False),
+    MetricSpec("AppPerfUDPVideoPacketLoss", "percentage", "Video Packetloss", "%", None, 0, None, False),
+    MetricSpec("AppPerfUDPAudioJitter", "milliseconds", "Audio Jitter", "ms", None, 0, None, False),
+    MetricSpec("AppPerfUDPVideoJitter", "milliseconds", "Video Jitter", "ms", None, 0, None, False),
+    MetricSpec("AppAudioMos", "count", "Audio MOS", "", None, 2, None, True),
+    MetricSpec("BandwidthUsage", "Mbps", "Bandwidth", "Mbps", None, 2, None, True),
+    MetricSpec("PathCapacity", "Mbps", "Capacity", "Mbps", None, 2, None, True),
+])
+
+# Metric sets, in query (and display) order.
+APPRT_METRICS = [METRIC_SPECS[name] for name in ["AppRoundTripTime", "AppUDPTransactionResponseTime"]]
+MEDIA_METRICS = [METRIC_SPECS[name] for name in ["AppPerfUDPAudioBandwidth", "AppPerfUDPVideoPacketLoss",
+                                                 "AppPerfUDPAudioPacketLoss", "AppPerfUDPVideoJitter",
+                                                 "AppPerfUDPAudioJitter", "AppPerfUDPVideoBandwidth"]]
+MOS_METRICS = [METRIC_SPECS["AppAudioMos"]]
+# Combined media query: media metrics plus MOS, filtered to one direction.
+MEDIA_MOS_METRICS = MEDIA_METRICS + MOS_METRICS
+BANDWIDTH_METRICS = [METRIC_SPECS[name] for name in ["BandwidthUsage", "PathCapacity"]]
+BANDWIDTH_DIRECTIONS = ["Ingress", "Egress"]
+
+# Label suffix for by_direction metrics.
+DIRECTION_LABELS = {
+    "Ingress": " In",
+    "Egress": " Out"
+}
+
+
+class MetricsCallCounter(object):
+    """
+    Thread safe count of metrics_monitor calls made, against a baseline of calls the original per-path queries
+    (media + MOS for every path) would have made.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.baseline = 0
+        self._lock = threading.Lock()
+
+    def add(self, calls=0, baseline=0):
+        with self._lock:
+            self.calls += calls
+            self.baseline += baseline
+
+    @property
+    def saved(self):
+        return max(self.baseline - self.calls, 0)
+
+
+# Running totals for all commands.
+media_call_totals = MetricsCallCounter()
+
+
+def chunk_list(passed_list, size):
+    """
+    Split a list into chunks of at most size items.
+    :param passed_list: list
+    :param size: max chunk size
+    :return: list of lists
+    """
+    return [passed_list[i:i + size] for i in range(0, len(passed_list), size)]
+
+
+def metrics_interval(hours):
+    """
+    Pick the API interval for a window length.
+    :param hours: Window length in hours
+    :return: interval name (key of METRICS_INTERVALS)
+    """
+    for interval, (_, max_hours) in METRICS_INTERVALS.items():
+        if hours <= max_hours:
+            return interval
+    return interval
+
+
+def metrics_window(hours=24, now=None):
+    """
+    Get a query window ending at the last closed bucket, with the interval picked by metrics_interval().
+    :param hours: Window length in hours
+    :param now: Optional - epoch seconds (default time.time())
+    :return: MetricsWindow namedtuple
+    """
+    now = time.time() if now is None else now
+    interval = metrics_interval(hours)
+    step = METRICS_INTERVALS[interval][0]
+    end_epoch = int(now // step) * step
+    start_epoch = end_epoch - int(hours * 3600)
+    return MetricsWindow(epoch_to_metrics_time(start_epoch), epoch_to_metrics_time(end_epoch), start_epoch, end_epoch,
+                         interval, step)
+
+
+def named_metrics_window(window_name=None, now=None):
+    """
+    Get a query window for a named window (see METRICS_WINDOWS).
+    :param window_name: Optional - eg, '7d' (default DEFAULT_METRICS_WINDOW)
+    :param now: Optional - epoch seconds (default time.time())
+    :return: MetricsWindow namedtuple
+    """
+    return metrics_window(METRICS_WINDOWS[window_name or DEFAULT_METRICS_WINDOW], now=now)
+
+
+def split_metrics_window(text):
+    """
+    Split a trailing window off command text, eg "Branch 1 for 7d" -> ("Branch 1", "7d").
+    :param text: Command text
+    :return: Tuple of (text without the window, window name or None if there was none)
+    """
+    match = METRICS_WINDOW_REGEX.match(text)
+    if match:
+        window_token = re.sub(r'\s+', '', match.group(2)).lower()
+        window_name = METRICS_WINDOW_ALIASES.get(window_token, window_token)
+        if window_name in METRICS_WINDOWS:
+            return match.group(1), window_name
+    return text, None
+
+
+def epoch_to_metrics_time(epoch):
+    """
+    Format epoch seconds as a metrics API time string.
+    :param epoch: Epoch seconds
+    :return: time string
     """
+    return datetime.datetime.utcfromtimestamp(epoch).strftime(METRICS_TIME_FORMAT)
 
+
+def metrics_cache_key(metric_set, app_id, site_id, path_id, direction, window):
+    """
+    Build a metrics_cache key.
+    :param metric_set: Name of the metric set (eg, 'apprt', 'media', 'mos')
     :param app_id:
     :param site_id:
     :param path_id:
-    :param sdk:
-    :param id2n:
-    :return:
+    :param direction: Direction filter, or None
+    :param window: MetricsWindow from metrics_window()
+    :return: tuple key
+    """
+    return metric_set, app_id, site_id, path_id, direction, window.start_time, window.end_time
+
+
+def cached_series_by_path(metric_set, app_id, site_id, path_ids, direction, window, query):
+    """
+    Get per-path series lists for a metric set, from metrics_cache where possible. Only uncached paths are queried.
+    :param metric_set: Name of the metric set
+    :param app_id:
+    :param site_id:
+    :param path_ids: list of path IDs
+    :param direction: Direction filter, or None
+    :param window: MetricsWindow from metrics_window()
+    :param query: Callable taking a list of path IDs, returns metrics_monitor response content or None.
+    :return: dict of path ID -> list of series dicts, or None if the query failed.
+    """
+    series_by_path = {}
+    missing_path_ids = []
+    for path_id in path_ids:
+        found, series_list = metrics_cache.get(metrics_cache_key(metric_set, app_id, site_id, path_id, direction,
+                                                                 window))
+        if found:
+            series_by_path[path_id] = series_list
+        else:
+            missing_path_ids.append(path_id)
+
+    if not missing_path_ids:
+        return series_by_path
+
+    metrics_response = query(missing_path_ids)
+    if metrics_response is None:
+        return None
+
+    fetched_series = split_series_by_path(metrics_response)
+    expires = window.end_epoch + window.step
+    for path_id in missing_path_ids:
+        series_list = fetched_series.get(path_id, [])
+        metrics_cache.set(metrics_cache_key(metric_set, app_id, site_id, path_id, direction, window), series_list,
+                          expires)
+        series_by_path[path_id] = series_list
+
+    return series_by_path
+
+
+def series_store_key(metric_name, app_id, site_id, path_id, direction):
+    """
+    Build a series_stores key.
+    :return: tuple key
+    """
+    return metric_name, app_id, site_id, path_id, direction
+
+
+def fetch_series_incremental(specs, direction, app_id, site_id, path_ids, window, query):
+    """
+    Get per-path series for a list of metric specs from series_stores, fetching only from the newest stored
+    bucket on. The newest stored bucket is fetched again, as it may have filled in since. Series a fetch returned
+    nothing for are recorded as fetched too, so they resume the same way instead of fetching the whole window.
+    :param specs: list of MetricSpec
+    :param direction: Direction filter, or None
+    :param app_id:
+    :param site_id:
+    :param path_ids: list of path IDs
+    :param window: MetricsWindow from metrics_window()
+    :param query: Callable taking (list of path IDs, MetricsWindow), returns metrics_monitor response content or None.
+    :return: metrics_monitor style response content for the window, each series has 'times' (epoch seconds) and
+             'values' arrays instead of datapoints. None if a query failed.
+    """
+    series_store = series_stores[window.interval]
+    newest_bucket_epoch = window.end_epoch - window.step
+
+    # group paths by where to resume, paths fetched together get queried together again.
+    resume_groups = OrderedDict()
+    for path_id in path_ids:
+        last_times = [series_store.last_time(series_store_key(spec.name, app_id, site_id, path_id, direction))
+                      for spec in specs]
+        if None in last_times or min(last_times) < window.start_epoch:
+            resume_epoch = window.start_epoch
+        else:
+            resume_epoch = min(last_times)
+        resume_groups.setdefault(resume_epoch, []).append(path_id)
+
+    for resume_epoch, group_path_ids in resume_groups.items():
+        if resume_epoch > newest_bucket_epoch:
+            # stored past the end of this window.
+            continue
+
+        fetch_window = window._replace(start_time=epoch_to_metrics_time(resume_epoch), start_epoch=resume_epoch)
+        metrics_response = query(group_path_ids, fetch_window)
+        if metrics_response is None:
+            return None
+
+        fetched_datapoints = {}
+        for path_id, series_list in split_series_by_path(metrics_response).items():
+            for series in series_list:
+                for data in series.get('data', [])[:1]:
+                    fetched_datapoints[(series.get('name'), path_id)] = data.get('datapoints', [])
+
+        for path_id in group_path_ids:
+            for spec in specs:
+                series_store.extend(series_store_key(spec.name, app_id, site_id, path_id, direction),
+                                    fetched_datapoints.get((spec.name, path_id), []),
+                                    fetched_time=newest_bucket_epoch)
+
+    series_list = []
+    for path_id in path_ids:
+        for spec in specs:
+            points = series_store.points(series_store_key(spec.name, app_id, site_id, path_id, direction),
+                                         window.start_epoch, window.end_epoch)
+            if points is not None:
+                series_list.append({'name': spec.name, 'view': {'path': path_id}, 'times': points[0],
+                                    'values': points[1]})
+
+    return {'metrics': [{'series': series_list}]}
+
+
+def run_stats_jobs(jobs, workers=METRICS_WORKERS, deadline=METRICS_DEADLINE):
+    """
+    Run stats query jobs through a bounded thread pool, with one deadline for all of them.
+    :param jobs: list of (key, callable) tuples
+    :param workers: Max concurrent jobs
+    :param deadline: Seconds to wait for all jobs
+    :return: dict of key -> job result. Jobs that timed out or raised are not in the dict.
+    """
+    results = {}
+    if not jobs:
+        return results
+
+    end_time = time.time() + deadline
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = [(key, executor.submit(job)) for key, job in jobs]
+    for key, future in futures:
+        try:
+            results[key] = future.result(timeout=max(end_time - time.time(), 0))
+        except TimeoutError:
+            future.cancel()
+            logger.warning("Stats job {0} did not finish within {1}s.".format(key, deadline))
+        except Exception as e:
+            logger.warning("Stats job {0} failed: {1}".format(key, e))
+    # don't wait on stragglers, they finish (and are discarded) in the background.
+    executor.shutdown(wait=False)
+    return results
+
+
+def split_series_by_path(metrics_response):
+    """
+    Split a metrics response using an individual path view into per-path series lists.
+    :param metrics_response: metrics_monitor response content
+    :return: dict of path ID -> list of series dicts
+    """
+    series_by_path = {}
+    for metrics in metrics_response.get('metrics', []):
+        for series in metrics.get('series', []):
+            path_id = series.get('view', {}).get('path')
+            series_by_path.setdefault(path_id, []).append(series)
+    return series_by_path
+
+
+def build_metrics_query(specs, site_id, window, view, app_id=None, path_ids=None, direction=None):
+    """
+    Build a metrics_monitor query for a list of metric specs.
+    :param specs: list of MetricSpec
+    :param site_id:
+    :param window: MetricsWindow from metrics_window()
+    :param view: metrics API view dict (eg, {"individual": "path"})
+    :param app_id: Optional - app ID filter
+    :param path_ids: Optional - list of path IDs filter
+    :param direction: Optional - direction filter ("Ingress"/"Egress")
+    :return: metrics query dict
     """
 
-    # get time for query
-    curtime = datetime.datetime.utcnow()
-    endtime = curtime.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-    starttime = (curtime - datetime.timedelta(hours=24)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-
-    metrics_query = {
-        "end_time": endtime,  # "2016-11-18T17:21:52.871Z",
-        "filter": {
-            "app": [
-                app_id  # "14117753006360199"
-            ],
-            "site": [
-                site_id  # "14643839950050237"
-            ],
-            "path": [
-                path_id  # "14652291803220110"
-            ]
-        },
-        "interval": "5min",
+    metrics_filter = {
+        "site": [
+            site_id
+        ]
+    }
+    if app_id is not None:
+        metrics_filter["app"] = [app_id]
+    if path_ids is not None:
+        metrics_filter["path"] = list(path_ids)
+    if direction is not None:
+        metrics_filter["direction"] = direction
+
+    return {
+        "end_time": window.end_time,
+        "filter": metrics_filter,
+        "interval": window.interval,
         "metrics": [
-            # {
-            #     "name": "AppNormalizedNetworkTransferTime",
-            #     "statistics": [
-            #         "average"
-            #     ],
-            #     "unit": "milliseconds"
-            # },
             {
-                "name": "AppRoundTripTime",
+                "name": spec.name,
                 "statistics": [
                     "average"
                 ],
-                "unit": "milliseconds"
-            },
-            # {
-            #     "name": "AppServerResponseTime",
-            #     "statistics": [
-            #         "average"
-            #     ],
-            #     "unit": "milliseconds"
-            # },
-            {
-                "name": "AppUDPTransactionResponseTime",
-                "statistics": [
-                    "average"
-                ],
-                "unit": "milliseconds"
-            }
+                "unit": spec.unit
+            } for spec in specs
         ],
-        "start_time": starttime,  # "2016-11-18T16:21:52.871Z",
-        "view": {
-            "summary": True
-        }
+        "start_time": window.start_time,
+        "view": view
     }
 
+
+def query_metrics(sdk, metrics_query, counter=None):
+    """
+    Run a metrics_monitor query.
+    :param sdk: Authenticated CloudGenix SDK Constructor
+    :param metrics_query: metrics query dict
+    :param counter: Optional - MetricsCallCounter to count the call in
+    :return: metrics_monitor response content, or None on failure.
+    """
+    if counter is not None:
+        counter.add(calls=1)
+
     metrics_resp = sdk.post.metrics_monitor(metrics_query)
-    status = metrics_resp.cgx_status
-    metrics_response = metrics_resp.cgx_content
 
-    # print "Status: ", status
-    # print "Metrics: ", json.dumps(metrics_response, indent=4)
+    if metrics_resp.cgx_status:
+        return metrics_resp.cgx_content
+    else:
+        return None
 
-    if status:
 
-        # parse the response to get into dataframe
+def format_series_stats(spec, label, series_stats):
+    """
+    Format one summarized series.
+    :param spec: MetricSpec
+    :param label: Display label
+    :param series_stats: SeriesStats
+    :return: string line
+    """
+    value_format = "{:.{precision}f}" + spec.suffix
+    values = [value_format.format(value, precision=spec.precision) for value in series_stats[1:]]
+    return " *{0}* - Avg: *{1}*, Std: *{2}*, 95th *{3}*, Max *{4}*, Min *{5}*\n".format(label, *values)
+
+
+def series_values(series):
+    """
+    Get the values of a series.
+    :param series: series dict, from a metrics_monitor response or fetch_series_incremental
+    :return: list or array of values, None for missing.
+    """
+    if 'values' in series:
+        return series['values']
+    return [datapoint.get('value', None) for data in series.get('data', [])[:1]
+            for datapoint in data.get('datapoints', [])]
+
 
-        name_xlate = {
-            "AppNormalizedNetworkTransferTime": "NTTn",
-            "AppRoundTripTime": "RTT  ",
-            "AppServerResponseTime": "SRT  ",
-            "AppUDPTransactionResponseTime": "uTRT"
-        }
+def series_times(series):
+    """
+    Get the bucket times of a series, matching series_values().
+    :param series: series dict, from a metrics_monitor response or fetch_series_incremental
+    :return: list or array of epoch seconds, None where the time isn't parsable.
+    """
+    if 'times' in series:
+        return series['times']
+    return [parse_metrics_time(datapoint.get('time')) for data in series.get('data', [])[:1]
+            for datapoint in data.get('datapoints', [])]
 
-        data_dict = {}
-        return_str = "\n"
-        label_list = []
-        for metrics in metrics_response.get('metrics', []):
 
-            metric_list = []
-            name = name_xlate.get(metrics['series'][0]['name'], 'UNKNOWN')
+def summarize_series(series_list, specs, app_id=None, site_id=None, path_id=None, direction=None):
+    """
+    Summarize any number of metric series (any metrics, any directions) using their specs, in series order.
+    Series with no data, metrics not in specs and suppressed lines are skipped.
+    :param series_list: list of series dicts
+    :param specs: list of MetricSpec to summarize
+    :param app_id: Optional - for logging
+    :param site_id: Optional - for logging
+    :param path_id: Optional - for logging
+    :param direction: Optional - Direction of series whose view has none (eg, queried with a direction filter)
+    :return: summary string, one line per series
+    """
+    spec_lookup = dict((spec.name, spec) for spec in specs)
+    return_str = ""
 
-            # parse datapoints
-            for datapoint in metrics['series'][0]['data'][0]['datapoints']:
-                metric_list.append(datapoint.get('value', None))
+    for series in series_list:
+        spec = spec_lookup.get(series.get('name'))
+        if spec is None:
+            continue
 
-            # if not all values are none
-            if not metric_list.count(None) == len(metric_list):
-                data_dict[name] = metric_list
-                label_list.append(name)
-            else:
-                logger.debug("No data in series {0} for App {1}/site {2}/ path {3}".format(name, app_id, site_id,
-                                                                                           path_id))
+        label = spec.label
+        series_direction = series.get('view', {}).get('direction') or direction
+        if spec.by_direction and series_direction:
+            label += DIRECTION_LABELS.get(series_direction, " " + series_direction)
 
-        metric_dataframe = pd.DataFrame(data_dict)
+        series_stats = summarize(series_values(series), scale=spec.scale)
 
-        for label in label_list:
-            string = " *{0}* - Avg: *{1}ms*, Std: *{2}ms*, 95th *{3}ms*, Max *{4}ms*, Min *{5}ms*\n".format(
-                label,
-                "{:.0f}".format(metric_dataframe[label].mean()),
-                "{:.0f}".format(metric_dataframe[label].std()),
-                "{:.0f}".format(metric_dataframe[label].quantile(0.95)),
-                "{:.0f}".format(metric_dataframe[label].max()),
-                "{:.0f}".format(metric_dataframe[label].min()),
-            )
+        # if all values are none
+        if not series_stats.count:
+            logger.debug("No data in series {0} for App {1}/site {2}/ path {3}".format(label, app_id, site_id,
+                                                                                       path_id))
+            continue
 
-            return_str += string
+        # check for zero values
+        if spec.suppress_below is not None and not any(value > spec.suppress_below
+                                                       for value in series_stats[1:]):
+            continue
 
-        # print(return_str)
-        return return_str
+        return_str += format_series_stats(spec, label, series_stats)
 
-    else:
-        # return blank as we didnt get stats
-        return None
+    return return_str
 
 
-def media_site_app_path_summary(app_id, site_id, path_id, sdk, id2n):
+def apprt_site_app_path_summary(app_id, site_id, path_id, sdk, id2n, window=None):
     """
 
     :param app_id:
@@ -186,203 +543,97 @@ def media_site_app_path_summary(app_id, site_id, path_id, sdk, id2n):
     :param path_id:
     :param sdk:
     :param id2n:
+    :param window: Optional - MetricsWindow from metrics_window() (default last 24 hours)
     :return:
     """
+    return apprt_site_app_paths_summary(app_id, site_id, [path_id], sdk, id2n, window=window).get(path_id)
 
-    # get time for query
-    curtime = datetime.datetime.utcnow()
-    endtime = curtime.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-    starttime = (curtime - datetime.timedelta(hours=24)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-
-    metrics_query = {
-        "end_time": endtime,  # "2016-11-18T17:21:52.871Z",
-        "filter": {
-            "app": [
-                app_id  # "14117753006360199"
-            ],
-            "site": [
-                site_id  # "14643839950050237"
-            ],
-            "path": [
-                path_id  # "14652291803220110"
-            ],
-            "direction": "Ingress"
-        },
-        "interval": "5min",
-        "metrics": [
-            {
-                "name": "AppPerfUDPAudioBandwidth",
-                "statistics": [
-                    "average"
-                ],
-                "unit": "Mbps"
-            },
-            {
-                "statistics": [
-                    "average"
-                ],
-                "name": "AppPerfUDPVideoPacketLoss",
-                "unit": "percentage"
-            },
-            {
-                "statistics": [
-                    "average"
-                ],
-                "name": "AppPerfUDPAudioPacketLoss",
-                "unit": "percentage"
-            },
-            {
-                "statistics": [
-                    "average"
-                ],
-                "name": "AppPerfUDPVideoJitter",
-                "unit": "milliseconds"
-            },
-            {
-                "statistics": [
-                    "average"
-                ],
-                "name": "AppPerfUDPAudioJitter",
-                "unit": "milliseconds"
-            },
-
-            {
-                "statistics": [
-                    "average"
-                ],
-                "name": "AppPerfUDPVideoBandwidth",
-                "unit": "Mbps"
-            }
-        ],
-        "start_time": starttime,  # "2016-11-18T16:21:52.871Z",
-        "view": {
-            "individual": "app"
-        }
-    }
-
-    metrics_resp = sdk.post.metrics_monitor(metrics_query)
-    status = metrics_resp.cgx_status
-    metrics_response = metrics_resp.cgx_content
-
-    # print "Status: ", status
-    # print "Metrics: ", json.dumps(metrics_response, indent=4)
-
-    if status:
-
-        # parse the response to get into dataframe
-
-        name_xlate = {
-            "AppNormalizedNetworkTransferTime": "NTTn",
-            "AppRoundTripTime": "RTT  ",
-            "AppServerResponseTime": "SRT  ",
-            "AppUDPTransactionResponseTime": "uTRT",
-            "AppPerfUDPVideoBandwidth": "Video BW",
-            "AppPerfUDPAudioBandwidth": "Audio BW",
-            "AppPerfUDPVideoPacketLoss": "Video Packetloss",
-            "AppPerfUDPAudioPacketLoss": "Audio Packetloss",
-            "AppPerfUDPVideoJitter": "Video Jitter",
-            "AppPerfUDPAudioJitter": "Audio Jitter",
-            "AppAudioMos": "Audio MOS"
-        }
-
-        data_dict = {}
-        return_str = "\n"
-        label_list = []
-        for metrics in metrics_response.get('metrics', []):
-
-            current_metric_name = metrics['series'][0]['name']
-
-            metric_list = []
-            name = name_xlate.get(current_metric_name, 'UNKNOWN')
-
-            # parse datapoints
-            for datapoint in metrics['series'][0]['data'][0]['datapoints']:
-                if current_metric_name in ["AppPerfUDPVideoBandwidth", "AppPerfUDPAudioBandwidth"]:
-                    current_data_point = datapoint.get('value', None)
-                    if current_data_point:
-                        metric_list.append(current_data_point * 1024)  # convert Mb to Kb
-                    else:
-                        metric_list.append(current_data_point)
-                else:
-                    metric_list.append(datapoint.get('value', None))
-
-            # if not all values are none
-            if not metric_list.count(None) == len(metric_list):
-                data_dict[name] = metric_list
-                label_list.append(name)
-            else:
-                logger.debug("No data in series {0} for App {1}/site {2}/ path {3}".format(name, app_id, site_id,
-                                                                                           path_id))
-
-        metric_dataframe = pd.DataFrame(data_dict)
-
-        for label in label_list:
-
-            if label in ["Video Jitter", "Audio Jitter"]:
-
-                string = " *{0}* - Avg: *{1}ms*, Std: *{2}ms*, 95th *{3}ms*, Max *{4}ms*, Min *{5}ms*\n".format(
-                    label,
-                    "{:.0f}".format(metric_dataframe[label].mean()),
-                    "{:.0f}".format(metric_dataframe[label].std()),
-                    "{:.0f}".format(metric_dataframe[label].quantile(0.95)),
-                    "{:.0f}".format(metric_dataframe[label].max()),
-                    "{:.0f}".format(metric_dataframe[label].min()),
-                )
-            elif label in ["Audio Packetloss", "Video Packetloss"]:
-                string = " *{0}* - Avg: *{1}%*, Std: *{2}%*, 95th *{3}%*, Max *{4}%*, Min *{5}%*\n".format(
-                    label,
-                    "{:.0f}".format(metric_dataframe[label].mean()),
-                    "{:.0f}".format(metric_dataframe[label].std()),
-                    "{:.0f}".format(metric_dataframe[label].quantile(0.95)),
-                    "{:.0f}".format(metric_dataframe[label].max()),
-                    "{:.0f}".format(metric_dataframe[label].min()),
-                )
-            elif label in ["Video BW", "Audio BW"]:
-                # check for zero values
-                # logger.debug(" *{0}* - Avg: *{1}kb*, Std: *{2}kb*, 95th *{3}kb*, Max *{4}kb*, Min *{5}kb*\n".format(
-                #             label,
-                #             metric_dataframe[label].mean(),
-                #             metric_dataframe[label].std(),
-                #             metric_dataframe[label].quantile(0.95),
-                #             metric_dataframe[label].max(),
-                #             metric_dataframe[label].min(),
-                #         ))
-
-                if metric_dataframe[label].mean() > 0.01 or metric_dataframe[label].std() > 0.01 or \
-                        metric_dataframe[label].quantile(0.95) > 0.01 or \
-                        metric_dataframe[label].max() > 0.01 or \
-                        metric_dataframe[label].min() > 0.01:
-
-                    string = " *{0}* - Avg: *{1}kb*, Std: *{2}kb*, 95th *{3}kb*, Max *{4}kb*, Min *{5}kb*\n".format(
-                        label,
-                        "{:.2f}".format(metric_dataframe[label].mean()),
-                        "{:.2f}".format(metric_dataframe[label].std()),
-                        "{:.2f}".format(metric_dataframe[label].quantile(0.95)),
-                        "{:.2f}".format(metric_dataframe[label].max()),
-                        "{:.2f}".format(metric_dataframe[label].min()),
-                    )
-                else:
-                    string = None
-            else:
-                string = None
 
-            if string:
-                return_str += string
+def apprt_site_app_paths_summary(app_id, site_id, path_ids, sdk, id2n, workers=METRICS_WORKERS,
+                                 deadline=METRICS_DEADLINE, window=None):
+    """
+    App response time summaries for many paths of a site, using one metrics query per METRICS_PATH_BATCH_SIZE
+    paths. Queries run concurrently.
+    :param app_id:
+    :param site_id:
+    :param path_ids: list of path IDs
+    :param sdk:
+    :param id2n:
+    :param workers: Max concurrent queries
+    :param deadline: Seconds to wait for all queries
+    :param window: Optional - MetricsWindow from metrics_window() (default last 24 hours)
+    :return: dict of path ID -> summary string. Paths whose query failed are missing, paths whose query timed
+             out get STATS_UNAVAILABLE_MSG.
+    """
+    window = window or metrics_window()
+    jobs = [(tuple(path_id_batch), partial(apprt_site_app_paths_batch, app_id, site_id, path_id_batch, sdk,
+                                           window=window))
+            for path_id_batch in chunk_list(list(path_ids), METRICS_PATH_BATCH_SIZE)]
+    results = run_stats_jobs(jobs, workers=workers, deadline=deadline)
 
-        mos_str = media_site_app_mos(app_id, site_id, path_id, sdk, id2n)
+    path_summaries = {}
+    for path_id_batch, _ in jobs:
+        if path_id_batch not in results:
+            path_summaries.update((path_id, STATS_UNAVAILABLE_MSG) for path_id in path_id_batch)
+        elif results[path_id_batch] is not None:
+            path_summaries.update(results[path_id_batch])
 
-        if mos_str:
-            return_str += mos_str
+    return path_summaries
 
-        # print(repr(return_str))
-        return return_str
 
-    else:
+def apprt_site_app_paths_batch(app_id, site_id, path_ids, sdk, window=None):
+    """
+    Query and summarize app response time for one batch of paths.
+    :param app_id:
+    :param site_id:
+    :param path_ids: list of path IDs
+    :param sdk:
+    :param window: Optional - MetricsWindow from metrics_window() (default last 24 hours)
+    :return: dict of path ID -> summary string, or None if the query failed.
+    """
+    window = window or metrics_window()
+    series_by_path = cached_series_by_path(
+        'apprt', app_id, site_id, path_ids, None, window,
+        lambda missing_path_ids: fetch_series_incremental(
+            APPRT_METRICS, None, app_id, site_id, missing_path_ids, window,
+            lambda query_path_ids, query_window: apprt_site_app_paths_query(app_id, site_id, query_path_ids, sdk,
+                                                                            window=query_window)))
+    if series_by_path is None:
         # return blank as we didnt get stats
         return None
 
+    return dict((path_id, apprt_summary(series_by_path.get(path_id, []), app_id, site_id, path_id))
+                for path_id in path_ids)
+
 
-def media_site_app_mos(app_id, site_id, path_id, sdk, id2n):
+def apprt_site_app_paths_query(app_id, site_id, path_ids, sdk, window=None):
+    """
+    Query app response time metrics for a list of paths, individual per path.
+    :param app_id:
+    :param site_id:
+    :param path_ids: list of path IDs
+    :param sdk:
+    :param window: Optional - MetricsWindow from metrics_window() (default last 24 hours)
+    :return: metrics_monitor response content, or None on failure.
+    """
+    metrics_query = build_metrics_query(APPRT_METRICS, site_id, window or metrics_window(),
+                                        {"individual": "path", "summary": True}, app_id=app_id, path_ids=path_ids)
+    return query_metrics(sdk, metrics_query)
+
+
+def apprt_summary(series_list, app_id, site_id, path_id):
+    """
+    Format app response time series for one path.
+    :param series_list: list of series dicts for the path
+    :param app_id:
+    :param site_id:
+    :param path_id:
+    :return: summary string
+    """
+    return "\n" + summarize_series(series_list, APPRT_METRICS, app_id, site_id, path_id)
+
+
+def media_site_app_path_summary(app_id, site_id, path_id, sdk, id2n, window=None):
     """
 
     :param app_id:
@@ -390,127 +641,295 @@ def media_site_app_mos(app_id, site_id, path_id, sdk, id2n):
     :param path_id:
     :param sdk:
     :param id2n:
+    :param window: Optional - MetricsWindow from metrics_window() (default last 24 hours)
     :return:
     """
+    return media_site_app_paths_summary(app_id, site_id, [path_id], sdk, id2n, window=window).get(path_id)
 
-    # get time for query
-    curtime = datetime.datetime.utcnow()
-    endtime = curtime.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-    starttime = (curtime - datetime.timedelta(hours=24)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-
-    metrics_query = {
-        "end_time": endtime,  # "2016-11-18T17:21:52.871Z",
-        "filter": {
-            "app": [
-                app_id  # "14117753006360199"
-            ],
-            "site": [
-                site_id  # "14643839950050237"
-            ],
-            "path": [
-                path_id  # "14652291803220110"
-            ]
-        },
-        "interval": "5min",
-        "metrics": [
-            {
-                "statistics": [
-                    "average"
-                ],
-                "name": "AppAudioMos",
-                "unit": "count"
-            },
-        ],
-        "start_time": starttime,  # "2016-11-18T16:21:52.871Z",
-        "view": {
-            "individual": "direction"
-        }
-    }
 
-    metrics_resp = sdk.post.metrics_monitor(metrics_query)
-    status = metrics_resp.cgx_status
-    metrics_response = metrics_resp.cgx_content
-
-    # print "Status: ", status
-    # print "Metrics: ", json.dumps(metrics_response, indent=4)
-
-    if status:
-
-        # parse the response to get into dataframe
-
-        name_xlate = {
-            "AppNormalizedNetworkTransferTime": "NTTn",
-            "AppRoundTripTime": "RTT  ",
-            "AppServerResponseTime": "SRT  ",
-            "AppUDPTransactionResponseTime": "uTRT",
-            "AppPerfUDPVideoBandwidth": "Video BW",
-            "AppPerfUDPAudioBandwidth": "Audio BW",
-            "AppPerfUDPVideoPacketLoss": "Video Packetloss",
-            "AppPerfUDPAudioPacketLoss": "Audio Packetloss",
-            "AppPerfUDPVideoJitter": "Video Jitter",
-            "AppPerfUDPAudioJitter": "Audio Jitter",
-            "AppAudioMos_Egress": "Audio MOS Out",
-            "AppAudioMos_Ingress": "Audio MOS In",
-        }
-
-        data_dict = {}
-        return_str = ""
-        label_list = []
-        for metrics in metrics_response.get('metrics', []):
-
-            current_metric_name = metrics['series'][0]['name'] + "_" + metrics['series'][0]['view']['direction']
-
-            metric_list = []
-            name = name_xlate.get(current_metric_name, 'Audio MOS')
-
-            # parse datapoints
-            for datapoint in metrics['series'][0]['data'][0]['datapoints']:
-                metric_list.append(datapoint.get('value', None))
-
-            # if not all values are none
-            if not metric_list.count(None) == len(metric_list):
-                data_dict[name] = metric_list
-                label_list.append(name)
+def media_site_app_paths_summary(app_id, site_id, path_ids, sdk, id2n, workers=METRICS_WORKERS,
+                                 deadline=METRICS_DEADLINE, combined=True, counter=None, window=None):
+    """
+    Media (audio/video) summaries for many paths of a site, using one metrics query per METRICS_PATH_BATCH_SIZE
+    paths. Queries run concurrently.
+    Combined mode gets MOS in the same batches: one Ingress query (media + MOS In) and one Egress query (MOS Out).
+    Otherwise MOS needs a query per path.
+    :param app_id:
+    :param site_id:
+    :param path_ids: list of path IDs
+    :param sdk:
+    :param id2n:
+    :param workers: Max concurrent queries
+    :param deadline: Seconds to wait for all queries
+    :param combined: Bool, use combined media + MOS queries.
+    :param counter: Optional - MetricsCallCounter, gets the calls made and the per-path baseline.
+    :param window: Optional - MetricsWindow from metrics_window() (default last 24 hours)
+    :return: dict of path ID -> summary string. Paths whose query failed are missing, paths whose query timed
+             out get STATS_UNAVAILABLE_MSG.
+    """
+    window = window or metrics_window()
+    path_ids = list(path_ids)
+    if counter is not None:
+        # original per-path queries: media + MOS for every path.
+        counter.add(baseline=2 * len(path_ids))
+
+    if combined:
+        return media_site_app_paths_combined(app_id, site_id, path_ids, sdk, workers=workers, deadline=deadline,
+                                             counter=counter, window=window)
+
+    batch_jobs = [(tuple(path_id_batch), partial(media_site_app_paths_batch, app_id, site_id, path_id_batch, sdk,
+                                                 counter=counter, window=window))
+                  for path_id_batch in chunk_list(path_ids, METRICS_PATH_BATCH_SIZE)]
+    mos_jobs = [(path_id, partial(media_site_app_mos, app_id, site_id, path_id, sdk, id2n, window=window,
+                                  counter=counter))
+                for path_id in path_ids]
+    results = run_stats_jobs(batch_jobs + mos_jobs, workers=workers, deadline=deadline)
+
+    path_summaries = {}
+    for path_id_batch, _ in batch_jobs:
+        if path_id_batch not in results:
+            path_summaries.update((path_id, STATS_UNAVAILABLE_MSG) for path_id in path_id_batch)
+            continue
+        elif results[path_id_batch] is None:
+            continue
+
+        for path_id in path_id_batch:
+            return_str = results[path_id_batch][path_id]
+
+            if path_id not in results:
+                return_str += MOS_UNAVAILABLE_MSG
+            elif results[path_id]:
+                return_str += results[path_id]
+
+            path_summaries[path_id] = return_str
+
+    return path_summaries
+
+
+def media_site_app_paths_combined(app_id, site_id, path_ids, sdk, workers=METRICS_WORKERS,
+                                  deadline=METRICS_DEADLINE, counter=None, window=None):
+    """
+    Media and MOS summaries for many paths, two metrics queries per METRICS_PATH_BATCH_SIZE paths.
+    :param app_id:
+    :param site_id:
+    :param path_ids: list of path IDs
+    :param sdk:
+    :param workers: Max concurrent queries
+    :param deadline: Seconds to wait for all queries
+    :param counter: Optional - MetricsCallCounter to count calls in
+    :param window: Optional - MetricsWindow from metrics_window() (default last 24 hours)
+    :return: dict of path ID -> summary string, same as media_site_app_paths_summary.
+    """
+    window = window or metrics_window()
+    jobs = []
+    for path_id_batch in chunk_list(list(path_ids), METRICS_PATH_BATCH_SIZE):
+        path_id_batch = tuple(path_id_batch)
+        jobs.append(((path_id_batch, 'Ingress'), partial(media_site_app_paths_series, 'media_mos', MEDIA_MOS_METRICS,
+                                                         'Ingress', app_id, site_id, path_id_batch, sdk, window,
+                                                         counter=counter)))
+        jobs.append(((path_id_batch, 'Egress'), partial(media_site_app_paths_series, 'mos', MOS_METRICS,
+                                                        'Egress', app_id, site_id, path_id_batch, sdk, window,
+                                                        counter=counter)))
+    results = run_stats_jobs(jobs, workers=workers, deadline=deadline)
+
+    path_summaries = {}
+    for (path_id_batch, direction), _ in jobs:
+        if direction != 'Ingress':
+            continue
+        if (path_id_batch, 'Ingress') not in results:
+            path_summaries.update((path_id, STATS_UNAVAILABLE_MSG) for path_id in path_id_batch)
+            continue
+        ingress_series = results[(path_id_batch, 'Ingress')]
+        if ingress_series is None:
+            continue
+        egress_timed_out = (path_id_batch, 'Egress') not in results
+        # MOS Out is optional, no lines if the query failed.
+        egress_series = results.get((path_id_batch, 'Egress')) or {}
+
+        for path_id in path_id_batch:
+            return_str = media_summary(ingress_series.get(path_id, []), app_id, site_id, path_id)
+            return_str += summarize_series(ingress_series.get(path_id, []), MOS_METRICS, app_id, site_id, path_id,
+                                           direction='Ingress')
+            if egress_timed_out:
+                return_str += MOS_UNAVAILABLE_MSG
             else:
-                logger.debug("No data in series {0} for App {1}/site {2}/ path {3}".format(name, app_id, site_id,
-                                                                                           path_id))
+                return_str += summarize_series(egress_series.get(path_id, []), MOS_METRICS, app_id, site_id,
+                                               path_id, direction='Egress')
+            path_summaries[path_id] = return_str
 
-            # hack twice just for now for multiple directions.
-            current_metric_name = metrics['series'][1]['name'] + "_" + metrics['series'][1]['view']['direction']
+    return path_summaries
 
-            metric_list = []
-            name = name_xlate.get(current_metric_name, 'Audio MOS')
 
-            # parse datapoints
-            for datapoint in metrics['series'][1]['data'][0]['datapoints']:
-                metric_list.append(datapoint.get('value', None))
+def media_site_app_paths_series(metric_set, specs, direction, app_id, site_id, path_ids, sdk, window,
+                                counter=None):
+    """
+    Get per-path series for a list of metric specs in one direction, from metrics_cache or series_store.
+    :param metric_set: metrics_cache metric set name
+    :param specs: list of MetricSpec to query
+    :param direction: Direction filter ("Ingress"/"Egress")
+    :param app_id:
+    :param site_id:
+    :param path_ids: list of path IDs
+    :param sdk:
+    :param window: MetricsWindow from metrics_window()
+    :param counter: Optional - MetricsCallCounter to count calls in
+    :return: dict of path ID -> list of series dicts, or None if the query failed.
+    """
+    return cached_series_by_path(
+        metric_set, app_id, site_id, path_ids, direction, window,
+        lambda missing_path_ids: fetch_series_incremental(
+            specs, direction, app_id, site_id, missing_path_ids, window,
+            lambda query_path_ids, query_window: media_site_app_paths_query(
+                app_id, site_id, query_path_ids, sdk, window=query_window, specs=specs, direction=direction,
+                counter=counter)))
 
-            # if not all values are none
-            if not metric_list.count(None) == len(metric_list):
-                data_dict[name] = metric_list
-                label_list.append(name)
-            else:
-                logger.debug("No data in series {0} for App {1}/site {2}/ path {3}".format(name, app_id, site_id,
-                                                                                           path_id))
 
-        metric_dataframe = pd.DataFrame(data_dict)
+def media_site_app_paths_batch(app_id, site_id, path_ids, sdk, counter=None, window=None):
+    """
+    Query and summarize media metrics (without MOS) for one batch of paths.
+    :param app_id:
+    :param site_id:
+    :param path_ids: list of path IDs
+    :param sdk:
+    :param counter: Optional - MetricsCallCounter to count calls in
+    :param window: Optional - MetricsWindow from metrics_window() (default last 24 hours)
+    :return: dict of path ID -> summary string, or None if the query failed.
+    """
+    series_by_path = media_site_app_paths_series('media', MEDIA_METRICS, 'Ingress', app_id, site_id, path_ids, sdk,
+                                                 window or metrics_window(), counter=counter)
+    if series_by_path is None:
+        # return blank as we didnt get stats
+        return None
 
-        for label in label_list:
+    return dict((path_id, media_summary(series_by_path.get(path_id, []), app_id, site_id, path_id))
+                for path_id in path_ids)
 
-            string = " *{0}* - Avg: *{1}*, Std: *{2}*, 95th *{3}*, Max *{4}*, Min *{5}*\n".format(
-                label,
-                "{:.2f}".format(metric_dataframe[label].mean()),
-                "{:.2f}".format(metric_dataframe[label].std()),
-                "{:.2f}".format(metric_dataframe[label].quantile(0.95)),
-                "{:.2f}".format(metric_dataframe[label].max()),
-                "{:.2f}".format(metric_dataframe[label].min()),
-            )
 
-            return_str += string
+def media_site_app_paths_query(app_id, site_id, path_ids, sdk, window=None, specs=None, direction="Ingress",
+                               counter=None):
+    """
+    Query media metrics for a list of paths, individual per path.
+    :param app_id:
+    :param site_id:
+    :param path_ids: list of path IDs
+    :param sdk:
+    :param window: Optional - MetricsWindow from metrics_window() (default last 24 hours)
+    :param specs: Optional - list of MetricSpec to query (default MEDIA_METRICS)
+    :param direction: Direction filter
+    :param counter: Optional - MetricsCallCounter to count calls in
+    :return: metrics_monitor response content, or None on failure.
+    """
+    metrics_query = build_metrics_query(specs or MEDIA_METRICS, site_id, window or metrics_window(),
+                                        {"individual": "path"}, app_id=app_id, path_ids=path_ids,
+                                        direction=direction)
+    return query_metrics(sdk, metrics_query, counter=counter)
 
-        # print(repr(return_str))
-        return return_str
 
-    else:
-        # return blank as we didnt get stats
+def media_summary(series_list, app_id, site_id, path_id):
+    """
+    Format media series (jitter, loss, bandwidth) for one path.
+    :param series_list: list of series dicts for the path
+    :param app_id:
+    :param site_id:
+    :param path_id:
+    :return: summary string
+    """
+    return "\n" + summarize_series(series_list, MEDIA_METRICS, app_id, site_id, path_id)
+
+
+def media_site_app_mos(app_id, site_id, path_id, sdk, id2n, window=None, counter=None):
+    """
+    Audio MOS summary for one path, per direction.
+    :param app_id:
+    :param site_id:
+    :param path_id:
+    :param sdk:
+    :param id2n:
+    :param window: Optional - MetricsWindow from metrics_window() (default last 24 hours)
+    :param counter: Optional - MetricsCallCounter to count calls in
+    :return: summary string, or None if the query failed.
+    """
+    if window is None:
+        window = metrics_window()
+
+    cache_key = metrics_cache_key('mos', app_id, site_id, path_id, None, window)
+    found, metrics_response = metrics_cache.get(cache_key)
+    if not found:
+        metrics_query = build_metrics_query(MOS_METRICS, site_id, window, {"individual": "direction"},
+                                            app_id=app_id, path_ids=[path_id])
+        metrics_response = query_metrics(sdk, metrics_query, counter=counter)
+        if metrics_response is None:
+            # return blank as we didnt get stats
+            return None
+        metrics_cache.set(cache_key, metrics_response, window.end_epoch + window.step)
+
+    series_list = [series for metrics in metrics_response.get('metrics', []) for series in metrics.get('series', [])]
+    return summarize_series(series_list, MOS_METRICS, app_id, site_id, path_id)
+
+
+def bandwidth_site_paths_summary(site_id, path_ids, sdk, workers=METRICS_WORKERS, deadline=METRICS_DEADLINE,
+                                 window=None):
+    """
+    Bandwidth usage, capacity and utilization for many paths (circuits) of a site, using one metrics query per
+    direction per METRICS_PATH_BATCH_SIZE paths. Queries run concurrently.
+    :param site_id:
+    :param path_ids: list of path IDs
+    :param sdk:
+    :param workers: Max concurrent queries
+    :param deadline: Seconds to wait for all queries
+    :param window: Optional - MetricsWindow from metrics_window() (default last 24 hours)
+    :return: dict of path ID -> dict of direction -> BandwidthStats. Directions whose query failed or timed out
+             are missing.
+    """
+    window = window or metrics_window()
+    jobs = [((tuple(path_id_batch), direction), partial(bandwidth_site_paths_batch, site_id, path_id_batch, direction,
+                                                        sdk, window))
+            for path_id_batch in chunk_list(list(path_ids), METRICS_PATH_BATCH_SIZE)
+            for direction in BANDWIDTH_DIRECTIONS]
+    results = run_stats_jobs(jobs, workers=workers, deadline=deadline)
+
+    path_stats = {}
+    for (path_id_batch, direction), _ in jobs:
+        batch_stats = results.get((path_id_batch, direction))
+        if batch_stats is None:
+            continue
+        for path_id in path_id_batch:
+            path_stats.setdefault(path_id, {})[direction] = batch_stats[path_id]
+
+    return path_stats
+
+
+def bandwidth_site_paths_batch(site_id, path_ids, direction, sdk, window):
+    """
+    Query and summarize bandwidth for one batch of paths in one direction.
+    :param site_id:
+    :param path_ids: list of path IDs
+    :param direction: "Ingress" or "Egress"
+    :param sdk:
+    :param window: MetricsWindow from metrics_window()
+    :return: dict of path ID -> BandwidthStats, or None if the query failed.
+    """
+    series_by_path = cached_series_by_path(
+        'bandwidth', None, site_id, path_ids, direction, window,
+        lambda missing_path_ids: fetch_series_incremental(
+            BANDWIDTH_METRICS, direction, None, site_id, missing_path_ids, window,
+            lambda query_path_ids, query_window: query_metrics(
+                sdk, build_metrics_query(BANDWIDTH_METRICS, site_id, query_window, {"individual": "path"},
+                                         path_ids=query_path_ids, direction=direction))))
+    if series_by_path is None:
         return None
+
+    usage_rows, usage_times = [], []
+    capacity_rows, capacity_times = [], []
+    for path_id in path_ids:
+        series_by_name = dict((series.get('name'), series) for series in series_by_path.get(path_id, []))
+        usage_series = series_by_name.get("BandwidthUsage", {})
+        capacity_series = series_by_name.get("PathCapacity", {})
+        usage_rows.append(series_values(usage_series))
+        usage_times.append(series_times(usage_series))
+        capacity_rows.append(series_values(capacity_series))
+        capacity_times.append(series_times(capacity_series))
+
+    # usage and capacity can each be missing buckets, so they're matched on bucket time.
+    return dict(zip(path_ids, bandwidth_stats(usage_rows, capacity_rows, usage_times=usage_times,
+                                              capacity_times=capacity_times)))
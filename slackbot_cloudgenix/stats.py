@@ -0,0 +1,136 @@
+# -*- coding: UTF-8 -*-
+# standard modules
+import logging
+import warnings
+from collections import namedtuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Summary of one metric series. NaN where a value can't be computed (eg, std of a single point).
+SeriesStats = namedtuple('SeriesStats', ['count', 'mean', 'std', 'p95', 'max', 'min'])
+
+EMPTY_STATS = SeriesStats(0, float('nan'), float('nan'), float('nan'), float('nan'), float('nan'))
+
+
+def to_array(values, scale=None):
+    """
+    Convert a list of datapoint values to a float array, None becomes NaN.
+    :param values: list of numbers or None
+    :param scale: Optional - multiply all values by this
+    :return: numpy float64 array
+    """
+    array = np.array(values, dtype=np.float64)
+    if scale is not None:
+        array *= scale
+    return array
+
+
+def summarize(values, scale=None):
+    """
+    Summarize a metric series, skipping missing (None/NaN) values. Matches the pandas Series results used
+    previously: sample std (ddof=1), and linear interpolated 95th percentile.
+    :param values: list of numbers or None, or a float array
+    :param scale: Optional - multiply all values by this first
+    :return: SeriesStats namedtuple
+    """
+    array = to_array(values, scale=scale)
+    array = array[~np.isnan(array)]
+    count = len(array)
+
+    if not count:
+        return EMPTY_STATS
+
+    return SeriesStats(
+        count,
+        float(np.mean(array)),
+        # std of one point is NaN, same as pandas.
+        float(np.std(array, ddof=1)) if count > 1 else float('nan'),
+        float(np.percentile(array, 95)),
+        float(np.max(array)),
+        float(np.min(array))
+    )
+
+
+# Bandwidth of one circuit (path) in one direction. Utilization is usage / capacity in percent.
+BandwidthStats = namedtuple('BandwidthStats', ['usage_avg', 'usage_p95', 'capacity', 'util_p50', 'util_p95',
+                                               'util_max'])
+
+
+def to_matrix(rows, width=None):
+    """
+    Stack value lists into a 2D float array, one row each. Short rows are padded with NaN.
+    :param rows: list of lists/arrays of numbers or None
+    :param width: Optional - minimum number of columns
+    :return: numpy float64 array of shape (len(rows), width)
+    """
+    width = max([width or 1] + [len(row) for row in rows])
+    matrix = np.full((len(rows), width), np.nan, dtype=np.float64)
+    for row_index, row in enumerate(rows):
+        matrix[row_index, :len(row)] = to_array(row)
+    return matrix
+
+
+def align_series(times_a, values_a, times_b, values_b):
+    """
+    Line up two series on their bucket times. A bucket only one series has is NaN in the other, and points
+    without a time are dropped.
+    :param times_a: list/array of epoch times (or None) of the first series
+    :param values_a: list/array of values (or None), same length as times_a
+    :param times_b: list/array of epoch times (or None) of the second series
+    :param values_b: list/array of values (or None), same length as times_b
+    :return: tuple of two numpy float64 arrays, one value per bucket time in either series, oldest first
+    """
+    series = []
+    for times, values in ((times_a, values_a), (times_b, values_b)):
+        known = [index for index, point_time in enumerate(times) if point_time is not None]
+        series.append((np.array([times[index] for index in known], dtype=np.int64),
+                       to_array([values[index] for index in known])))
+
+    all_times = np.union1d(series[0][0], series[1][0])
+    aligned = []
+    for times, values in series:
+        row = np.full(len(all_times), np.nan, dtype=np.float64)
+        row[np.searchsorted(all_times, times)] = values
+        aligned.append(row)
+    return tuple(aligned)
+
+
+def bandwidth_stats(usage_rows, capacity_rows, usage_times=None, capacity_times=None):
+    """
+    Usage, capacity and utilization percentiles for many circuits at once. Buckets with no usage, or no (or zero)
+    capacity, are skipped. Circuits with no data get NaN.
+    :param usage_rows: list of usage value lists, one per circuit
+    :param capacity_rows: list of capacity value lists, same order and units as usage_rows
+    :param usage_times: Optional - list of bucket time lists matching usage_rows. With capacity_times, usage and
+                        capacity are matched on bucket time instead of position.
+    :param capacity_times: Optional - list of bucket time lists matching capacity_rows
+    :return: list of BandwidthStats, one per circuit
+    """
+    if not usage_rows:
+        return []
+
+    if usage_times is not None and capacity_times is not None:
+        aligned_rows = [align_series(*row) for row in zip(usage_times, usage_rows, capacity_times, capacity_rows)]
+        usage_rows = [usage for usage, _ in aligned_rows]
+        capacity_rows = [capacity for _, capacity in aligned_rows]
+
+    width = max(len(row) for row in list(usage_rows) + list(capacity_rows))
+    usage = to_matrix(usage_rows, width)
+    capacity = to_matrix(capacity_rows, width)
+
+    with warnings.catch_warnings(), np.errstate(divide='ignore', invalid='ignore'):
+        # all-NaN rows (no data) are expected, and give NaN.
+        warnings.simplefilter('ignore', RuntimeWarning)
+        capacity[~(capacity > 0)] = np.nan
+        utilization = usage / capacity * 100
+
+        usage_avg = np.nanmean(usage, axis=1)
+        usage_p95 = np.nanpercentile(usage, 95, axis=1)
+        capacity_max = np.nanmax(capacity, axis=1)
+        util_p50, util_p95 = np.nanpercentile(utilization, [50, 95], axis=1)
+        util_max = np.nanmax(utilization, axis=1)
+
+    return [BandwidthStats(*[float(value) for value in row])
+            for row in zip(usage_avg, usage_p95, capacity_max, util_p50, util_p95, util_max)]
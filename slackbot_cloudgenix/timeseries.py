@@ -0,0 +1,186 @@
+# -*- coding: UTF-8 -*-
+# standard modules
+import logging
+import calendar
+import datetime
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Datapoints kept per series (24 hours of 5 minute buckets).
+SERIES_CAPACITY = 288
+
+# Max series kept, least recently used series are dropped first.
+SERIES_STORE_SIZE = 2048
+
+
+def parse_metrics_time(time_string):
+    """
+    Convert a metrics API datapoint time to epoch seconds.
+    :param time_string: eg, "2016-11-18T17:20:00.000Z"
+    :return: int epoch seconds, or None if not parsable.
+    """
+    try:
+        return calendar.timegm(datetime.datetime.strptime(time_string[:19], '%Y-%m-%dT%H:%M:%S').timetuple())
+    except (TypeError, ValueError):
+        return None
+
+
+class RingBuffer(object):
+    """
+    Fixed-size buffer of (epoch time, value) points in time order, oldest overwritten first.
+    Missing values are stored as NaN.
+    """
+
+    def __init__(self, capacity=SERIES_CAPACITY):
+        """
+        :param capacity: Max points kept
+        """
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.values = np.full(capacity, np.nan, dtype=np.float64)
+        # index the next point is written to, and number of points held.
+        self.head = 0
+        self.size = 0
+        # newest bucket a fetch covered, recorded even when the fetch returned no point for it.
+        self.fetched_time = None
+
+    @property
+    def last_time(self):
+        """
+        :return: Epoch time of the newest point, or None if empty.
+        """
+        if not self.size:
+            return None
+        return int(self.times[(self.head - 1) % self.capacity])
+
+    def append(self, point_time, value):
+        """
+        Add a point. A point at the newest time replaces it (buckets can fill in late), older points are ignored.
+        :param point_time: Epoch seconds
+        :param value: Number or None
+        :return: None
+        """
+        value = np.nan if value is None else value
+        last_time = self.last_time
+
+        if last_time is not None and point_time < last_time:
+            return
+        if last_time is not None and point_time == last_time:
+            self.values[(self.head - 1) % self.capacity] = value
+            return
+
+        self.times[self.head] = point_time
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def points(self, start_time, end_time):
+        """
+        Get the points with start_time <= time < end_time, oldest first.
+        :param start_time: Epoch seconds
+        :param end_time: Epoch seconds
+        :return: tuple of (numpy int64 array of times, numpy float64 array of values)
+        """
+        order = np.arange(self.head - self.size, self.head) % self.capacity
+        times = self.times[order]
+        in_window = (times >= start_time) & (times < end_time)
+        return times[in_window], self.values[order][in_window]
+
+    def window(self, start_time, end_time):
+        """
+        Get the values with start_time <= time < end_time, oldest first.
+        :param start_time: Epoch seconds
+        :param end_time: Epoch seconds
+        :return: numpy float64 array
+        """
+        return self.points(start_time, end_time)[1]
+
+
+class SeriesStore(object):
+    """
+    Thread safe store of metric series, each a RingBuffer keyed by (metric, app, site, path, direction).
+    Holds at most maxsize series.
+    """
+
+    def __init__(self, capacity=SERIES_CAPACITY, maxsize=SERIES_STORE_SIZE):
+        """
+        :param capacity: Points kept per series
+        :param maxsize: Max number of series
+        """
+        self.capacity = capacity
+        self.maxsize = maxsize
+        self.series = OrderedDict()
+        self._lock = threading.Lock()
+
+    def last_time(self, key):
+        """
+        :param key: Series key
+        :return: Epoch time of the newest bucket fetched for the series (its newest stored point, or a later
+                 fetched_time passed to extend), or None if nothing was fetched.
+        """
+        with self._lock:
+            buffer = self.series.get(key)
+            if buffer is None:
+                return None
+            times = [time for time in (buffer.last_time, buffer.fetched_time) if time is not None]
+            return max(times) if times else None
+
+    def extend(self, key, datapoints, fetched_time=None):
+        """
+        Add metrics API datapoints to a series.
+        :param key: Series key
+        :param datapoints: list of {"time": ..., "value": ...} dicts, oldest first
+        :param fetched_time: Optional - Epoch time of the newest bucket the fetch covered. Recorded even if
+                             datapoints is empty, so a series with no data isn't fetched in full again.
+        :return: None
+        """
+        with self._lock:
+            buffer = self.series.get(key)
+            if buffer is None:
+                buffer = self.series[key] = RingBuffer(self.capacity)
+                while len(self.series) > self.maxsize:
+                    self.series.popitem(last=False)
+            self.series.move_to_end(key)
+
+            for datapoint in datapoints:
+                point_time = parse_metrics_time(datapoint.get('time'))
+                if point_time is not None:
+                    buffer.append(point_time, datapoint.get('value', None))
+
+            if fetched_time is not None and (buffer.fetched_time is None or fetched_time > buffer.fetched_time):
+                buffer.fetched_time = fetched_time
+
+    def points(self, key, start_time, end_time):
+        """
+        Get a series' points for a time window.
+        :param key: Series key
+        :param start_time: Epoch seconds (inclusive)
+        :param end_time: Epoch seconds (exclusive)
+        :return: tuple of (numpy int64 array of times, numpy float64 array of values), or None if the series is
+                 not stored.
+        """
+        with self._lock:
+            buffer = self.series.get(key)
+            if buffer is None:
+                return None
+            self.series.move_to_end(key)
+            return buffer.points(start_time, end_time)
+
+    def window(self, key, start_time, end_time):
+        """
+        Get a series' values for a time window.
+        :param key: Series key
+        :param start_time: Epoch seconds (inclusive)
+        :param end_time: Epoch seconds (exclusive)
+        :return: numpy float64 array, or None if the series is not stored.
+        """
+        points = self.points(key, start_time, end_time)
+        return None if points is None else points[1]
+
+    def clear(self):
+        with self._lock:
+            self.series.clear()
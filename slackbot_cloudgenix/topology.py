@@ -3,642 +3,605 @@
 import logging
 import json
 import time
+from collections import namedtuple
+from functools import partial
+
 import slackbot_cloudgenix.metrics as metrics
+from .cache import TTLCache, SingleFlight
 
 logger = logging.getLogger(__name__)
 
-
-def render_topology(passed_site_id, sdk, id2n):
-    logger.info('render_topology start: ')
-
+TOPOLOGY_ERROR_MSG = "Sorry, couldn't query the site topology at this moment. Please try later."
+APP_PATHS_ERROR_MSG = "Sorry, couldn't query the application info for this site at the moment. Please try later."
+MEDIA_PATHS_ERROR_MSG = "Sorry, couldn't query the media application info for this site at the moment. " \
+                        "Please try later."
+
+# link status -> slack attachment color, anything else is grey.
+STATUS_COLORS = {
+    'up': 'good',
+    'down': 'danger'
+}
+UNKNOWN_COLOR = "#888888"
+
+# How a link is shown. group: attachment group (see layouts below), render: text function (LINK_RENDERERS key).
+LinkClass = namedtuple('LinkClass', ['group', 'render'])
+
+# link type (lower case) -> LinkClass. Other types (vpn, servicelink, ..) are not shown.
+LINK_CLASSES = {
+    "internet-stub": LinkClass('internet', 'stub'),
+    "priv-wan-stub": LinkClass('private_wan', 'stub'),
+    "anynet": LinkClass('internet_vpn', 'anynet'),
+    "public-anynet": LinkClass('internet_vpn', 'anynet'),
+    "private-anynet": LinkClass('private_wan_vpn', 'anynet'),
+}
+
+# Attachment groups in display order, with the pretext for the first attachment of each.
+TOPOLOGY_LAYOUT = [
+    ('internet', "*Internet*"),
+    ('private_wan', "*Private WAN*"),
+    ('internet_vpn', "*AppFabric over Internet*"),
+    ('private_wan_vpn', "*AppFabric over Private WAN*"),
+]
+PATHS_LAYOUT = [
+    ('internet', "*Internet*"),
+    ('internet_vpn', "*VPN over Internet*"),
+    ('private_wan', "*Private WAN*"),
+    ('private_wan_vpn', "*VPN over Private WAN*"),
+]
+
+# 95th percentile utilization (percent) where a circuit shows as warning / danger.
+BANDWIDTH_WARNING_PERCENT = 70
+BANDWIDTH_DANGER_PERCENT = 90
+
+BANDWIDTH_CIRCUIT_TYPES = {
+    "internet-stub": "Internet",
+    "priv-wan-stub": "Private WAN"
+}
+
+BANDWIDTH_ERROR_MSG = "Sorry, couldn't query the bandwidth info for this site at the moment. Please try later."
+
+# Concurrent site topology queries, and seconds to wait for all of them, for fleet status ("status of all").
+FLEET_WORKERS = 8
+FLEET_DEADLINE = 30
+# Max degraded sites listed in a fleet status reply.
+FLEET_MAX_DEGRADED = 40
+
+FLEET_ERROR_MSG = "Sorry, couldn't find any sites to check."
+
+# Seconds a site's topology is reused between commands (0 disables), and max sites cached.
+TOPOLOGY_CACHE_TTL = 60
+TOPOLOGY_CACHE_SIZE = 1024
+
+
+def fetch_site_links(site_id, sdk):
+    """
+    Query the basenet topology links of a site.
+    :param site_id: Site ID
+    :param sdk: Authenticated CloudGenix SDK Constructor
+    :return: list of link dicts, or None if the query failed.
+    """
     query = {
         "type": "basenet",
         "nodes": [
-            passed_site_id
+            site_id
         ]
     }
     topology_resp = sdk.post.topology(query)
-    status = topology_resp.cgx_status
-    topology = topology_resp.cgx_content
-
-    if status:
-        # (id2n should be more complete) create site ID to name lookup table.
-        # node_lookup = {}
-        #
-        # for node in topology.get('nodes', []):
-        #     node_id = node.get('id')
-        #     name = node.get('name')
-        #
-        #     if node_id and name:
-        #         node_lookup[node_id] = name
-
-        pub_anynet_links = []
-        priv_anynet_links = []
-        priv_links = []
-        pub_links = []
-
-        vpn_id_lookup = {}
-
-        # pre-iterate and extract vpn-class links
-        for link in topology.get('links', []):
-            vpn_id = link.get('path_id')
-            if link.get('type').lower() in ["vpn"] and vpn_id:
-                vpn_id_lookup['vpn_id'] = link
-
-        # create list of links.
-        # print(json.dumps(topology.get('links', []), indent=4))
-
-        test = {
-                   "_etag": 0,
-                   "_schema": 0,
-                   "_created_on_utc": 15715557714610031,
-                   "_updated_on_utc": 0,
-                   "path_id": "15715557713050119",
-                   "source_node_id": "14999711899520156",
-                   "source_site_name": "Washington D.C. - DC 2",
-                   "target_node_id": "14994856888650209",
-                   "target_site_name": "New York Branch 1",
-                   "status": "up",
-                   "type": "vpn",
-                   "source_wan_if_id": "14994575846300032",
-                   "source_wan_network": "Verizon-MPLS",
-                   "source_wan_nw_id": "14994517570580047",
-                   "target_wan_if_id": "14994517585570072",
-                   "target_wan_network": "Verizon-MPLS",
-                   "target_wan_nw_id": "14994517570580047",
-                   "anynet_link_id": "14994575875140196"
-               },
-
-        for link in topology.get('links', []):
-
-            if link.get('type').lower() in ["priv-wan-stub"]:
-                network = link.get('network', link.get('path_id', '<UNKNOWN>'))
-                status = link.get('status')
-                color = "#888888"
-
-                if status.lower() == 'up':
-                    color = 'good'
-                elif status.lower() == 'down':
-                    color = 'danger'
-
-                # add to list
-                priv_links.append(
-                    {
-                        'text': network,
-                        'color': color
-                    }
-                )
-
-            elif link.get('type').lower() in ["internet-stub"]:
-                network = link.get('network', link.get('path_id', '<UNKNOWN>'))
-                status = link.get('status')
-                color = "#888888"
-
-                if status.lower() == 'up':
-                    color = 'good'
-                elif status.lower() == 'down':
-                    color = 'danger'
-
-                # add to list
-                pub_links.append(
-                    {
-                        'text': network,
-                        'color': color
-                    }
-                )
-
-            elif link.get('type').lower() in ["anynet", "public-anynet", "private-anynet"]:
-                link_type = link.get('type').lower()
-                source_wan_network = link.get('source_wan_network')
-                source_wan_node_id = link.get('source_node_id')
-                source_wan_node = id2n.get(source_wan_node_id, source_wan_node_id)
-                target_wan_network = link.get('target_wan_network')
-                target_wan_node_id = link.get('target_node_id')
-                target_wan_node = id2n.get(target_wan_node_id, target_wan_node_id)
-                status = link.get('status')
-
-                color = "#888888"
-
-                if status.lower() == 'up':
-                    color = 'good'
-                elif status.lower() == 'down':
-                    color = 'danger'
-
-                # add to list, check for reversed order:
-                if passed_site_id == target_wan_node_id:
-                    anynet_text = "{0} ⇔ {1}".format(target_wan_node, source_wan_node)
-                    network_txt = "{0} ⇔ {1}".format(target_wan_network, source_wan_network)
-                else:
-                    anynet_text = "{0} ⇔ {1}".format(source_wan_node, target_wan_node)
-                    network_txt = "{0} ⇔ {1}".format(source_wan_network, target_wan_network)
-
-                # parse vpnlinks in anynet.
-                vpnlinks_additional_text = ""
-                vpnlinks_list = link.get('vpnlinks', [])
-                if vpnlinks_list:
-                    tunnel_num = 1
-                    for vpnlink in vpnlinks_list:
-                        vpnlinks_additional_text = "\nTunnel {0}: {1}".format(tunnel_num, network_txt)
-                        tunnel_num += 1
-
-                # add tunnel info
-                anynet_text += vpnlinks_additional_text
-                if link_type in ["anynet", "public-anynet"]:
-                    pub_anynet_links.append({
-                        'text': anynet_text,
-                        'color': color,
-                        'mrkdwn': True,
-                        'mrkdwn_in': ["pretext", "text"]
-                    })
-                elif link_type in ["private-anynet"]:
-                    priv_anynet_links.append({
-                        'text': anynet_text,
-                        'color': color,
-                        'mrkdwn': True,
-                        'mrkdwn_in': ["pretext", "text"]
-                    })
-            else:
-                pass
-
-        # combine links
-        if pub_links:
-            pub_links[0]['pretext'] = "*Internet*"
-            pub_links[0]['mrkdwn_in'] = ["pretext", "text"]
-        if priv_links:
-            priv_links[0]['pretext'] = "*Private WAN*"
-            priv_links[0]['mrkdwn_in'] = ["pretext", "text"]
-        if pub_anynet_links:
-            pub_anynet_links[0]['pretext'] = "*AppFabric over Internet*"
-            pub_anynet_links[0]['mrkdwn_in'] = ["pretext", "text"]
-        if priv_anynet_links:
-            pub_anynet_links[0]['pretext'] = "*AppFabric over Private WAN*"
-            pub_anynet_links[0]['mrkdwn_in'] = ["pretext", "text"]
-
-        combined_message = pub_links + priv_links + pub_anynet_links + priv_anynet_links
-
-        return combined_message
+
+    if topology_resp.cgx_status:
+        return topology_resp.cgx_content.get('links', [])
+    else:
+        return None
+
+
+class TopologyCache(object):
+    """
+    Per-site topology links, reused for ttl seconds. Concurrent lookups of an uncached site share one query.
+    Failed queries are not cached. Cached link lists are shared, treat them as read only.
+    If a tenant topology graph is published (see graph.py), sites are answered from it while it is at most ttl
+    seconds old, like a cached query. Tenant wide commands can use it up to graph_max_age (see fresh_graph).
+    """
+
+    def __init__(self, ttl=TOPOLOGY_CACHE_TTL, maxsize=TOPOLOGY_CACHE_SIZE):
+        """
+        :param ttl: Seconds to reuse a site's topology, 0 disables caching.
+        :param maxsize: Max number of sites cached
+        """
+        self.ttl = ttl
+        self.cache = TTLCache(maxsize=maxsize)
+        self.flight = SingleFlight()
+        self.graph = None
+        self.graph_max_age = 0
+        # when each site (or everything) was last invalidated. Older graphs, and queries already running at the
+        # time, are not used for that site.
+        self.invalidated = {}
+        self.cleared = 0
+
+    def invalidated_at(self, site_id):
+        return max(self.cleared, self.invalidated.get(site_id, 0))
+
+    def get_links(self, site_id, sdk):
+        """
+        :param site_id: Site ID
+        :param sdk: Authenticated CloudGenix SDK Constructor
+        :return: list of link dicts, or None if the query failed.
+        """
+        if self.ttl > 0:
+            found, links = self.cache.get(site_id)
+            if found:
+                return links
+
+        graph = self.fresh_graph(min(self.graph_max_age, self.ttl))
+        if graph is not None:
+            links = self.graph_links(graph, site_id)
+            if links is not None:
+                return links
+
+        return self.flight.do(site_id, self.fetch, site_id, sdk)
+
+    def fresh_graph(self, max_age=None):
+        """
+        Get the published tenant topology graph, if recent enough.
+        :param max_age: Optional - Max age in seconds (default graph_max_age)
+        :return: graph.TopologyGraph object, or None.
+        """
+        graph = self.graph
+        if graph is not None and graph.age() <= (self.graph_max_age if max_age is None else max_age):
+            return graph
+        return None
+
+    def graph_links(self, graph, site_id):
+        """
+        Get a site's links from a tenant topology graph.
+        :param graph: graph.TopologyGraph object
+        :param site_id: Site ID
+        :return: list of link dicts, or None if the graph doesn't have the site or is older than its invalidation.
+        """
+        if graph.has_site(site_id) and graph.created > self.invalidated_at(site_id):
+            return graph.links_for_site(site_id)
+        return None
+
+    def refresh_links(self, site_id, sdk):
+        """
+        Query a site now (sharing a query already running for it), and cache the result.
+        :param site_id: Site ID
+        :param sdk: Authenticated CloudGenix SDK Constructor
+        :return: list of link dicts, or None if the query failed.
+        """
+        return self.flight.do(site_id, self.fetch, site_id, sdk)
+
+    def fetch(self, site_id, sdk):
+        invalidated_at = self.invalidated_at(site_id)
+        links = fetch_site_links(site_id, sdk)
+        if links is not None and self.ttl > 0 and self.invalidated_at(site_id) == invalidated_at:
+            self.cache.set(site_id, links, time.time() + self.ttl)
+        return links
+
+    def publish_graph(self, graph, max_age):
+        """
+        Answer sites from a tenant topology graph.
+        :param graph: graph.TopologyGraph object
+        :param max_age: Seconds after graph.created to stop using it, for single sites also capped at ttl.
+        :return: None
+        """
+        self.graph_max_age = max_age
+        self.graph = graph
+
+    def invalidate(self, site_id):
+        """
+        Drop a site's cached topology, the next lookup queries it again.
+        :param site_id: Site ID
+        :return: Bool, True if the site was cached.
+        """
+        self.invalidated[site_id] = time.time()
+        return self.cache.delete(site_id)
+
+    def clear(self):
+        self.cleared = time.time()
+        self.cache.clear()
+
+
+topology_cache = TopologyCache()
+
+
+def get_site_links(site_id, sdk):
+    """
+    Get the basenet topology links of a site, from topology_cache where possible.
+    :param site_id: Site ID
+    :param sdk: Authenticated CloudGenix SDK Constructor
+    :return: list of link dicts, or None if the query failed.
+    """
+    return topology_cache.get_links(site_id, sdk)
+
+
+def classify_links(links):
+    """
+    Classify topology links once, and collect the path IDs that can have stats.
+    :param links: list of topology link dicts
+    :return: Tuple of (list of (LinkClass, link) in link order, list of path IDs in link order)
+    """
+    classified = []
+    path_ids = []
+    for link in links:
+        link_class = LINK_CLASSES.get((link.get('type') or '').lower())
+        if link_class is None:
+            continue
+        classified.append((link_class, link))
+
+        if link_class.render == 'stub':
+            if link.get('path_id'):
+                path_ids.append(link['path_id'])
+        else:
+            path_ids.extend([vpnlink for vpnlink in link.get('vpnlinks', []) if vpnlink])
+
+    return classified, path_ids
+
+
+def site_path_ids(links):
+    """
+    Get the path IDs with stats for a site topology: stub link paths and anynet vpnlinks, in link order.
+    :param links: list of topology link dicts
+    :return: list of path IDs
+    """
+    return classify_links(links)[1]
+
+
+def status_color(status):
+    """
+    :param status: link status string
+    :return: slack attachment color
+    """
+    return STATUS_COLORS.get((status or '').lower(), UNKNOWN_COLOR)
+
+
+def link_is_down(link):
+    """
+    :param link: topology link dict
+    :return: Bool, True if the link status is down.
+    """
+    return (link.get('status') or '').lower() == 'down'
+
+
+def render_stub_text(link, site_id, id2n, path_stats_lookup):
+    """
+    Text for an Internet / Private WAN stub link.
+    :param link: topology link dict
+    :param site_id: Site ID the topology is for
+    :param id2n: ID to Name lookup dict
+    :param path_stats_lookup: dict of path ID -> stats string
+    :return: text string
+    """
+    network = link.get('network', link.get('path_id', '<UNKNOWN>'))
+
+    # if we get stats, add it to the text.
+    path_stats = path_stats_lookup.get(link.get('path_id'))
+    if path_stats:
+        network += path_stats
+
+    return network
+
+
+def render_anynet_text(link, site_id, id2n, path_stats_lookup):
+    """
+    Text for an anynet (VPN) link, this site first, with a line (and stats) per tunnel.
+    :param link: topology link dict
+    :param site_id: Site ID the topology is for
+    :param id2n: ID to Name lookup dict
+    :param path_stats_lookup: dict of path ID -> stats string
+    :return: text string
+    """
+    source_wan_network = link.get('source_wan_network')
+    source_wan_node_id = link.get('source_node_id')
+    source_wan_node = id2n.get(source_wan_node_id, source_wan_node_id)
+    target_wan_network = link.get('target_wan_network')
+    target_wan_node_id = link.get('target_node_id')
+    target_wan_node = id2n.get(target_wan_node_id, target_wan_node_id)
+
+    # check for reversed order:
+    if site_id == target_wan_node_id:
+        anynet_text = "{0} ⇔ {1}".format(target_wan_node, source_wan_node)
+        network_txt = "{0} ⇔ {1}".format(target_wan_network, source_wan_network)
     else:
+        anynet_text = "{0} ⇔ {1}".format(source_wan_node, target_wan_node)
+        network_txt = "{0} ⇔ {1}".format(source_wan_network, target_wan_network)
+
+    # parse vpnlinks in anynet.
+    for tunnel_num, vpnlink in enumerate(link.get('vpnlinks', []), 1):
+        anynet_text += "\nTunnel {0}: {1}".format(tunnel_num, network_txt)
+
+        # if we get stats, add it to the text.
+        path_stats = path_stats_lookup.get(vpnlink) if vpnlink else None
+        if path_stats:
+            anynet_text += path_stats
+
+    return anynet_text
+
+
+LINK_RENDERERS = {
+    'stub': render_stub_text,
+    'anynet': render_anynet_text,
+}
+
+
+def render_links(site_id, links, id2n, layout, stats_provider=None, mrkdwn=True):
+    """
+    Render topology links as grouped slack attachments, in one pass over the links.
+    :param site_id: Site ID the topology is for
+    :param links: list of topology link dicts
+    :param id2n: ID to Name lookup dict
+    :param layout: list of (group, pretext) in display order, eg TOPOLOGY_LAYOUT
+    :param stats_provider: Optional - callable taking a list of path IDs, returns dict of path ID -> stats string.
+                           Called once for all paths of the site.
+    :param mrkdwn: Bool, mark attachment text as markdown. Or a collection of link renders ('stub', 'anynet') to
+                   mark only those.
+    :return: list of slack attachments
+    """
+    classified, path_ids = classify_links(links)
+    path_stats_lookup = stats_provider(path_ids) if stats_provider and path_ids else {}
+
+    groups = dict((group, []) for group, _ in layout)
+    for link_class, link in classified:
+        attachment = {
+            'text': LINK_RENDERERS[link_class.render](link, site_id, id2n, path_stats_lookup),
+            'color': status_color(link.get('status'))
+        }
+        if mrkdwn is True or (mrkdwn and link_class.render in mrkdwn):
+            attachment['mrkdwn'] = True
+            attachment['mrkdwn_in'] = ["pretext", "text"]
+        groups[link_class.group].append(attachment)
+
+    # combine links
+    combined_message = []
+    for group, pretext in layout:
+        if groups[group]:
+            groups[group][0]['pretext'] = pretext
+            groups[group][0]['mrkdwn_in'] = ["pretext", "text"]
+            combined_message += groups[group]
+
+    return combined_message
+
+
+def render_site_links(site_id, sdk, id2n, layout, error_msg, stats_provider=None, mrkdwn=True):
+    """
+    Query a site's topology and render it, see render_links.
+    :param site_id: Site ID
+    :param sdk: Authenticated CloudGenix SDK Constructor
+    :param id2n: ID to Name lookup dict
+    :param layout: list of (group, pretext) in display order
+    :param error_msg: pretext to reply with if the topology query fails
+    :param stats_provider: Optional - per-path stats callable, see render_links
+    :param mrkdwn: Bool or collection of link renders, see render_links
+    :return: list of slack attachments
+    """
+    links = get_site_links(site_id, sdk)
+    if links is None:
+        return [{'pretext': error_msg}]
+
+    return render_links(site_id, links, id2n, layout, stats_provider=stats_provider, mrkdwn=mrkdwn)
 
-        return [{'pretext': "Sorry, couldn't query the site topology at this moment. Please try later."}]
 
+def render_topology(passed_site_id, sdk, id2n):
+    logger.info('render_topology start: ')
+    # only anynet link text is marked as markdown here.
+    return render_site_links(passed_site_id, sdk, id2n, TOPOLOGY_LAYOUT, TOPOLOGY_ERROR_MSG, mrkdwn=('anynet',))
 
-def render_site_app_paths(app_id, site_id, sdk, id2n, stats_app_id=None):
+
+def render_site_app_paths(app_id, site_id, sdk, id2n, stats_app_id=None, workers=metrics.METRICS_WORKERS,
+                          deadline=metrics.METRICS_DEADLINE, window=None):
     # if querying unknown, and stats_app_id is passed, use that for stats.
     if not stats_app_id:
         stats_app_id = app_id
 
-    query = {
-        "type": "basenet",
-        "nodes": [
-            site_id
-        ]
-    }
-    topology_resp = sdk.post.topology(query)
-    status = topology_resp.cgx_status
-    topology = topology_resp.cgx_content
-
-    if status:
-        # create site ID to name lookup table.
-
-        public_anynet_links = []
-        private_anynet_links = []
-        priv_links = []
-        pub_links = []
-
-        vpn_id_lookup = {}
-
-        # pre-iterate and extract vpn-class links
-        for link in topology.get('links', []):
-            vpn_id = link.get('path_id')
-            if link.get('type').lower() in ["vpn"] and vpn_id:
-                vpn_id_lookup['vpn_id'] = link
-
-        # create list of links.
-        for link in topology.get('links', []):
-
-            if link.get('type').lower() in ["priv-wan-stub"]:
-                network = link.get('network', link.get('path_id', '<UNKNOWN>'))
-                status = link.get('status')
-                color = "#888888"
-
-                if status.lower() == 'up':
-                    color = 'good'
-                elif status.lower() == 'down':
-                    color = 'danger'
-
-                # Get stats for path.
-                path_id = link.get('path_id')
-                if path_id:
-                    # get path stats string
-                    path_stats = metrics.apprt_site_app_path_summary(stats_app_id, site_id, path_id, sdk, id2n)
-
-                    # if we get stats, add it to the text.
-                    if path_stats:
-                        network += path_stats
-
-                # add to list
-                priv_links.append(
-                    {
-                        'text': network,
-                        'color': color,
-                        'mrkdwn': True,
-                        'mrkdwn_in': ["pretext", "text"]
-                    }
-                )
-
-            elif link.get('type').lower() in ["internet-stub"]:
-                network = link.get('network', link.get('path_id', '<UNKNOWN>'))
-                status = link.get('status')
-                color = "#888888"
-
-                if status.lower() == 'up':
-                    color = 'good'
-                elif status.lower() == 'down':
-                    color = 'danger'
-
-                # Get stats for path.
-                path_id = link.get('path_id')
-                if path_id:
-                    # get path stats string
-                    path_stats = metrics.apprt_site_app_path_summary(stats_app_id, site_id, path_id, sdk, id2n)
-
-                    # if we get stats, add it to the text.
-                    if path_stats:
-                        network += path_stats
-
-                # add to list
-                pub_links.append(
-                    {
-                        'text': network,
-                        'color': color,
-                        'mrkdwn': True,
-                        'mrkdwn_in': ["pretext", "text"]
-                    }
-                )
-
-            elif link.get('type').lower() in ["anynet", "public-anynet"]:
-
-                source_wan_network = link.get('source_wan_network')
-                source_wan_node_id = link.get('source_node_id')
-                source_wan_node = id2n.get(source_wan_node_id, source_wan_node_id)
-                target_wan_network = link.get('target_wan_network')
-                target_wan_node_id = link.get('target_node_id')
-                target_wan_node = id2n.get(target_wan_node_id, target_wan_node_id)
-                status = link.get('status')
-
-                color = "#888888"
-
-                if status.lower() == 'up':
-                    color = 'good'
-                elif status.lower() == 'down':
-                    color = 'danger'
-
-                # add to list, check for reversed order:
-                if site_id == target_wan_node_id:
-                    anynet_text = "{0} ⇔ {1}".format(target_wan_node, source_wan_node)
-                    network_txt = "{0} ⇔ {1}".format(target_wan_network, source_wan_network)
-                else:
-                    anynet_text = "{0} ⇔ {1}".format(source_wan_node, target_wan_node)
-                    network_txt = "{0} ⇔ {1}".format(source_wan_network, target_wan_network)
-
-                # parse vpnlinks in anynet.
-                vpnlinks_additional_text = ""
-                vpnlinks_list = link.get('vpnlinks', [])
-                if vpnlinks_list:
-                    tunnel_num = 1
-                    for vpnlink in vpnlinks_list:
-                        vpnlinks_additional_text = "\nTunnel {0}: {1}".format(tunnel_num, network_txt)
-                        tunnel_num += 1
-                        path_id = vpnlink
-                        if path_id:
-                            # get path stats string
-                            path_stats = metrics.apprt_site_app_path_summary(stats_app_id, site_id, path_id, sdk, id2n)
-
-                            # if we get stats, add it to the text.
-                            if path_stats:
-                                vpnlinks_additional_text += path_stats
-
-                # add tunnel info
-                anynet_text += vpnlinks_additional_text
-
-                public_anynet_links.append(
-                    {
-                        'text': anynet_text,
-                        'color': color,
-                        'mrkdwn': True,
-                        'mrkdwn_in': ["pretext", "text"]
-                    }
-                )
-
-            elif link.get('type').lower() in ["private-anynet"]:
-
-                source_wan_network = link.get('source_wan_network')
-                source_wan_node_id = link.get('source_node_id')
-                source_wan_node = id2n.get(source_wan_node_id, source_wan_node_id)
-                target_wan_network = link.get('target_wan_network')
-                target_wan_node_id = link.get('target_node_id')
-                target_wan_node = id2n.get(target_wan_node_id, target_wan_node_id)
-                status = link.get('status')
-
-                color = "#888888"
-
-                if status.lower() == 'up':
-                    color = 'good'
-                elif status.lower() == 'down':
-                    color = 'danger'
-
-                # add to list, check for reversed order:
-                if site_id == target_wan_node_id:
-                    anynet_text = "{0} ⇔ {1}".format(target_wan_node, source_wan_node)
-                    network_txt = "{0} ⇔ {1}".format(target_wan_network, source_wan_network)
-                else:
-                    anynet_text = "{0} ⇔ {1}".format(source_wan_node, target_wan_node)
-                    network_txt = "{0} ⇔ {1}".format(source_wan_network, target_wan_network)
-
-                # parse vpnlinks in anynet.
-                vpnlinks_additional_text = ""
-                vpnlinks_list = link.get('vpnlinks', [])
-                if vpnlinks_list:
-                    tunnel_num = 1
-                    for vpnlink in vpnlinks_list:
-                        vpnlinks_additional_text = "\nTunnel {0}: {1}".format(tunnel_num, network_txt)
-                        tunnel_num += 1
-                        path_id = vpnlink
-                        if path_id:
-                            # get path stats string
-                            path_stats = metrics.apprt_site_app_path_summary(stats_app_id, site_id, path_id, sdk, id2n)
-
-                            # if we get stats, add it to the text.
-                            if path_stats:
-                                vpnlinks_additional_text += path_stats
-
-                # add tunnel info
-                anynet_text += vpnlinks_additional_text
-
-                private_anynet_links.append(
-                    {
-                        'text': anynet_text,
-                        'color': color,
-                        'mrkdwn': True,
-                        'mrkdwn_in': ["pretext", "text"]
-                    }
-                )
-
-            else:
-                pass
-
-        # combine links
-        if pub_links:
-            pub_links[0]['pretext'] = "*Internet*"
-            pub_links[0]['mrkdwn_in'] = ["pretext", "text"]
-        if priv_links:
-            priv_links[0]['pretext'] = "*Private WAN*"
-            priv_links[0]['mrkdwn_in'] = ["pretext", "text"]
-        if public_anynet_links:
-            public_anynet_links[0]['pretext'] = "*VPN over Internet*"
-            public_anynet_links[0]['mrkdwn_in'] = ["pretext", "text"]
-        if private_anynet_links:
-            private_anynet_links[0]['pretext'] = "*VPN over Private WAN*"
-            private_anynet_links[0]['mrkdwn_in'] = ["pretext", "text"]
-
-        combined_message = pub_links + public_anynet_links + priv_links + private_anynet_links
-
-        return combined_message
-    else:
+    # stats for every path of the site (batched, concurrent, bounded by deadline).
+    stats_provider = partial(metrics.apprt_site_app_paths_summary, stats_app_id, site_id, sdk=sdk, id2n=id2n,
+                             workers=workers, deadline=deadline, window=window)
+    return render_site_links(site_id, sdk, id2n, PATHS_LAYOUT, APP_PATHS_ERROR_MSG, stats_provider=stats_provider)
 
-        return [
-            {'pretext': "Sorry, couldn't query the application info for this site at the moment. Please try later."}]
 
-
-def render_site_media_paths(app_id, site_id, sdk, id2n, stats_app_id=None):
+def render_site_media_paths(app_id, site_id, sdk, id2n, stats_app_id=None, workers=metrics.METRICS_WORKERS,
+                            deadline=metrics.METRICS_DEADLINE, combined=True, counter=None, window=None):
     # if querying unknown, and stats_app_id is passed, use that for stats.
     if not stats_app_id:
         stats_app_id = app_id
 
-    query = {
-        "type": "basenet",
-        "nodes": [
-            site_id
-        ]
-    }
-    topology_resp = sdk.post.topology(query)
-    status = topology_resp.cgx_status
-    topology = topology_resp.cgx_content
-
-    # query completed, parse topology
-    if status:
-        # create site ID to name lookup table.
-
-        public_anynet_links = []
-        private_anynet_links = []
-        priv_links = []
-        pub_links = []
-
-        vpn_id_lookup = {}
-
-        # pre-iterate and extract vpn-class links
-        for link in topology.get('links', []):
-            vpn_id = link.get('path_id')
-            if link.get('type').lower() in ["vpn"] and vpn_id:
-                vpn_id_lookup['vpn_id'] = link
-
-        # create list of links.
-        for link in topology.get('links', []):
-
-            if link.get('type').lower() in ["priv-wan-stub"]:
-                network = link.get('network', link.get('path_id', '<UNKNOWN>'))
-                status = link.get('status')
-                color = "#888888"
-
-                if status.lower() == 'up':
-                    color = 'good'
-                elif status.lower() == 'down':
-                    color = 'danger'
-
-                # Get stats for path.
-                path_id = link.get('path_id')
-                if path_id:
-                    # get path stats string
-                    path_stats = metrics.media_site_app_path_summary(stats_app_id, site_id, path_id,
-                                                                     sdk, id2n)
-
-                    # if we get stats, add it to the text.
-                    if path_stats:
-                        network += path_stats
-
-                # add to list
-                priv_links.append(
-                    {
-                        'text': network,
-                        'color': color,
-                        'mrkdwn': True,
-                        'mrkdwn_in': ["pretext", "text"]
-                    }
-                )
-
-            elif link.get('type').lower() in ["internet-stub"]:
-                network = link.get('network', link.get('path_id', '<UNKNOWN>'))
-                status = link.get('status')
-                color = "#888888"
-
-                if status.lower() == 'up':
-                    color = 'good'
-                elif status.lower() == 'down':
-                    color = 'danger'
-
-                # Get stats for path.
-                path_id = link.get('path_id')
-                if path_id:
-                    # get path stats string
-                    path_stats = metrics.media_site_app_path_summary(stats_app_id, site_id, path_id,
-                                                                     sdk, id2n)
-
-                    # if we get stats, add it to the text.
-                    if path_stats:
-                        network += path_stats
-
-                # add to list
-                pub_links.append(
-                    {
-                        'text': network,
-                        'color': color,
-                        'mrkdwn': True,
-                        'mrkdwn_in': ["pretext", "text"]
-                    }
-                )
-
-            elif link.get('type').lower() in ["anynet", "public-anynet"]:
-
-                source_wan_network = link.get('source_wan_network')
-                source_wan_node_id = link.get('source_node_id')
-                source_wan_node = id2n.get(source_wan_node_id, source_wan_node_id)
-                target_wan_network = link.get('target_wan_network')
-                target_wan_node_id = link.get('target_node_id')
-                target_wan_node = id2n.get(target_wan_node_id, target_wan_node_id)
-                status = link.get('status')
-
-                color = "#888888"
-
-                if status.lower() == 'up':
-                    color = 'good'
-                elif status.lower() == 'down':
-                    color = 'danger'
-
-                # add to list, check for reversed order:
-                if site_id == target_wan_node_id:
-                    anynet_text = "{0} ⇔ {1}".format(target_wan_node, source_wan_node)
-                    network_txt = "{0} ⇔ {1}".format(target_wan_network, source_wan_network)
-                else:
-                    anynet_text = "{0} ⇔ {1}".format(source_wan_node, target_wan_node)
-                    network_txt = "{0} ⇔ {1}".format(source_wan_network, target_wan_network)
-
-                # parse vpnlinks in anynet.
-                vpnlinks_additional_text = ""
-                vpnlinks_list = link.get('vpnlinks', [])
-                if vpnlinks_list:
-                    tunnel_num = 1
-                    for vpnlink in vpnlinks_list:
-                        vpnlinks_additional_text = "\nTunnel {0}: {1}".format(tunnel_num, network_txt)
-                        tunnel_num += 1
-                        path_id = vpnlink
-                        if path_id:
-                            # get path stats string
-                            path_stats = metrics.media_site_app_path_summary(stats_app_id, site_id, path_id,
-                                                                             sdk, id2n)
-
-                            # if we get stats, add it to the text.
-                            if path_stats:
-                                vpnlinks_additional_text += path_stats
-
-                # add tunnel info
-                anynet_text += vpnlinks_additional_text
-
-                public_anynet_links.append(
-                    {
-                        'text': anynet_text,
-                        'color': color,
-                        'mrkdwn': True,
-                        'mrkdwn_in': ["pretext", "text"]
-                    }
-                )
-
-            elif link.get('type').lower() in ["private-anynet"]:
-
-                source_wan_network = link.get('source_wan_network')
-                source_wan_node_id = link.get('source_node_id')
-                source_wan_node = id2n.get(source_wan_node_id, source_wan_node_id)
-                target_wan_network = link.get('target_wan_network')
-                target_wan_node_id = link.get('target_node_id')
-                target_wan_node = id2n.get(target_wan_node_id, target_wan_node_id)
-                status = link.get('status')
-
-                color = "#888888"
-
-                if status.lower() == 'up':
-                    color = 'good'
-                elif status.lower() == 'down':
-                    color = 'danger'
-
-                # add to list, check for reversed order:
-                if site_id == target_wan_node_id:
-                    anynet_text = "{0} ⇔ {1}".format(target_wan_node, source_wan_node)
-                    network_txt = "{0} ⇔ {1}".format(target_wan_network, source_wan_network)
-                else:
-                    anynet_text = "{0} ⇔ {1}".format(source_wan_node, target_wan_node)
-                    network_txt = "{0} ⇔ {1}".format(source_wan_network, target_wan_network)
-
-                # parse vpnlinks in anynet.
-                vpnlinks_additional_text = ""
-                vpnlinks_list = link.get('vpnlinks', [])
-                if vpnlinks_list:
-                    tunnel_num = 1
-                    for vpnlink in vpnlinks_list:
-                        vpnlinks_additional_text = "\nTunnel {0}: {1}".format(tunnel_num, network_txt)
-                        tunnel_num += 1
-                        path_id = vpnlink
-                        if path_id:
-                            # get path stats string
-                            path_stats = metrics.media_site_app_path_summary(stats_app_id, site_id, path_id,
-                                                                             sdk, id2n)
-
-                            # if we get stats, add it to the text.
-                            if path_stats:
-                                vpnlinks_additional_text += path_stats
-
-                # add tunnel info
-                anynet_text += vpnlinks_additional_text
-
-                private_anynet_links.append(
-                    {
-                        'text': anynet_text,
-                        'color': color,
-                        'mrkdwn': True,
-                        'mrkdwn_in': ["pretext", "text"]
-                    }
-                )
-
-            else:
-                pass
-
-        # combine links
-        if pub_links:
-            pub_links[0]['pretext'] = "*Internet*"
-            pub_links[0]['mrkdwn_in'] = ["pretext", "text"]
-        if priv_links:
-            priv_links[0]['pretext'] = "*Private WAN*"
-            priv_links[0]['mrkdwn_in'] = ["pretext", "text"]
-        if public_anynet_links:
-            public_anynet_links[0]['pretext'] = "*VPN over Internet*"
-            public_anynet_links[0]['mrkdwn_in'] = ["pretext", "text"]
-        if private_anynet_links:
-            private_anynet_links[0]['pretext'] = "*VPN over Private WAN*"
-            private_anynet_links[0]['mrkdwn_in'] = ["pretext", "text"]
-
-        combined_message = pub_links + public_anynet_links + priv_links + private_anynet_links
-
-        return combined_message
-    else:
-
-        return [{
-            'pretext': "Sorry, couldn't query the media application info for this site at the moment. "
-                       "Please try later."}]
+    # stats for every path of the site (batched, concurrent, bounded by deadline).
+    stats_provider = partial(metrics.media_site_app_paths_summary, stats_app_id, site_id, sdk=sdk, id2n=id2n,
+                             workers=workers, deadline=deadline, combined=combined, counter=counter,
+                             window=window)
+    return render_site_links(site_id, sdk, id2n, PATHS_LAYOUT, MEDIA_PATHS_ERROR_MSG, stats_provider=stats_provider)
+
+
+def bandwidth_color(util_p95):
+    """
+    Attachment color for a circuit's 95th percentile utilization.
+    :param util_p95: percent, or NaN if unknown
+    :return: slack attachment color
+    """
+    if util_p95 != util_p95:
+        # NaN, no data.
+        return "#888888"
+    elif util_p95 >= BANDWIDTH_DANGER_PERCENT:
+        return 'danger'
+    elif util_p95 >= BANDWIDTH_WARNING_PERCENT:
+        return 'warning'
+    return 'good'
+
+
+def render_site_bandwidth(site_id, sdk, id2n, workers=metrics.METRICS_WORKERS, deadline=metrics.METRICS_DEADLINE,
+                          window=None):
+    """
+    Render bandwidth usage vs capacity for every circuit (Internet and Private WAN stub path) of a site, most
+    congested (highest 95th percentile utilization, either direction) first.
+    :param site_id: Site ID
+    :param sdk: Authenticated CloudGenix SDK Constructor
+    :param id2n: ID to Name lookup dict
+    :param workers: Max concurrent metrics queries
+    :param deadline: Seconds to wait for all metrics queries
+    :param window: Optional - MetricsWindow from metrics.metrics_window() (default last 24 hours)
+    :return: list of slack attachments
+    """
+    links = get_site_links(site_id, sdk)
+    if links is None:
+        return [{'pretext': BANDWIDTH_ERROR_MSG}]
+
+    circuits = [link for link_class, link in classify_links(links)[0]
+                if link_class.render == 'stub' and link.get('path_id')]
+    if not circuits:
+        return [{'pretext': "No circuits found for this site."}]
+
+    path_stats_lookup = metrics.bandwidth_site_paths_summary(site_id, [link['path_id'] for link in circuits], sdk,
+                                                             workers=workers, deadline=deadline, window=window)
+
+    rows = []
+    for link in circuits:
+        direction_stats = path_stats_lookup.get(link['path_id'], {})
+        util_p95_list = [stats.util_p95 for stats in direction_stats.values() if stats.util_p95 == stats.util_p95]
+        congestion = max(util_p95_list) if util_p95_list else float('nan')
+
+        text = "*{0}* ({1}, {2})\n".format(link.get('network', link['path_id']),
+                                          BANDWIDTH_CIRCUIT_TYPES.get(link['type'].lower(), link['type']),
+                                          link.get('status', 'unknown'))
+        if not direction_stats:
+            text += " _Stats unavailable._\n"
+        for direction in metrics.BANDWIDTH_DIRECTIONS:
+            stats = direction_stats.get(direction)
+            if stats is None:
+                continue
+            text += " *{0}* - Util 50th *{1:.0f}%*, 95th *{2:.0f}%*, Max *{3:.0f}%* | Usage Avg *{4:.2f}Mbps*, " \
+                    "95th *{5:.2f}Mbps* of *{6:.2f}Mbps*\n".format(metrics.DIRECTION_LABELS[direction].strip(),
+                                                                   stats.util_p50, stats.util_p95, stats.util_max,
+                                                                   stats.usage_avg, stats.usage_p95, stats.capacity)
+
+        rows.append((congestion, {
+            'text': text,
+            'color': bandwidth_color(congestion),
+            'mrkdwn': True,
+            'mrkdwn_in': ["pretext", "text"]
+        }))
+
+    # most congested first, circuits without data last.
+    rows.sort(key=lambda row: -row[0] if row[0] == row[0] else float('inf'))
+    return [attachment for _, attachment in rows]
+
+
+def get_fleet_site_ids(sdk, tag=None):
+    """
+    Get the Site IDs for a fleet status, from the tenant topology graph if published.
+    :param sdk: Authenticated CloudGenix SDK Constructor
+    :param tag: Optional - only sites with this tag (case insensitive)
+    :return: list of Site IDs, or None if the sites query failed.
+    """
+    graph = topology_cache.graph
+    if graph is not None:
+        return graph.sites_for_tag(tag) if tag else list(graph.site_ids)
+
+    sites_resp = sdk.get.sites()
+    if not sites_resp.cgx_status:
+        return None
+    return [site['id'] for site in sdk.extract_items(sites_resp, 'sites')
+            if site.get('id') and (not tag or tag.lower() in [site_tag.lower() for site_tag in site.get('tags') or []])]
+
+
+def count_link_status(classified):
+    """
+    Count link status per attachment group.
+    :param classified: list of (LinkClass, link) from classify_links
+    :return: dict of group -> [up, down, other] counts
+    """
+    counts = {}
+    for link_class, link in classified:
+        group_counts = counts.setdefault(link_class.group, [0, 0, 0])
+        status = (link.get('status') or '').lower()
+        if status == 'up':
+            group_counts[0] += 1
+        elif status == 'down':
+            group_counts[1] += 1
+        else:
+            group_counts[2] += 1
+    return counts
+
+
+def render_fleet_status(site_ids, sdk, id2n, workers=FLEET_WORKERS, deadline=FLEET_DEADLINE,
+                        max_degraded=FLEET_MAX_DEGRADED):
+    """
+    Render link health for many sites: up/down totals per link type, then only the sites with a link down.
+    Sites in a recent tenant topology graph (see TopologyCache.fresh_graph) are not queried, the reply shows its age.
+    :param site_ids: list of Site IDs
+    :param sdk: Authenticated CloudGenix SDK Constructor
+    :param id2n: ID to Name lookup dict
+    :param workers: Max concurrent topology queries
+    :param deadline: Seconds to wait for all topology queries
+    :param max_degraded: Max degraded sites listed
+    :return: list of slack attachments
+    """
+    if not site_ids:
+        return [{'pretext': FLEET_ERROR_MSG}]
+
+    # sites in a recent tenant topology graph are answered from it, the rest are queried.
+    site_links = {}
+    graph = topology_cache.fresh_graph()
+    if graph is not None:
+        for site_id in site_ids:
+            links = topology_cache.graph_links(graph, site_id)
+            if links is not None:
+                site_links[site_id] = links
+    graph_sites = len(site_links)
+
+    query_site_ids = [site_id for site_id in site_ids if site_id not in site_links]
+    if query_site_ids:
+        site_links.update(metrics.run_stats_jobs([(site_id, partial(get_site_links, site_id, sdk))
+                                                  for site_id in query_site_ids], workers=workers, deadline=deadline))
+
+    totals = {}
+    degraded = []
+    unavailable = 0
+    for site_id in site_ids:
+        links = site_links.get(site_id)
+        if links is None:
+            unavailable += 1
+            continue
+
+        classified = classify_links(links)[0]
+        counts = count_link_status(classified)
+        for group, group_counts in counts.items():
+            total_counts = totals.setdefault(group, [0, 0, 0])
+            for index, count in enumerate(group_counts):
+                total_counts[index] += count
+
+        if any(group_counts[1] for group_counts in counts.values()):
+            degraded.append((id2n.get(site_id, site_id), counts))
+
+    summary_text = ""
+    for group, label in TOPOLOGY_LAYOUT:
+        if group in totals:
+            up, down, other = totals[group]
+            summary_text += "{0}: {1} up, {2} down{3}\n".format(label, up, down,
+                                                               ", {0} unknown".format(other) if other else "")
+    if unavailable:
+        summary_text += "_{0} site(s) couldn't be checked in time._\n".format(unavailable)
+    if graph_sites:
+        summary_text += "_{0} site(s) as of {1:.0f}s ago._\n".format(graph_sites, graph.age())
+
+    combined_message = [{
+        'pretext': "*{0} of {1} sites degraded*".format(len(degraded), len(site_ids)),
+        'text': summary_text or "No links found.",
+        'color': 'danger' if degraded else ('good' if not unavailable else UNKNOWN_COLOR),
+        'mrkdwn_in': ["pretext", "text"]
+    }]
+
+    degraded.sort(key=lambda item: item[0])
+    for site_name, counts in degraded[:max_degraded]:
+        down_text = ", ".join("{0} {1}/{2} down".format(label.strip('*'), counts[group][1], sum(counts[group]))
+                              for group, label in TOPOLOGY_LAYOUT if counts.get(group, [0, 0, 0])[1])
+        combined_message.append({
+            'text': "*{0}*: {1}".format(site_name, down_text),
+            'color': 'danger',
+            'mrkdwn_in': ["text"]
+        })
+    if len(degraded) > max_degraded:
+        combined_message.append({
+            'text': "..and {0} more.".format(len(degraded) - max_degraded),
+            'color': 'danger'
+        })
+
+    return combined_message
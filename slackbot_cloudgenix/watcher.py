@@ -0,0 +1,375 @@
+# -*- coding: UTF-8 -*-
+# standard modules
+import logging
+import json
+import threading
+from collections import namedtuple
+
+from .topology import LINK_CLASSES, STATUS_COLORS, UNKNOWN_COLOR, TOPOLOGY_LAYOUT, classify_links, topology_cache
+from .graph import link_key
+from .cache import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# A link status change between two snapshots. old_status is None for a new link, new_status None for a removed one.
+LinkChange = namedtuple('LinkChange', ['key', 'link', 'old_status', 'new_status'])
+
+GROUP_LABELS = dict((group, pretext.strip('*')) for group, pretext in TOPOLOGY_LAYOUT)
+
+# Changes listed per alert message, the rest are counted.
+WATCH_MAX_CHANGES = 40
+
+# Seconds for one round of polls of every watched site. Polls are spread evenly over the round.
+WATCH_POLL_INTERVAL = 120
+# Seconds to wait when no sites are watched.
+WATCH_IDLE_TICK = 10
+
+WATCH_SUBSCRIPTIONS_VERSION = 1
+
+
+def link_statuses(graph):
+    """
+    Get the status of every shown (LINK_CLASSES) link of a topology graph.
+    :param graph: graph.TopologyGraph object
+    :return: dict of link key -> (status, link dict)
+    """
+    return site_link_statuses(graph.links)
+
+
+def site_link_statuses(links):
+    """
+    Get the status of every shown (LINK_CLASSES) link in a list of topology links.
+    :param links: list of topology link dicts
+    :return: dict of link key -> (status, link dict)
+    """
+    return dict((link_key(link), ((link.get('status') or 'unknown').lower(), link))
+                for _, link in classify_links(links)[0])
+
+
+def diff_link_statuses(old_statuses, new_statuses):
+    """
+    Compare two link_statuses results.
+    :param old_statuses: dict of link key -> (status, link dict)
+    :param new_statuses: dict of link key -> (status, link dict)
+    :return: list of LinkChange
+    """
+    changes = []
+    for key, (status, link) in new_statuses.items():
+        old = old_statuses.get(key)
+        if old is None:
+            changes.append(LinkChange(key, link, None, status))
+        elif old[0] != status:
+            changes.append(LinkChange(key, link, old[0], status))
+    for key, (status, link) in old_statuses.items():
+        if key not in new_statuses:
+            changes.append(LinkChange(key, link, status, None))
+    return changes
+
+
+def change_site_ids(change):
+    """
+    :param change: LinkChange
+    :return: set of node IDs (sites, and WAN networks for stub links) the changed link touches.
+    """
+    return set(node_id for node_id in (change.link.get('source_node_id'), change.link.get('target_node_id'))
+               if node_id)
+
+
+def stub_site_id(link, site_ids=()):
+    """
+    Get the site end of a stub link. The topology API puts the site in target_node_id and the WAN network in
+    source_node_id, the site is looked up in site_ids to be sure.
+    :param link: topology link dict
+    :param site_ids: Optional - container of known Site IDs
+    :return: Site ID (target_node_id unless only source_node_id is a known site)
+    """
+    source_id = link.get('source_node_id')
+    target_id = link.get('target_node_id')
+    if source_id in site_ids and target_id not in site_ids:
+        return source_id
+    return target_id or source_id
+
+
+def render_change_text(change, id2n, site_ids=()):
+    """
+    :param change: LinkChange
+    :param id2n: ID to Name lookup dict
+    :param site_ids: Optional - container of known Site IDs, to find the site end of stub links.
+    :return: text string, eg "Site A ⇔ Site B (AppFabric over Internet): up → down"
+    """
+    link = change.link
+    link_class = LINK_CLASSES[(link.get('type') or '').lower()]
+
+    if link_class.render == 'anynet':
+        source_id = link.get('source_node_id')
+        target_id = link.get('target_node_id')
+        name = "{0} ⇔ {1}".format(id2n.get(source_id, source_id), id2n.get(target_id, target_id))
+    else:
+        site_id = stub_site_id(link, site_ids)
+        name = "{0} {1}".format(id2n.get(site_id, site_id), link.get('network', link.get('path_id', '<UNKNOWN>')))
+
+    return "{0} ({1}): {2} → {3}".format(name, GROUP_LABELS.get(link_class.group, link_class.group),
+                                        change.old_status or 'new', change.new_status or 'removed')
+
+
+def render_changes(changes, id2n, max_changes=WATCH_MAX_CHANGES, site_ids=()):
+    """
+    Render link changes as slack attachments, down first.
+    :param changes: list of LinkChange
+    :param id2n: ID to Name lookup dict
+    :param max_changes: Max changes listed
+    :param site_ids: Optional - container of known Site IDs, see render_change_text
+    :return: list of slack attachments
+    """
+    ordered = sorted(changes, key=lambda change: (change.new_status != 'down',
+                                                  render_change_text(change, id2n, site_ids)))
+    attachments = [{
+        'text': render_change_text(change, id2n, site_ids),
+        'color': STATUS_COLORS.get(change.new_status, UNKNOWN_COLOR)
+    } for change in ordered[:max_changes]]
+    if len(ordered) > max_changes:
+        attachments.append({
+            'text': "..and {0} more.".format(len(ordered) - max_changes),
+            'color': UNKNOWN_COLOR
+        })
+    return attachments
+
+
+class TopologyWatcher(object):
+    """
+    Diff each published topology graph against the previous one, and post link status changes to subscribed
+    channels. One snapshot serves every subscriber. The first graph is the baseline, nothing is posted for it.
+    """
+
+    def __init__(self, post, id2n=None):
+        """
+        :param post: Callable, post(channel, text, attachments). Channel as subscribed (name or ID).
+        :param id2n: Optional - callable returning the current ID to Name lookup dict.
+        """
+        self.post = post
+        self.id2n = id2n if id2n is not None else dict
+        # channel -> set of Site IDs, or None for all sites.
+        self.subscriptions = {}
+        self.statuses = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel, site_ids=None):
+        """
+        :param channel: Slack channel name or ID
+        :param site_ids: Optional - iterable of Site IDs, None for all sites.
+        :return: None
+        """
+        with self._lock:
+            self.subscriptions[channel] = set(site_ids) if site_ids is not None else None
+
+    def update(self, graph):
+        """
+        Diff a new graph against the previous one and post changes.
+        :param graph: graph.TopologyGraph object
+        :return: list of LinkChange
+        """
+        new_statuses = link_statuses(graph)
+        with self._lock:
+            old_statuses, self.statuses = self.statuses, new_statuses
+            subscriptions = dict(self.subscriptions)
+
+        if old_statuses is None:
+            return []
+        changes = diff_link_statuses(old_statuses, new_statuses)
+        if not changes:
+            return changes
+        logger.info("Topology watcher: {0} link changes.".format(len(changes)))
+
+        id2n = self.id2n()
+        for channel, site_ids in subscriptions.items():
+            channel_changes = changes if site_ids is None else \
+                [change for change in changes if change_site_ids(change) & site_ids]
+            if not channel_changes:
+                continue
+            try:
+                self.post(channel, "*Topology changes ({0}):*".format(len(channel_changes)),
+                          render_changes(channel_changes, id2n, site_ids=graph.site_index))
+            except Exception as e:
+                logger.warning("Topology watcher post to {0} failed: {1}".format(channel, e))
+
+        return changes
+
+
+def save_watch_subscriptions(filename, subscriptions):
+    """
+    Save watch subscriptions (see cache.write_json_atomic).
+    :param filename: Subscriptions file path
+    :param subscriptions: dict of Site ID -> set of channels
+    :return: Bool, True if saved.
+    """
+    data = {
+        "version": WATCH_SUBSCRIPTIONS_VERSION,
+        "subscriptions": dict((site_id, sorted(channels)) for site_id, channels in subscriptions.items())
+    }
+    try:
+        write_json_atomic(filename, data, prefix='.watch_')
+    except (OSError, IOError, TypeError, ValueError) as e:
+        logger.warning("Unable to save watch subscriptions to {0}: {1}".format(filename, e))
+        return False
+    return True
+
+
+def load_watch_subscriptions(filename):
+    """
+    Load watch subscriptions.
+    :param filename: Subscriptions file path
+    :return: dict of Site ID -> set of channels (empty if missing or not usable).
+    """
+    try:
+        with open(filename, 'r') as subscriptions_file:
+            data = json.load(subscriptions_file)
+    except (OSError, IOError) as e:
+        logger.info("No watch subscriptions loaded from {0}: {1}".format(filename, e))
+        return {}
+    except ValueError as e:
+        logger.warning("Watch subscriptions {0} are corrupt, ignoring: {1}".format(filename, e))
+        return {}
+
+    if not isinstance(data, dict) or data.get('version') != WATCH_SUBSCRIPTIONS_VERSION:
+        logger.info("Watch subscriptions {0} version mismatch, ignoring.".format(filename))
+        return {}
+
+    return dict((site_id, set(channels)) for site_id, channels in data.get('subscriptions', {}).items() if channels)
+
+
+class WatchScheduler(threading.Thread):
+    """
+    Background thread that polls the topology of watched sites and posts link status changes to the channels
+    watching each site. Each site is polled once per round however many channels watch it, and polls are spread
+    evenly over the round so API load stays flat. The first poll of a site is the baseline, nothing is posted.
+    Subscriptions are saved to `filename` on every change, and loaded from it on start.
+    """
+
+    def __init__(self, get_sdk, post, id2n=None, filename=None, interval=WATCH_POLL_INTERVAL,
+                 idle_tick=WATCH_IDLE_TICK):
+        """
+        :param get_sdk: Callable returning the authenticated CloudGenix SDK Constructor
+        :param post: Callable, post(channel, text, attachments).
+        :param id2n: Optional - callable returning the current ID to Name lookup dict.
+        :param filename: Optional - Subscriptions file path, None to not persist.
+        :param interval: Seconds per round of polls.
+        :param idle_tick: Seconds to wait when no sites are watched.
+        """
+        super(WatchScheduler, self).__init__(name='watch_scheduler')
+        self.daemon = True
+        self.get_sdk = get_sdk
+        self.post = post
+        self.id2n = id2n if id2n is not None else dict
+        self.filename = filename
+        self.interval = interval
+        self.idle_tick = idle_tick
+        # Site ID -> set of channels.
+        self.subscriptions = load_watch_subscriptions(filename) if filename else {}
+        # Site ID -> site_link_statuses result from the last poll.
+        self.statuses = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def watch(self, channel, site_id):
+        """
+        :param channel: Slack channel ID
+        :param site_id: Site ID
+        :return: Bool, False if the channel already watched the site.
+        """
+        with self._lock:
+            channels = self.subscriptions.setdefault(site_id, set())
+            if channel in channels:
+                return False
+            channels.add(channel)
+            self.save()
+        return True
+
+    def unwatch(self, channel, site_id):
+        """
+        :param channel: Slack channel ID
+        :param site_id: Site ID
+        :return: Bool, False if the channel wasn't watching the site.
+        """
+        with self._lock:
+            channels = self.subscriptions.get(site_id, set())
+            if channel not in channels:
+                return False
+            channels.discard(channel)
+            if not channels:
+                del self.subscriptions[site_id]
+                self.statuses.pop(site_id, None)
+            self.save()
+        return True
+
+    def channel_sites(self, channel):
+        """
+        :param channel: Slack channel ID
+        :return: list of Site IDs the channel watches
+        """
+        with self._lock:
+            return [site_id for site_id, channels in self.subscriptions.items() if channel in channels]
+
+    def save(self):
+        # called with the lock held.
+        if self.filename:
+            save_watch_subscriptions(self.filename, self.subscriptions)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        logger.info("Watch scheduler started, {0} sites watched.".format(len(self.subscriptions)))
+        while not self._stop_event.is_set():
+            with self._lock:
+                site_ids = sorted(self.subscriptions)
+            if not site_ids:
+                self._stop_event.wait(self.idle_tick)
+                continue
+
+            spacing = float(self.interval) / len(site_ids)
+            for site_id in site_ids:
+                self.poll(site_id)
+                if self._stop_event.wait(spacing):
+                    return
+
+    def poll(self, site_id):
+        """
+        Query a site's topology, and post changes since the last poll to its channels.
+        :param site_id: Site ID
+        :return: list of LinkChange
+        """
+        sdk = self.get_sdk()
+        if sdk is None:
+            return []
+        try:
+            links = topology_cache.refresh_links(site_id, sdk)
+        except Exception as e:
+            logger.warning("Watch poll of {0} failed: {1}".format(site_id, e))
+            return []
+        if links is None:
+            return []
+
+        new_statuses = site_link_statuses(links)
+        with self._lock:
+            if site_id not in self.subscriptions:
+                return []
+            old_statuses = self.statuses.get(site_id)
+            self.statuses[site_id] = new_statuses
+            channels = sorted(self.subscriptions[site_id])
+
+        if old_statuses is None:
+            return []
+        changes = diff_link_statuses(old_statuses, new_statuses)
+        if not changes:
+            return changes
+
+        id2n = self.id2n()
+        attachments = render_changes(changes, id2n, site_ids=(site_id,))
+        for channel in channels:
+            try:
+                self.post(channel, "*Topology changes at {0} ({1}):*".format(id2n.get(site_id, site_id),
+                                                                            len(changes)), attachments)
+            except Exception as e:
+                logger.warning("Watch post to {0} failed: {1}".format(channel, e))
+
+        return changes
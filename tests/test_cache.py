@@ -0,0 +1,161 @@
+# -*- coding: UTF-8 -*-
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+from slackbot_cloudgenix.cache import (write_json_atomic, save_id2n_snapshot, load_id2n_snapshot, TTLCache,
+                                     SingleFlight)
+
+
+def test_snapshot_round_trip(tmp_path):
+    filename = str(tmp_path / 'snapshot.json')
+    id2n_maps = OrderedDict([('sites', {'1': 'Site One'}), ('elements', {'2': 'ION 1'})])
+    n2id_maps = {'sites': {'Site One': '1'}}
+
+    assert save_id2n_snapshot(filename, 'tenant', id2n_maps, n2id_maps)
+
+    loaded_id2n, loaded_n2id = load_id2n_snapshot(filename, 'tenant')
+    assert loaded_id2n == id2n_maps
+    assert list(loaded_id2n) == ['sites', 'elements']
+    assert loaded_n2id == n2id_maps
+
+
+def test_snapshot_created_time_checked_on_load(tmp_path):
+    filename = str(tmp_path / 'snapshot.json')
+    id2n_maps = OrderedDict([('sites', {'1': 'Site One'})])
+
+    assert save_id2n_snapshot(filename, 'tenant', id2n_maps, created=time.time() - 7200)
+
+    assert load_id2n_snapshot(filename, 'tenant', max_age=3600) == (None, None)
+    assert load_id2n_snapshot(filename, 'tenant', max_age=10800)[0] == id2n_maps
+    assert load_id2n_snapshot(filename, 'other tenant') == (None, None)
+    assert load_id2n_snapshot(filename, 'tenant', max_age=-1) == (None, None)
+
+
+def test_write_json_atomic_keeps_old_file_and_removes_temp_on_failure(tmp_path):
+    filename = str(tmp_path / 'data.json')
+    write_json_atomic(filename, {'a': 1})
+
+    with pytest.raises(TypeError):
+        write_json_atomic(filename, {'a': object()}, prefix='.data_')
+
+    assert os.listdir(str(tmp_path)) == ['data.json']
+    with open(filename) as data_file:
+        assert data_file.read() == '{"a": 1}'
+
+
+def test_save_snapshot_failure_leaves_no_temp_file(tmp_path):
+    filename = str(tmp_path / 'snapshot.json')
+
+    assert not save_id2n_snapshot(filename, 'tenant', OrderedDict([('sites', {'1': object()})]))
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_ttl_cache_expiry_and_lru_eviction():
+    cache = TTLCache(maxsize=2)
+    cache.set('a', 1, expires=100)
+    cache.set('b', 2, expires=200)
+
+    assert cache.get('a', now=50) == (True, 1)
+    # expired entries are dropped on read.
+    assert cache.get('a', now=100) == (False, None)
+    assert cache.stats()['size'] == 1
+
+    cache.set('a', 1, expires=300)
+    # 'b' was used last, so 'a' is evicted.
+    assert cache.get('b', now=0) == (True, 2)
+    cache.set('c', 3, expires=300)
+    assert cache.get('a', now=0) == (False, None)
+    assert cache.get('c', now=0) == (True, 3)
+
+    assert cache.delete('c')
+    assert not cache.delete('c')
+    assert cache.stats() == {"size": 1, "maxsize": 2, "hits": 3, "misses": 2, "evictions": 1}
+
+
+class CountingEvent(threading.Event):
+    """
+    Event that counts its waiters.
+    """
+
+    def __init__(self):
+        super(CountingEvent, self).__init__()
+        self.waiters = 0
+
+    def wait(self, timeout=None):
+        self.waiters += 1
+        return super(CountingEvent, self).wait(timeout)
+
+
+def start_callers(flight, key, function, callers):
+    """
+    Call flight.do(key, function) from several threads.
+    :return: Tuple of (list of threads, list of (result, error) filled in per caller)
+    """
+    results = [None] * callers
+
+    def caller(index):
+        try:
+            results[index] = (flight.do(key, function), None)
+        except Exception as e:
+            results[index] = (None, e)
+
+    threads = [threading.Thread(target=caller, args=(index,)) for index in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def run_collapsed(flight, function, waiters):
+    """
+    Start one leader call for 'site' and, while it runs, `waiters` more. Releases the leader once all are waiting.
+    :return: list of (result, error), leader first
+    """
+    started = threading.Event()
+    release = threading.Event()
+
+    def leader_function():
+        started.set()
+        release.wait(5)
+        return function()
+
+    threads, results = start_callers(flight, 'site', leader_function, 1)
+    assert started.wait(5)
+    done = flight.calls['site']['done'] = CountingEvent()
+    more_threads, more_results = start_callers(flight, 'site', leader_function, waiters)
+    while done.waiters < waiters:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads + more_threads:
+        thread.join(5)
+    return results + more_results
+
+
+def test_single_flight_collapses_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+
+    def function():
+        calls.append(1)
+        return 'links'
+
+    assert run_collapsed(flight, function, 4) == [('links', None)] * 5
+    assert len(calls) == 1
+    assert flight.calls == {}
+
+    # the next call runs again.
+    assert flight.do('site', lambda: 'fresh') == 'fresh'
+
+
+def test_single_flight_shares_errors_and_does_not_keep_them():
+    flight = SingleFlight()
+    error = ValueError("query failed")
+
+    def function():
+        raise error
+
+    assert run_collapsed(flight, function, 2) == [(None, error)] * 3
+    assert flight.do('site', lambda: 'ok') == 'ok'
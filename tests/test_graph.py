@@ -0,0 +1,105 @@
+# -*- coding: UTF-8 -*-
+import random
+
+from slackbot_cloudgenix.graph import TopologyGraph, render_site_route
+
+
+def anynet(link_id, source_id, target_id, status='up', link_type='anynet'):
+    return {'id': link_id, 'type': link_type, 'source_node_id': source_id, 'target_node_id': target_id,
+            'source_wan_network': source_id + ' ISP', 'target_wan_network': target_id + ' ISP', 'status': status}
+
+
+def make_sites(site_ids, hub_ids=()):
+    return [{'id': site_id, 'name': site_id.upper(), 'element_cluster_role': 'HUB' if site_id in hub_ids else 'SPOKE'}
+            for site_id in site_ids]
+
+
+def expected_routes(site_ids, hub_ids, links, source_id, target_id):
+    """
+    site_routes by brute force over the unique up anynet links.
+    """
+    if source_id not in site_ids or target_id not in site_ids:
+        return [], []
+    unique_links = []
+    for link in links:
+        if link['id'] not in [unique_link['id'] for unique_link in unique_links]:
+            unique_links.append(link)
+    up_links = [link for link in unique_links if link['type'] in ('anynet', 'public-anynet', 'private-anynet')
+                and link['status'] == 'up' and link['source_node_id'] != link['target_node_id']]
+
+    def between(site1, site2):
+        return [link for link in up_links if set([link['source_node_id'], link['target_node_id']]) ==
+                set([site1, site2])]
+
+    via = [(hub_id, between(source_id, hub_id), between(hub_id, target_id)) for hub_id in site_ids
+           if hub_id in hub_ids and hub_id not in (source_id, target_id) and between(source_id, hub_id) and
+           between(hub_id, target_id)]
+    return (between(source_id, target_id) if source_id != target_id else []), via
+
+
+def test_site_routes_direct_and_via_hub():
+    site_ids = ['branch1', 'branch2', 'dc1', 'dc2', 'branch3']
+    links = [
+        anynet('l1', 'branch1', 'branch2'),
+        anynet('l2', 'branch2', 'branch1', link_type='private-anynet'),
+        anynet('l3', 'branch1', 'dc1'),
+        anynet('l4', 'dc1', 'branch2'),
+        anynet('l5', 'branch1', 'dc2'),
+        anynet('l6', 'branch2', 'dc2', status='down'),
+        anynet('l7', 'branch1', 'branch3'),
+        anynet('l8', 'branch3', 'branch2'),
+        anynet('l9', 'branch1', 'branch2', link_type='vpn'),
+        # the same link, returned for both of its sites.
+        anynet('l3', 'branch1', 'dc1'),
+    ]
+    graph = TopologyGraph(make_sites(site_ids, hub_ids=['dc1', 'dc2']), links)
+
+    direct, via = graph.site_routes('branch1', 'branch2')
+
+    assert [link['id'] for link in direct] == ['l1', 'l2']
+    # dc2 has a down link to branch2, branch3 isn't a hub.
+    assert [(hub_id, [link['id'] for link in source_links], [link['id'] for link in target_links])
+            for hub_id, source_links, target_links in via] == [('dc1', ['l3'], ['l4'])]
+
+    reverse_direct, reverse_via = graph.site_routes('branch2', 'branch1')
+    assert reverse_direct == direct
+    assert [(hub_id, target_links, source_links) for hub_id, source_links, target_links in reverse_via] == via
+
+    assert graph.site_routes('branch1', 'unknown') == ([], [])
+    assert graph.site_routes('unknown', 'branch1') == ([], [])
+
+
+def test_site_routes_matches_brute_force():
+    rng = random.Random(20)
+    for _ in range(20):
+        site_ids = ['site{0}'.format(index) for index in range(rng.randint(2, 12))]
+        hub_ids = set(rng.sample(site_ids, rng.randint(0, len(site_ids))))
+        links = [anynet('l{0}'.format(index), rng.choice(site_ids), rng.choice(site_ids),
+                        status=rng.choice(['up', 'up', 'down']),
+                        link_type=rng.choice(['anynet', 'public-anynet', 'private-anynet', 'vpn']))
+                 for index in range(rng.randint(0, 40))]
+        links += rng.sample(links, len(links) // 4)
+        graph = TopologyGraph(make_sites(site_ids, hub_ids), links)
+
+        for source_id in site_ids:
+            for target_id in site_ids:
+                assert graph.site_routes(source_id, target_id) == \
+                    expected_routes(site_ids, hub_ids, links, source_id, target_id)
+
+
+def test_render_site_route():
+    site_ids = ['branch1', 'branch2', 'dc1']
+    graph = TopologyGraph(make_sites(site_ids, hub_ids=['dc1']),
+                          [anynet('l1', 'branch2', 'branch1'), anynet('l2', 'branch1', 'dc1'),
+                           anynet('l3', 'branch2', 'dc1')])
+    id2n = {'branch1': 'Branch 1', 'branch2': 'Branch 2', 'dc1': 'DC 1'}
+
+    direct, via = render_site_route(graph, 'branch1', 'branch2', id2n)
+
+    assert direct['pretext'] == "*Direct*"
+    assert direct['text'] == "Branch 1 ⇔ Branch 2\nbranch1 ISP ⇔ branch2 ISP (up)"
+    assert via['pretext'] == "*Via hub*"
+    assert via['text'] == "Branch 1 ⇔ DC 1 ⇔ Branch 2\nbranch1 ISP ⇔ dc1 ISP (up)\ndc1 ISP ⇔ branch2 ISP (up)"
+
+    no_route = TopologyGraph(make_sites(site_ids), [])
+    assert render_site_route(no_route, 'branch1', 'branch2', id2n)[0]['color'] == 'danger'
@@ -0,0 +1,172 @@
+# -*- coding: UTF-8 -*-
+import copy
+import random
+import re
+import string
+
+import pytest
+
+from slackbot_cloudgenix.helpers import table_output, stream_table_output, table_cell_type, TABLE_CELL_INT, \
+    TABLE_CELL_FLOAT, TABLE_CELL_TEXT, ExcludeFilter, compile_excludelist, hierarchy_output
+
+
+def stream_text(data, *args, **kwargs):
+    """
+    stream_table_output lines as written to a file, comparable to table_output().
+    """
+    return u"".join(line + u"\n" for line in stream_table_output(data, *args, **kwargs))
+
+
+def random_cell(rng):
+    kind = rng.randrange(15)
+    if kind == 0:
+        return None
+    elif kind == 1:
+        return ''
+    elif kind == 2:
+        return rng.choice([True, False, 'True', 'False'])
+    elif kind == 3:
+        return rng.randint(-10 ** 6, 10 ** 6)
+    elif kind == 4:
+        return str(rng.randint(-10 ** 6, 10 ** 6))
+    elif kind == 5:
+        return rng.uniform(-1e4, 1e4)
+    elif kind == 6:
+        return repr(rng.uniform(-1e4, 1e4))
+    elif kind == 7:
+        return '{0:,}'.format(rng.randint(-10 ** 7, 10 ** 7))
+    elif kind == 8:
+        return '{0:,.3f}'.format(rng.uniform(-1e7, 1e7))
+    elif kind == 9:
+        return ''.join(rng.choice(string.ascii_letters + ' .-,') for _ in range(rng.randint(1, 12)))
+    elif kind == 10:
+        return rng.choice([{'name': 'sub'}, [1, 2]])
+    elif kind == 11:
+        return rng.choice(['1e5', 'nan', 'inf', '1e999', ' 12 ', '1_000', '.5', '1.', '+1,000', '1,0000'])
+    elif kind == 12:
+        return rng.choice(['a\nb', '1\n', ' 12 \r', 'a\tb', u'caf\xe9', u'日本', '\x1b[31mred\x1b[0m'])
+    return rng.choice(['up', 'down', 'Internet', '10.0.0.1'])
+
+
+def test_stream_table_output_thousands_separators():
+    data = [{'count': '1,000', 'rate': '1,234.5'}, {'count': '-12,345', 'rate': '2.25'}, {'count': 7}]
+
+    assert stream_text(data) == table_output(data)
+    assert table_cell_type('1,000') == TABLE_CELL_INT
+    assert table_cell_type('-1,234.5') == TABLE_CELL_FLOAT
+    assert table_cell_type('1,0000') == TABLE_CELL_TEXT
+
+
+def test_stream_table_output_falls_back_for_text_it_cannot_lay_out():
+    data = [{'name': 'a\nb', 'count': 1}, {'name': u'日本', 'count': '1\n'}]
+
+    assert stream_text(data) == table_output(data)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_stream_table_output_matches_table_output(seed):
+    rng = random.Random(seed)
+    for _ in range(300):
+        keys = ['k{0}'.format(index) for index in range(rng.randint(1, 5))] + ['_etag', 'id']
+        data = [dict((key, random_cell(rng)) for key in keys if rng.random() < 0.8)
+                for _ in range(rng.randint(1, 6))]
+        excludelist = rng.choice([None, ['^_', 'id$']])
+        orderlist = rng.choice([None, ['k2', 'k0', 'missing']])
+        original = copy.deepcopy(data)
+
+        assert stream_text(data, excludelist, orderlist) == table_output(data, excludelist, orderlist), data
+        # neither mutates the rows.
+        assert data == original
+
+
+def test_stream_table_output_empty():
+    assert stream_text([]) == table_output([])
+    assert stream_text([{}]) == table_output([{}])
+
+
+EXCLUDE_KEYS = ['id', '_etag', '_created_on_utc', 'ID', 'name', 'Name', 'aa', 'abab', 'bb', 'x', 'xyx', 'site_id',
+                'ip', 'IPV4', '']
+
+
+@pytest.mark.parametrize('patterns, combined', [
+    ([], False),
+    (['^_', 'id$'], True),
+    # inline flags would apply to every pattern once combined.
+    (['(?i)^id$', '^name'], False),
+    (['^name', '(?i:ip)'], True),
+    # duplicate group names don't compile combined.
+    (['(?P<a>a)b', '(?P<a>x)'], False),
+    # group numbers would count across patterns.
+    (['^(a)\\1$', '^(b)\\1$'], False),
+    (['(x)?y(?(1)x|z)', '^_'], False),
+])
+def test_exclude_filter_matches_per_pattern_search(patterns, combined):
+    exclude_filter = ExcludeFilter(patterns)
+
+    assert (exclude_filter.regex is not None) == combined
+    for key in EXCLUDE_KEYS:
+        assert exclude_filter.excludes(key) == any(re.search(pattern, key) for pattern in patterns), key
+
+
+def test_exclude_filter_caches_decisions():
+    exclude_filter = ExcludeFilter(['^_'])
+
+    assert exclude_filter.excludes('_etag')
+    assert not exclude_filter.excludes('name')
+    assert exclude_filter.decisions == {'_etag': True, 'name': False}
+
+    # cached keys don't run the regex again.
+    exclude_filter.regex = None
+    assert exclude_filter.excludes('_etag')
+    assert not exclude_filter.excludes('name')
+
+
+def test_compile_excludelist():
+    exclude_filter = ExcludeFilter(['^_'])
+
+    assert compile_excludelist(None) is None
+    assert compile_excludelist(exclude_filter) is exclude_filter
+    # lists with the same patterns share a filter, and its decisions.
+    assert compile_excludelist(['^_', 'id$']) is compile_excludelist(('^_', 'id$'))
+    assert compile_excludelist(['^_']) is not compile_excludelist(['id$'])
+
+
+@pytest.mark.parametrize('data, expected', [
+    ({'name': 'Site A', 'address': {'city': 'Austin', 'country': 'US'}, '_etag': 3},
+     u"       Name: Site A\n"
+     u"    Address:    City: Austin\n"
+     u"             Country: US\n"
+     u"\n\n"),
+    ({'tags': ['a', 'b', 'c'], 'one': ['x']},
+     u"    Tags: a,\n"
+     u"          b,\n"
+     u"          c\n"
+     u"     one: x\n"
+     u"\n"),
+    ({'tags': [], 'name': 'n'},
+     u"    Tags: None\n"
+     u"    Name: n\n"
+     u"\n"),
+    ([{'a': 1}, {'b': 2}],
+     u"    a: 1\n\n"
+     u"    b: 2\n\n"
+     u"\n"),
+])
+def test_hierarchy_output(data, expected):
+    assert hierarchy_output(data, excludelist=['^_']) == expected
+
+
+def test_hierarchy_output_orderlist_does_not_modify_data():
+    data = {'zeta': 1, 'id': 's1', 'name': 'Site', '_etag': 2, 'sub': {'b': 1, 'name': 'Sub'}}
+    original = copy.deepcopy(data)
+
+    text = hierarchy_output(data, excludelist=['^_'], orderlist=['name', '_etag', 'id', 'missing', 'name'])
+
+    assert text == (u"    Name: Site\n"
+                    u"      ID: s1\n"
+                    u"    zeta: 1\n"
+                    u"     sub: Name: Sub\n"
+                    u"             b: 1\n"
+                    u"\n\n")
+    assert data == original
+    assert hierarchy_output(data, excludelist=['^_'], orderlist=['name', '_etag', 'id', 'missing', 'name']) == text
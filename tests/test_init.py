@@ -0,0 +1,190 @@
+# -*- coding: UTF-8 -*-
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+import slackbot_cloudgenix
+from slackbot_cloudgenix.cache import NameIndex, save_id2n_snapshot
+from slackbot_cloudgenix.watcher import WatchScheduler
+
+
+class FakeSlackClient(object):
+    def __init__(self):
+        self.sent = []
+
+    def find_channel_by_name(self, name):
+        return None
+
+    def send_message(self, channel, text, attachments=None):
+        self.sent.append((channel, text, attachments))
+
+
+class FakeMessage(object):
+    """
+    slackbot Message stand-in, records reactions and replies.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self.body = {'channel': 'C1'}
+        self.reactions = []
+        self.replies = []
+
+    def react(self, emoji):
+        self.reactions.append(emoji)
+
+    def reply(self, text, in_thread=None):
+        self.replies.append(text)
+
+
+class FakeSdk(object):
+    tenant_id = 'tenant'
+
+
+@pytest.fixture
+def lazy_bot(monkeypatch):
+    """
+    The bot after a lazy start: logged in, no Slack client passed to start().
+    """
+    ready = threading.Event()
+    ready.set()
+    monkeypatch.setattr(slackbot_cloudgenix, 'start', lambda *args, **kwargs: None)
+    monkeypatch.setattr(slackbot_cloudgenix, 'log_message_env', lambda message: None)
+    monkeypatch.setattr(slackbot_cloudgenix, 'login_complete', ready)
+    monkeypatch.setattr(slackbot_cloudgenix, 'id2n_ready', ready)
+    monkeypatch.setattr(slackbot_cloudgenix, 'sdk', FakeSdk())
+    monkeypatch.setattr(slackbot_cloudgenix, 'alerts_client', None)
+    monkeypatch.setattr(slackbot_cloudgenix, 'global_name_index', NameIndex({'sites': {'Site One': 's1'}}))
+    monkeypatch.setattr(slackbot_cloudgenix, 'watch_scheduler',
+                        WatchScheduler(lambda: None, slackbot_cloudgenix.post_alert))
+    return slackbot_cloudgenix
+
+
+def test_watch_on_lazy_start_posts_with_the_message_client(lazy_bot):
+    client = FakeSlackClient()
+    message = FakeMessage(client)
+
+    lazy_bot.watch_site(message, 'Site One')
+
+    assert message.reactions == [lazy_bot.GOOD_RESPONSE]
+    assert lazy_bot.watch_scheduler.channel_sites('C1') == ['s1']
+    lazy_bot.post_alert('C1', 'changes', [])
+    assert client.sent == [('C1', 'changes', [])]
+
+
+def test_watch_without_slack_client_is_refused(lazy_bot):
+    message = FakeMessage(None)
+
+    lazy_bot.watch_site(message, 'Site One')
+
+    assert message.reactions == [lazy_bot.BAD_RESPONSE]
+    assert message.replies == [lazy_bot.WATCH_NO_CLIENT_MSG]
+    assert lazy_bot.watch_scheduler.channel_sites('C1') == []
+
+
+@pytest.fixture
+def id2n_state(monkeypatch, tmp_path):
+    """
+    Logged in, with a snapshot file and a published cache from a full refresh at 1000.
+    """
+    snapshot_file = str(tmp_path / 'snapshot.json')
+    n2id_maps = {'sites': {'Site One': 's1'}, 'appdefs': {}}
+    monkeypatch.setattr(slackbot_cloudgenix, 'CLOUDGENIX_ID2N_SNAPSHOT_FILE', snapshot_file)
+    monkeypatch.setattr(slackbot_cloudgenix, 'sdk', FakeSdk())
+    monkeypatch.setattr(slackbot_cloudgenix, 'global_id2n', {'s1': 'Site One'})
+    monkeypatch.setattr(slackbot_cloudgenix, 'global_n2id_maps', n2id_maps)
+    monkeypatch.setattr(slackbot_cloudgenix, 'global_name_index', NameIndex(n2id_maps))
+    monkeypatch.setattr(slackbot_cloudgenix, 'id2n_full_refresh_time', 1000.0)
+    return snapshot_file
+
+
+def read_snapshot(filename):
+    with open(filename) as snapshot_file:
+        return json.load(snapshot_file)
+
+
+def test_delta_publish_keeps_snapshot_time_and_name_maps(id2n_state, monkeypatch):
+    # the idname object caches aren't loaded, no Name->ID maps.
+    monkeypatch.setattr(slackbot_cloudgenix, 'generate_n2id_maps', lambda idname_obj: None)
+
+    slackbot_cloudgenix.publish_id2n(OrderedDict([('sites', {'s1': 'Site One', 's2': 'Site Two'})]))
+
+    assert slackbot_cloudgenix.global_id2n == {'s1': 'Site One', 's2': 'Site Two'}
+    assert slackbot_cloudgenix.global_name_index.sites_n2id == {'Site One': 's1'}
+    snapshot = read_snapshot(id2n_state)
+    assert snapshot['created'] == 1000.0
+    assert snapshot['n2id_maps'] == {'sites': {'Site One': 's1'}, 'appdefs': {}}
+
+
+def test_full_refresh_dates_the_snapshot(id2n_state, monkeypatch):
+    id2n_maps = OrderedDict([('sites', {'s2': 'Site Two'})])
+    monkeypatch.setattr(slackbot_cloudgenix, 'fetch_id2n_maps', lambda *args, **kwargs: id2n_maps)
+    monkeypatch.setattr(slackbot_cloudgenix, 'generate_n2id_maps',
+                        lambda idname_obj: {'sites': {'Site Two': 's2'}, 'appdefs': {}})
+    monkeypatch.setattr(time, 'time', lambda: 2000.0)
+
+    assert slackbot_cloudgenix.refresh_id2n_full() is id2n_maps
+
+    assert slackbot_cloudgenix.id2n_full_refresh_time == 2000.0
+    assert slackbot_cloudgenix.global_name_index.sites_n2id == {'Site Two': 's2'}
+    assert read_snapshot(id2n_state)['created'] == 2000.0
+
+
+def test_warm_start_keeps_snapshot_time_when_refresh_fails(id2n_state, monkeypatch):
+    created = time.time() - 600
+    save_id2n_snapshot(id2n_state, 'tenant', OrderedDict([('sites', {'s1': 'Site One'})]),
+                       {'sites': {'Site One': 's1'}, 'appdefs': {}}, created=created)
+
+    def failing_fetch(*args, **kwargs):
+        raise IOError("API unavailable")
+
+    monkeypatch.setattr(slackbot_cloudgenix, 'id2n_full_refresh_time', None)
+    monkeypatch.setattr(slackbot_cloudgenix, 'global_id2n', {})
+    monkeypatch.setattr(slackbot_cloudgenix, 'id2n_ready', threading.Event())
+    monkeypatch.setattr(slackbot_cloudgenix, 'fetch_id2n_maps', failing_fetch)
+    monkeypatch.setattr(slackbot_cloudgenix, 'start_id2n_refresher', lambda id2n_maps: None)
+
+    slackbot_cloudgenix.load_id2n()
+
+    assert slackbot_cloudgenix.id2n_ready.is_set()
+    assert slackbot_cloudgenix.global_id2n == {'s1': 'Site One'}
+    assert read_snapshot(id2n_state)['created'] == created
+
+    # later delta refreshes don't save it either, until a full refresh succeeds.
+    slackbot_cloudgenix.publish_id2n(OrderedDict([('sites', {'s2': 'Site Two'})]))
+    assert read_snapshot(id2n_state)['created'] == created
+
+
+class FakeIdName(object):
+    def __init__(self, sites):
+        self.sites = sites
+
+    def generate_sites_map(self, key_val='id', value_val='name'):
+        return dict(self.sites)
+
+    def generate_appdefs_map(self, key_val='id', value_val='name'):
+        return {'HTTP': 'a1'}
+
+
+def test_fallback_name_index_is_rebuilt_only_when_maps_change(monkeypatch):
+    fake_idname = FakeIdName({'Site One': 's1'})
+    monkeypatch.setattr(slackbot_cloudgenix, 'idname', fake_idname)
+    monkeypatch.setattr(slackbot_cloudgenix, 'global_name_index', NameIndex())
+    monkeypatch.setattr(slackbot_cloudgenix, 'fallback_name_index', None)
+
+    first = slackbot_cloudgenix.get_name_index()
+    assert first.sites_n2id == {'Site One': 's1'}
+    assert slackbot_cloudgenix.get_name_index() is first
+
+    fake_idname.sites = {'Site One': 's1', 'Site Two': 's2'}
+    second = slackbot_cloudgenix.get_name_index()
+    assert second is not first
+    assert second.site_matcher.extract_one('Site Two')[0] == 'Site Two'
+
+    # once the cache is published, it is used instead.
+    published = NameIndex({'sites': {'Site Three': 's3'}})
+    monkeypatch.setattr(slackbot_cloudgenix, 'global_name_index', published)
+    assert slackbot_cloudgenix.get_name_index() is published
@@ -0,0 +1,73 @@
+# -*- coding: UTF-8 -*-
+import random
+
+import pytest
+from fuzzywuzzy import process
+
+from slackbot_cloudgenix.matcher import NameMatcher, normalize, name_profile, wratio_bound
+
+CITIES = ['Sydney', 'Boston', 'London', 'New York', 'San Jose', 'Tokyo', 'São Paulo', 'Zürich']
+KINDS = ['DC', 'Branch', 'Hub', 'Data-Center', '']
+
+
+def make_names(rng, count):
+    return ['{0} {1} {2}'.format(rng.choice(CITIES), rng.choice(KINDS), rng.randint(1, 999)) for _ in range(count)]
+
+
+def make_queries(rng, names, count):
+    queries = []
+    for _ in range(count):
+        name = rng.choice(names)
+        queries.extend([
+            name,
+            name.lower(),
+            # spaces removed, and truncated
+            name.replace(' ', ''),
+            name.replace(' ', '')[:-1],
+            name[:rng.randint(1, len(name))],
+        ])
+    queries.extend(CITIES)
+    queries.extend(['', '???', 'x', 'zz 12'])
+    return queries
+
+
+@pytest.mark.parametrize('shortlist_size', [1, 32])
+def test_extract_one_matches_extractone(shortlist_size):
+    rng = random.Random(6)
+    names = make_names(rng, 150)
+    matcher = NameMatcher(names, shortlist_size=shortlist_size)
+
+    for query in make_queries(rng, names, 6):
+        assert matcher.extract_one(query) == process.extractOne(query, names), query
+
+
+def test_extract_one_beyond_the_shortlist():
+    # many names share the same n-grams with the query, the WRatio winner is not among the first shortlisted.
+    names = ['Sydney DC {0}'.format(number) for number in range(200, 800, 2)] + \
+            ['Boston DC {0}'.format(number) for number in range(201, 800, 2)]
+    matcher = NameMatcher(names)
+
+    assert matcher.extract_one('SydneyDC37') == ('Sydney DC 370', 87)
+    assert matcher.extract_one('BostonDC38') == ('Boston DC 381', 87)
+    for query in ['sydney dc', 'Boston DC 38', 'SydneyDC5']:
+        assert matcher.extract_one(query) == process.extractOne(query, names), query
+
+
+def test_extract_one_first_name_wins_ties():
+    names = ['Tokyo Hub 2', 'Tokyo Hub 1', 'TOKYO hub 1', 'Tokyo Hub 1']
+    matcher = NameMatcher(names)
+
+    assert matcher.extract_one('tokyo hub 1') == ('Tokyo Hub 1', 100)
+    assert matcher.extract_one('tokyo') == process.extractOne('tokyo', names)
+    assert NameMatcher([]).extract_one('tokyo') == (None, 0)
+
+
+def test_wratio_bound_is_an_upper_bound():
+    rng = random.Random(3)
+    names = make_names(rng, 40)
+    for query in make_queries(rng, names, 4):
+        processed_query = normalize(query)
+        for name in names:
+            processed = normalize(name)
+            score = process.fuzz.WRatio(processed_query, processed, full_process=False)
+            assert wratio_bound(name_profile(processed_query), name_profile(processed)) >= score, (query, name)
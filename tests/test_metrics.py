@@ -0,0 +1,225 @@
+# -*- coding: UTF-8 -*-
+import time
+
+import pytest
+
+from slackbot_cloudgenix import metrics
+from slackbot_cloudgenix.metrics import (metrics_window, cached_series_by_path, fetch_series_incremental,
+                                         epoch_to_metrics_time, APPRT_METRICS, split_metrics_window,
+                                         named_metrics_window, metrics_interval, METRICS_WINDOWS,
+                                         METRICS_WINDOW_ALIASES, bandwidth_site_paths_batch)
+
+
+def path_response(path_ids, name='AppRoundTripTime'):
+    """
+    metrics_monitor style response content, one series per path.
+    """
+    return {'metrics': [{'series': [{'name': name, 'view': {'path': path_id}, 'data': [{'datapoints': []}]}
+                                    for path_id in path_ids]}]}
+
+
+def bucket_response(value, names=None):
+    """
+    Build a fetch_series_incremental query answering every bucket of the fetch window with `value`. Paths not in
+    names get no series at all.
+    """
+    def response(path_ids, window):
+        datapoints = [{'time': epoch_to_metrics_time(epoch), 'value': value}
+                      for epoch in range(window.start_epoch, window.end_epoch, window.step)]
+        return {'metrics': [{'series': [{'name': spec.name, 'view': {'path': path_id},
+                                         'data': [{'datapoints': datapoints}]}
+                                        for path_id in path_ids if names is None or path_id in names
+                                        for spec in APPRT_METRICS]}]}
+    return response
+
+
+class FakeQuery(object):
+    """
+    Records the calls a metrics helper makes, and answers each with `response(*args)`.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self.calls = []
+
+    def __call__(self, *args):
+        self.calls.append(args)
+        return self.response(*args)
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics_caches():
+    metrics.metrics_cache.clear()
+    for series_store in metrics.series_stores.values():
+        series_store.clear()
+    yield
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Pin time.time() (cache expiry checks) to clock.now.
+    """
+    class Clock(object):
+        now = 1000000000.0
+
+    monkeypatch.setattr(time, 'time', lambda: Clock.now)
+    return Clock
+
+
+def test_metrics_window_snaps_to_closed_bucket():
+    window = metrics_window(hours=24, now=1000000123)
+
+    assert window.end_epoch == 999999900
+    assert window.start_epoch == window.end_epoch - 24 * 3600
+    assert (window.interval, window.step) == ('5min', 300)
+    assert window.end_time == '2001-09-09T01:45:00.000000Z'
+    # same bucket, same window (and cache keys).
+    assert metrics_window(hours=24, now=1000000199) == window
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("Branch 1 for 7d", ("Branch 1", "7d")),
+    ("Branch 1 FOR 7D", ("Branch 1", "7d")),
+    ("Branch 1 for 7 d", ("Branch 1", "7d")),
+    ("Branch 1 over the last week", ("Branch 1", "7d")),
+    ("Branch 1 in the past month", ("Branch 1", "30d")),
+    ("Branch 1 last 1h", ("Branch 1", "1h")),
+    ("Branch 1 24h", ("Branch 1", "24h")),
+    ("Branch 1", ("Branch 1", None)),
+    ("Branch one", ("Branch one", None)),
+    ("Branch 1 for 5y", ("Branch 1 for 5y", None)),
+    ("7d", ("7d", None)),
+])
+def test_split_metrics_window(text, expected):
+    assert split_metrics_window(text) == expected
+
+
+def test_split_metrics_window_aliases_and_names():
+    for window_name in METRICS_WINDOWS:
+        assert split_metrics_window("Branch 1 for " + window_name) == ("Branch 1", window_name)
+    for alias, window_name in METRICS_WINDOW_ALIASES.items():
+        assert window_name in METRICS_WINDOWS
+        assert split_metrics_window("Branch 1 for " + alias) == ("Branch 1", window_name)
+
+
+def test_metrics_interval():
+    assert [metrics_interval(hours) for hours in (1, 24, 25, 168, 169, 720, 2000)] == \
+        ['5min', '5min', '1hour', '1hour', '1day', '1day', '1day']
+
+
+def test_named_metrics_window():
+    assert named_metrics_window(now=1000000123) == metrics_window(24, now=1000000123)
+    window = named_metrics_window('7d', now=1000000123)
+    assert (window.interval, window.step) == ('1hour', 3600)
+    assert window.end_epoch - window.start_epoch == 168 * 3600
+    assert window.end_epoch % 3600 == 0
+
+
+def test_cached_series_by_path_queries_only_missing_paths(clock):
+    window = metrics_window()
+    query = FakeQuery(path_response)
+
+    first = cached_series_by_path('apprt', 'app', 'site', ['p1', 'p2'], None, window, query)
+    assert query.calls == [(['p1', 'p2'],)]
+    assert sorted(first) == ['p1', 'p2']
+
+    second = cached_series_by_path('apprt', 'app', 'site', ['p1', 'p2', 'p3'], None, window, query)
+    assert query.calls[1:] == [(['p3'],)]
+    assert second['p1'] == first['p1']
+
+    # next bucket, the cached entries have expired.
+    clock.now = window.end_epoch + window.step
+    next_window = metrics_window()
+    cached_series_by_path('apprt', 'app', 'site', ['p1'], None, next_window, query)
+    assert query.calls[2:] == [(['p1'],)]
+
+
+def test_cached_series_by_path_does_not_cache_failures(clock):
+    window = metrics_window()
+    failing = FakeQuery(lambda path_ids: None)
+
+    assert cached_series_by_path('apprt', 'app', 'site', ['p1'], None, window, failing) is None
+
+    query = FakeQuery(path_response)
+    assert list(cached_series_by_path('apprt', 'app', 'site', ['p1'], None, window, query)) == ['p1']
+    assert query.calls == [(['p1'],)]
+
+
+def fetch_start_epochs(query):
+    return [(path_ids, window.start_epoch) for path_ids, window in query.calls]
+
+
+def test_fetch_series_incremental_refetches_newest_bucket():
+    window = metrics_window(hours=1, now=1000000123)
+    query = FakeQuery(bucket_response(1.0))
+
+    result = fetch_series_incremental(APPRT_METRICS, None, 'app', 'site', ['p1'], window, query)
+    assert fetch_start_epochs(query) == [(['p1'], window.start_epoch)]
+    series_list = result['metrics'][0]['series']
+    assert [series['name'] for series in series_list] == [spec.name for spec in APPRT_METRICS]
+    assert list(series_list[0]['values']) == [1.0] * 12
+
+    # same window again: only the newest bucket is fetched, and its new value replaces the stored one.
+    query.response = bucket_response(2.0)
+    result = fetch_series_incremental(APPRT_METRICS, None, 'app', 'site', ['p1'], window, query)
+    assert fetch_start_epochs(query)[1:] == [(['p1'], window.end_epoch - window.step)]
+    assert query.calls[1][1].end_epoch == window.end_epoch
+    assert list(result['metrics'][0]['series'][0]['values']) == [1.0] * 11 + [2.0]
+
+    # next bucket: resume from the previous newest bucket.
+    next_window = metrics_window(hours=1, now=1000000123 + window.step)
+    result = fetch_series_incremental(APPRT_METRICS, None, 'app', 'site', ['p1'], next_window, query)
+    assert fetch_start_epochs(query)[2:] == [(['p1'], window.end_epoch - window.step)]
+    assert list(result['metrics'][0]['series'][0]['values']) == [1.0] * 10 + [2.0] * 2
+
+
+def test_fetch_series_incremental_records_paths_without_series():
+    window = metrics_window(hours=1, now=1000000123)
+    query = FakeQuery(bucket_response(1.0, names=['p1']))
+
+    result = fetch_series_incremental(APPRT_METRICS, None, 'app', 'site', ['p1', 'p2'], window, query)
+    assert fetch_start_epochs(query) == [(['p1', 'p2'], window.start_epoch)]
+    assert all(not len(series['values']) for series in result['metrics'][0]['series']
+               if series['view']['path'] == 'p2')
+
+    # p2 had no series, but resumes with p1 instead of fetching the whole window again.
+    fetch_series_incremental(APPRT_METRICS, None, 'app', 'site', ['p1', 'p2'], window, query)
+    assert fetch_start_epochs(query)[1:] == [(['p1', 'p2'], window.end_epoch - window.step)]
+
+
+def test_fetch_series_incremental_failure_returns_none():
+    window = metrics_window(hours=1, now=1000000123)
+    query = FakeQuery(lambda path_ids, query_window: None)
+
+    assert fetch_series_incremental(APPRT_METRICS, None, 'app', 'site', ['p1'], window, query) is None
+    # nothing recorded, the next fetch starts over.
+    query.response = bucket_response(1.0)
+    fetch_series_incremental(APPRT_METRICS, None, 'app', 'site', ['p1'], window, query)
+    assert fetch_start_epochs(query)[1:] == [(['p1'], window.start_epoch)]
+
+
+def test_bandwidth_batch_matches_usage_and_capacity_by_bucket(monkeypatch):
+    window = metrics_window(hours=1, now=1000000123)
+    bucket_epochs = list(range(window.start_epoch, window.end_epoch, window.step))
+
+    def response(sdk, metrics_query, counter=None):
+        usage = [{'time': epoch_to_metrics_time(epoch), 'value': index + 1.0}
+                 for index, epoch in enumerate(bucket_epochs)]
+        # capacity is missing a bucket in the middle, and halves after it.
+        capacity = [{'time': epoch_to_metrics_time(epoch), 'value': 100.0 if index < 6 else 50.0}
+                    for index, epoch in enumerate(bucket_epochs) if index != 5]
+        return {'metrics': [{'series': [
+            {'name': 'BandwidthUsage', 'view': {'path': 'p1'}, 'data': [{'datapoints': usage}]},
+            {'name': 'PathCapacity', 'view': {'path': 'p1'}, 'data': [{'datapoints': capacity}]}]}]}
+
+    monkeypatch.setattr(metrics, 'query_metrics', response)
+
+    stats = bandwidth_site_paths_batch('site', ['p1'], 'Ingress', None, window)['p1']
+
+    # 1% to 5%, then 14% to 24%. Paired by position, every bucket from the gap on would use the next bucket's
+    # capacity (12% to 22%), and the last usage bucket none.
+    assert stats.util_max == pytest.approx(24.0)
+    assert stats.util_p50 == pytest.approx(14.0)
+    assert stats.usage_avg == pytest.approx(6.5)
+    assert stats.capacity == 100.0
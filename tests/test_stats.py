@@ -0,0 +1,105 @@
+# -*- coding: UTF-8 -*-
+import math
+import random
+
+import pytest
+
+from slackbot_cloudgenix.stats import summarize, bandwidth_stats, align_series, SeriesStats
+
+
+def assert_stats_equal(actual, expected):
+    assert len(actual) == len(expected)
+    for actual_value, expected_value in zip(actual, expected):
+        if math.isnan(expected_value):
+            assert math.isnan(actual_value)
+        else:
+            assert actual_value == pytest.approx(expected_value, rel=1e-12, abs=1e-12)
+
+
+def test_summarize_known_values():
+    stats = summarize([1, None, 2, 3, float('nan'), 4])
+
+    assert stats.count == 4
+    assert stats.mean == 2.5
+    # sample std (ddof=1), as pandas.
+    assert stats.std == pytest.approx(1.2909944487358056)
+    # linear interpolation, as pandas quantile(0.95).
+    assert stats.p95 == pytest.approx(3.85)
+    assert (stats.max, stats.min) == (4, 1)
+
+
+def test_summarize_scale_single_point_and_empty():
+    assert_stats_equal(summarize([2.5], scale=1024), SeriesStats(1, 2560, float('nan'), 2560, 2560, 2560))
+    assert_stats_equal(summarize([None, None]), SeriesStats(0, *[float('nan')] * 5))
+    assert_stats_equal(summarize([]), SeriesStats(0, *[float('nan')] * 5))
+
+
+def test_summarize_matches_pandas():
+    pd = pytest.importorskip('pandas')
+    rng = random.Random(10)
+    for points in [1, 2, 3, 10, 288]:
+        for none_fraction in [0, 0.3, 1]:
+            values = [None if rng.random() < none_fraction else rng.random() * 100 for _ in range(points)]
+            series = pd.Series(values, dtype='float64')
+            expected = (series.count(), series.mean(), series.std(), series.quantile(0.95), series.max(),
+                        series.min())
+            assert_stats_equal(summarize(values), expected)
+
+
+def test_bandwidth_stats():
+    usage = [[1.0, 2.0, None, 4.0], [5.0], []]
+    capacity = [[10.0, 10.0, 10.0, 0.0], [20.0, 20.0], []]
+
+    first, second, empty = bandwidth_stats(usage, capacity)
+
+    assert first.usage_avg == pytest.approx(7.0 / 3)
+    assert first.capacity == 10.0
+    # the zero capacity bucket and the bucket without usage are skipped.
+    assert first.util_max == pytest.approx(20.0)
+    assert first.util_p50 == pytest.approx(15.0)
+    assert (second.usage_avg, second.util_max) == (5.0, 25.0)
+    assert all(math.isnan(value) for value in empty)
+    assert bandwidth_stats([], []) == []
+
+
+def test_bandwidth_stats_matches_pandas():
+    pd = pytest.importorskip('pandas')
+    rng = random.Random(15)
+    usage_rows, capacity_rows = [], []
+    for points in [0, 1, 2, 12, 288]:
+        for none_fraction in [0, 0.3, 1]:
+            usage_rows.append([None if rng.random() < none_fraction else rng.random() * 100 for _ in range(points)])
+            capacity_rows.append([rng.choice([None, 0.0, 50.0, 100.0]) for _ in range(rng.randint(0, points))])
+
+    for stats, usage_values, capacity_values in zip(bandwidth_stats(usage_rows, capacity_rows), usage_rows,
+                                                    capacity_rows):
+        usage = pd.Series(usage_values, dtype='float64')
+        capacity = pd.Series(capacity_values, dtype='float64').reindex(usage.index)
+        capacity = capacity.where(capacity > 0)
+        utilization = usage / capacity * 100
+        expected = (usage.mean(), usage.quantile(0.95), capacity.max(), utilization.quantile(0.5),
+                    utilization.quantile(0.95), utilization.max())
+        assert_stats_equal(stats, expected)
+
+
+def test_bandwidth_stats_matches_buckets_by_time():
+    # capacity is missing the 300 bucket, and has one (900) usage doesn't.
+    usage = [[1.0, 2.0, 3.0]]
+    usage_times = [[0, 300, 600]]
+    capacity = [[10.0, 20.0, 5.0]]
+    capacity_times = [[0, 600, 900]]
+
+    stats, = bandwidth_stats(usage, capacity, usage_times=usage_times, capacity_times=capacity_times)
+
+    # 1/10 and 3/20, the 300 bucket has no capacity to compare with.
+    assert stats.util_max == pytest.approx(15.0)
+    assert stats.util_p50 == pytest.approx(12.5)
+    assert stats.usage_avg == pytest.approx(2.0)
+    assert stats.capacity == 20.0
+
+
+def test_align_series():
+    usage, capacity = align_series([0, 300, None, 600], [1.0, None, 9.0, 3.0], [600, 0], [20.0, 10.0])
+
+    assert_stats_equal(usage, [1.0, float('nan'), 3.0])
+    assert_stats_equal(capacity, [10.0, float('nan'), 20.0])
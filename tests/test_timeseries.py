@@ -0,0 +1,80 @@
+# -*- coding: UTF-8 -*-
+import time
+
+import numpy as np
+
+from slackbot_cloudgenix.timeseries import RingBuffer, SeriesStore, parse_metrics_time
+
+
+def datapoint(epoch, value):
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(epoch)), 'value': value}
+
+
+def test_parse_metrics_time():
+    assert parse_metrics_time('2016-11-18T17:20:00.000Z') == 1479489600
+    assert parse_metrics_time('not a time') is None
+    assert parse_metrics_time(None) is None
+
+
+def test_ring_buffer_overwrites_oldest():
+    buffer = RingBuffer(capacity=3)
+    assert buffer.last_time is None
+    assert list(buffer.window(0, 100)) == []
+
+    for point_time in (10, 20, 30, 40):
+        buffer.append(point_time, point_time / 10.0)
+
+    assert buffer.last_time == 40
+    assert list(buffer.window(0, 100)) == [2.0, 3.0, 4.0]
+    assert list(buffer.window(20, 40)) == [2.0, 3.0]
+
+
+def test_ring_buffer_replaces_newest_and_ignores_older():
+    buffer = RingBuffer(capacity=4)
+    buffer.append(10, 1.0)
+    buffer.append(20, None)
+    buffer.append(20, 2.0)
+    buffer.append(15, 9.0)
+
+    assert buffer.size == 2
+    assert list(buffer.window(0, 100)) == [1.0, 2.0]
+
+    buffer.append(30, None)
+    assert np.isnan(buffer.window(30, 31)[0])
+
+
+def test_series_store_extend_and_window():
+    store = SeriesStore(capacity=10)
+    assert store.last_time('a') is None
+    assert store.window('a', 0, 1000) is None
+
+    store.extend('a', [datapoint(300, 1.0), datapoint(600, 2.0), {'time': 'bad', 'value': 5.0}])
+    assert store.last_time('a') == 600
+    assert list(store.window('a', 0, 600)) == [1.0]
+
+
+def test_series_store_records_fetch_without_points():
+    store = SeriesStore(capacity=10)
+
+    store.extend('a', [], fetched_time=900)
+    assert store.last_time('a') == 900
+    assert list(store.window('a', 0, 1000)) == []
+
+    # points past the fetched time move last_time on, an older fetched time never moves it back.
+    store.extend('a', [datapoint(1200, 1.0)], fetched_time=600)
+    assert store.last_time('a') == 1200
+
+
+def test_series_store_evicts_least_recently_used():
+    store = SeriesStore(capacity=10, maxsize=2)
+    store.extend('a', [datapoint(300, 1.0)])
+    store.extend('b', [datapoint(300, 2.0)])
+    store.window('a', 0, 1000)
+    store.extend('c', [datapoint(300, 3.0)])
+
+    assert store.last_time('b') is None
+    assert store.last_time('a') == 300
+    assert store.last_time('c') == 300
+
+    store.clear()
+    assert store.last_time('a') is None
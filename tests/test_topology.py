@@ -0,0 +1,198 @@
+# -*- coding: UTF-8 -*-
+import time
+
+import pytest
+
+from slackbot_cloudgenix import topology
+from slackbot_cloudgenix.graph import TopologyGraph
+from slackbot_cloudgenix.topology import TopologyCache, render_fleet_status
+
+
+class FakeResponse(object):
+    def __init__(self, links):
+        self.cgx_status = links is not None
+        self.cgx_content = {'links': links} if links is not None else {}
+
+
+class FakePost(object):
+    """
+    sdk.post.topology stand-in. Answers with `links(site_id)` (None for a failed query), and counts queries.
+    """
+
+    def __init__(self, links):
+        self.links = links
+        self.queries = []
+
+    def topology(self, query):
+        site_id = query['nodes'][0]
+        self.queries.append(site_id)
+        return FakeResponse(self.links(site_id))
+
+
+class FakeSdk(object):
+    def __init__(self, links=lambda site_id: [{'id': site_id + '-link'}]):
+        self.post = FakePost(links)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Pin time.time() (cache expiry and invalidation times) to clock.now.
+    """
+    class Clock(object):
+        now = 1000000000.0
+
+    monkeypatch.setattr(time, 'time', lambda: Clock.now)
+    return Clock
+
+
+def test_topology_cache_reuses_links_for_ttl(clock):
+    cache = TopologyCache(ttl=60)
+    sdk = FakeSdk()
+
+    links = cache.get_links('site1', sdk)
+    assert links == [{'id': 'site1-link'}]
+    assert cache.get_links('site1', sdk) is links
+    cache.get_links('site2', sdk)
+    assert sdk.post.queries == ['site1', 'site2']
+
+    clock.now += 60
+    cache.get_links('site1', sdk)
+    assert sdk.post.queries[2:] == ['site1']
+
+
+def test_topology_cache_ttl_zero_disables_caching(clock):
+    cache = TopologyCache(ttl=0)
+    sdk = FakeSdk()
+
+    cache.get_links('site1', sdk)
+    cache.get_links('site1', sdk)
+    assert sdk.post.queries == ['site1', 'site1']
+
+
+def test_topology_cache_does_not_cache_failures(clock):
+    cache = TopologyCache(ttl=60)
+    failing = FakeSdk(lambda site_id: None)
+
+    assert cache.get_links('site1', failing) is None
+    assert cache.get_links('site1', failing) is None
+    assert failing.post.queries == ['site1', 'site1']
+
+    sdk = FakeSdk()
+    assert cache.get_links('site1', sdk) == [{'id': 'site1-link'}]
+
+
+def test_topology_cache_invalidate_and_clear(clock):
+    cache = TopologyCache(ttl=60)
+    sdk = FakeSdk()
+
+    cache.get_links('site1', sdk)
+    cache.get_links('site2', sdk)
+    assert cache.invalidate('site1')
+    assert not cache.invalidate('site1')
+    cache.get_links('site1', sdk)
+    cache.get_links('site2', sdk)
+    assert sdk.post.queries == ['site1', 'site2', 'site1']
+
+    clock.now += 1
+    cache.clear()
+    cache.get_links('site1', sdk)
+    cache.get_links('site2', sdk)
+    assert sdk.post.queries[3:] == ['site1', 'site2']
+
+
+def test_topology_cache_invalidate_during_query_is_not_overwritten(clock):
+    cache = TopologyCache(ttl=60)
+
+    def links(site_id):
+        # the site changes (and is invalidated) while its query is running.
+        clock.now += 1
+        cache.invalidate(site_id)
+        return [{'id': 'old'}]
+
+    assert cache.get_links('site1', FakeSdk(links)) == [{'id': 'old'}]
+
+    sdk = FakeSdk()
+    assert cache.get_links('site1', sdk) == [{'id': 'site1-link'}]
+    assert sdk.post.queries == ['site1']
+
+
+def test_topology_cache_refresh_links_queries_and_caches(clock):
+    cache = TopologyCache(ttl=60)
+    sdk = FakeSdk()
+
+    cache.get_links('site1', sdk)
+    sdk.post.links = lambda site_id: [{'id': 'new'}]
+    assert cache.refresh_links('site1', sdk) == [{'id': 'new'}]
+    assert cache.get_links('site1', sdk) == [{'id': 'new'}]
+    assert sdk.post.queries == ['site1', 'site1']
+
+
+def make_graph(site_ids, created, status='up'):
+    sites = [{'id': site_id, 'name': site_id} for site_id in site_ids]
+    links = [{'type': 'internet-stub', 'source_node_id': site_id, 'network': 'ISP', 'path_id': site_id + '-path',
+              'status': status} for site_id in site_ids]
+    return TopologyGraph(sites, links, created=created)
+
+
+def test_topology_cache_uses_graph_for_sites_only_within_ttl(clock):
+    cache = TopologyCache(ttl=60)
+    sdk = FakeSdk()
+    cache.publish_graph(make_graph(['site1'], created=clock.now), max_age=600)
+
+    assert cache.get_links('site1', sdk)[0]['network'] == 'ISP'
+    # not in the graph.
+    cache.get_links('site2', sdk)
+    assert sdk.post.queries == ['site2']
+
+    # older than the per-site TTL, though within the graph max age.
+    clock.now += 61
+    assert cache.get_links('site1', sdk) == [{'id': 'site1-link'}]
+    assert sdk.post.queries[1:] == ['site1']
+    assert cache.fresh_graph() is cache.graph
+
+
+def test_topology_cache_ignores_graph_older_than_invalidation(clock):
+    cache = TopologyCache(ttl=60)
+    sdk = FakeSdk()
+    graph = make_graph(['site1'], created=clock.now - 1)
+    cache.publish_graph(graph, max_age=600)
+
+    cache.invalidate('site1')
+    assert cache.graph_links(graph, 'site1') is None
+    assert cache.get_links('site1', sdk) == [{'id': 'site1-link'}]
+
+    clock.now += 700
+    assert cache.fresh_graph() is None
+
+
+def test_fleet_status_uses_graph_and_shows_its_age(clock, monkeypatch):
+    cache = TopologyCache(ttl=60)
+    monkeypatch.setattr(topology, 'topology_cache', cache)
+    sdk = FakeSdk(lambda site_id: [{'type': 'internet-stub', 'source_node_id': site_id, 'status': 'up'}])
+    cache.publish_graph(make_graph(['site1'], created=clock.now, status='down'), max_age=600)
+    clock.now += 120
+
+    attachments = render_fleet_status(['site1', 'site2'], sdk, {'site1': 'Site One'})
+
+    assert sdk.post.queries == ['site2']
+    assert attachments[0]['pretext'] == "*1 of 2 sites degraded*"
+    assert "*Internet*: 1 up, 1 down\n" in attachments[0]['text']
+    assert "_1 site(s) as of 120s ago._" in attachments[0]['text']
+    assert attachments[1]['text'].startswith("*Site One*")
+
+
+def test_render_topology_marks_only_anynet_links_as_markdown(monkeypatch):
+    monkeypatch.setattr(topology, 'topology_cache', TopologyCache(ttl=0))
+    links = [
+        {'type': 'internet-stub', 'network': 'ISP', 'path_id': 'p1', 'status': 'up'},
+        {'type': 'public-anynet', 'source_node_id': 'site1', 'target_node_id': 'site2', 'source_wan_network': 'ISP',
+         'target_wan_network': 'ISP 2', 'vpnlinks': [], 'status': 'down'},
+    ]
+    sdk = FakeSdk(lambda site_id: links)
+
+    stub, anynet = topology.render_topology('site1', sdk, {'site1': 'Site 1', 'site2': 'Site 2'})
+
+    assert stub == {'text': 'ISP', 'color': 'good', 'pretext': "*Internet*", 'mrkdwn_in': ["pretext", "text"]}
+    assert anynet == {'text': "Site 1 ⇔ Site 2", 'color': 'danger', 'pretext': "*AppFabric over Internet*",
+                      'mrkdwn': True, 'mrkdwn_in': ["pretext", "text"]}
@@ -0,0 +1,198 @@
+# -*- coding: UTF-8 -*-
+import json
+import os
+
+from slackbot_cloudgenix import watcher
+from slackbot_cloudgenix.graph import TopologyGraph
+from slackbot_cloudgenix.topology import TopologyCache
+from slackbot_cloudgenix.watcher import (diff_link_statuses, site_link_statuses, render_changes, TopologyWatcher,
+                                         LinkChange, WatchScheduler, save_watch_subscriptions,
+                                         load_watch_subscriptions)
+
+
+def stub(link_id, site_id, status='up', network='ISP', network_id='wn1'):
+    # as the topology API returns them: the WAN network is the source, the site the target.
+    return {'path_id': link_id, 'type': 'internet-stub', 'source_node_id': network_id, 'target_node_id': site_id,
+            'network': network, 'status': status}
+
+
+def anynet(link_id, source_id, target_id, status='up'):
+    return {'id': link_id, 'type': 'anynet', 'source_node_id': source_id, 'target_node_id': target_id,
+            'status': status}
+
+
+class FakeResponse(object):
+    def __init__(self, links):
+        self.cgx_status = True
+        self.cgx_content = {'links': links}
+
+
+class FakeTopologyPost(object):
+    def __init__(self, links):
+        self.links = links
+
+    def topology(self, query):
+        return FakeResponse(self.links)
+
+
+class FakeSdk(object):
+    def __init__(self, links):
+        self.post = FakeTopologyPost(links)
+
+
+class FakePost(object):
+    def __init__(self, fail_channels=()):
+        self.fail_channels = fail_channels
+        self.posts = []
+
+    def __call__(self, channel, text, attachments):
+        if channel in self.fail_channels:
+            raise IOError("post failed")
+        self.posts.append((channel, text, attachments))
+
+
+def test_site_link_statuses_only_shown_links():
+    statuses = site_link_statuses([stub('p1', 'site1', status='Down'), anynet('a1', 'site1', 'site2', status=None),
+                                   {'id': 'v1', 'type': 'vpn', 'status': 'up'}])
+
+    assert dict((key, status) for key, (status, _) in statuses.items()) == {'p1': 'down', 'a1': 'unknown'}
+
+
+def test_diff_link_statuses():
+    old = site_link_statuses([stub('p1', 'site1'), stub('p2', 'site1'), anynet('a1', 'site1', 'site2')])
+    new = site_link_statuses([stub('p1', 'site1', status='down'), anynet('a1', 'site1', 'site2'),
+                              stub('p3', 'site2')])
+
+    changes = diff_link_statuses(old, new)
+
+    assert [(change.key, change.old_status, change.new_status) for change in changes] == \
+        [('p1', 'up', 'down'), ('p3', None, 'up'), ('p2', 'up', None)]
+    assert changes[0].link['status'] == 'down'
+    assert diff_link_statuses(new, new) == []
+    assert diff_link_statuses({}, {}) == []
+
+
+def test_render_changes_down_first_and_capped():
+    changes = [LinkChange('p1', stub('p1', 'site1'), 'down', 'up'),
+               LinkChange('a1', anynet('a1', 'site1', 'site2'), 'up', 'down'),
+               LinkChange('p2', stub('p2', 'site2'), None, 'up')]
+    id2n = {'site1': 'Site One', 'site2': 'Site Two', 'wn1': 'ISP Network'}
+
+    attachments = render_changes(changes, id2n)
+
+    assert [attachment['text'] for attachment in attachments] == [
+        "Site One ⇔ Site Two (AppFabric over Internet): up → down",
+        "Site One ISP (Internet): down → up",
+        "Site Two ISP (Internet): new → up",
+    ]
+    assert [attachment['color'] for attachment in attachments] == ['danger', 'good', 'good']
+
+    capped = render_changes(changes, id2n, max_changes=1)
+    assert len(capped) == 2
+    assert capped[1]['text'] == "..and 2 more."
+
+
+def test_render_changes_finds_the_site_end_of_stub_links():
+    id2n = {'site1': 'Site One', 'wn1': 'ISP Network'}
+    reversed_stub = dict(stub('p1', 'wn1'), source_node_id='site1')
+    changes = [LinkChange('p1', reversed_stub, 'up', 'down')]
+
+    assert render_changes(changes, id2n, site_ids={'site1'})[0]['text'] == "Site One ISP (Internet): up → down"
+    # without known sites, the target is taken as the site.
+    assert render_changes(changes, id2n)[0]['text'] == "ISP Network ISP (Internet): up → down"
+
+
+def test_topology_watcher_posts_changes_to_subscribers():
+    post = FakePost(fail_channels=['#broken'])
+    watcher = TopologyWatcher(post, id2n=lambda: {'site1': 'Site One', 'wn1': 'ISP Network'})
+    watcher.subscribe('#all')
+    watcher.subscribe('#site2', ['site2'])
+    watcher.subscribe('#broken')
+    sites = [{'id': 'site1'}, {'id': 'site2'}]
+
+    # the first graph is the baseline.
+    assert watcher.update(TopologyGraph(sites, [stub('p1', 'site1'), stub('p2', 'site2')])) == []
+    assert post.posts == []
+
+    changes = watcher.update(TopologyGraph(sites, [stub('p1', 'site1', status='down'), stub('p2', 'site2')]))
+    assert [change.key for change in changes] == ['p1']
+    assert [(channel, text) for channel, text, _ in post.posts] == [('#all', "*Topology changes (1):*")]
+    assert post.posts[0][2][0]['text'] == "Site One ISP (Internet): up → down"
+
+    # no change, nothing posted.
+    watcher.update(TopologyGraph(sites, [stub('p1', 'site1', status='down'), stub('p2', 'site2')]))
+    watcher.update(TopologyGraph(sites, [stub('p1', 'site1', status='down')]))
+    assert [channel for channel, _, _ in post.posts] == ['#all', '#all', '#site2']
+
+
+def test_watch_subscriptions_round_trip(tmp_path):
+    filename = str(tmp_path / 'watch.json')
+    scheduler = WatchScheduler(lambda: None, FakePost(), filename=filename)
+
+    assert scheduler.watch('C1', 'site1')
+    assert not scheduler.watch('C1', 'site1')
+    assert scheduler.watch('C2', 'site1')
+    assert scheduler.watch('C1', 'site2')
+    assert load_watch_subscriptions(filename) == {'site1': {'C1', 'C2'}, 'site2': {'C1'}}
+
+    assert scheduler.unwatch('C1', 'site2')
+    assert not scheduler.unwatch('C1', 'site2')
+    assert scheduler.unwatch('C2', 'site1')
+
+    reloaded = WatchScheduler(lambda: None, FakePost(), filename=filename)
+    assert reloaded.subscriptions == {'site1': {'C1'}}
+    assert reloaded.channel_sites('C1') == ['site1']
+    assert reloaded.channel_sites('C2') == []
+    assert os.listdir(str(tmp_path)) == ['watch.json']
+
+
+def test_load_watch_subscriptions_ignores_unusable_files(tmp_path):
+    filename = str(tmp_path / 'watch.json')
+    assert load_watch_subscriptions(filename) == {}
+
+    with open(filename, 'w') as subscriptions_file:
+        subscriptions_file.write('{not json')
+    assert load_watch_subscriptions(filename) == {}
+
+    with open(filename, 'w') as subscriptions_file:
+        json.dump({'version': 0, 'subscriptions': {'site1': ['C1']}}, subscriptions_file)
+    assert load_watch_subscriptions(filename) == {}
+
+
+def test_save_watch_subscriptions_failure_leaves_no_temp_file(tmp_path, monkeypatch):
+    filename = str(tmp_path / 'watch.json')
+    assert save_watch_subscriptions(filename, {'site1': {'C1'}})
+
+    def failing_dump(data, output_file):
+        output_file.write('{')
+        raise IOError("disk full")
+
+    monkeypatch.setattr(json, 'dump', failing_dump)
+    assert not save_watch_subscriptions(filename, {'site2': {'C1'}})
+    monkeypatch.undo()
+
+    assert os.listdir(str(tmp_path)) == ['watch.json']
+    assert load_watch_subscriptions(filename) == {'site1': {'C1'}}
+
+
+def test_watch_scheduler_poll_posts_changes(monkeypatch):
+    monkeypatch.setattr(watcher, 'topology_cache', TopologyCache(ttl=0))
+    post = FakePost()
+    sdk = FakeSdk([stub('p1', 'site1')])
+    scheduler = WatchScheduler(lambda: sdk, post, id2n=lambda: {'site1': 'Site One'})
+    scheduler.watch('C1', 'site1')
+    scheduler.watch('C2', 'site1')
+
+    # the first poll is the baseline.
+    assert scheduler.poll('site1') == []
+    sdk.post.links = [stub('p1', 'site1', status='down')]
+    assert [change.key for change in scheduler.poll('site1')] == ['p1']
+    assert [(channel, text) for channel, text, _ in post.posts] == \
+        [('C1', "*Topology changes at Site One (1):*"), ('C2', "*Topology changes at Site One (1):*")]
+
+    # unwatched sites aren't posted.
+    scheduler.unwatch('C1', 'site1')
+    scheduler.unwatch('C2', 'site1')
+    sdk.post.links = [stub('p1', 'site1')]
+    assert scheduler.poll('site1') == []
+    assert len(post.posts) == 2